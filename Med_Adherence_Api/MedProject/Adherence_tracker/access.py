@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Q
+from .models import DoctorProfile
+
+Assignment = DoctorProfile.patients.through
+
+
+def _cache_key(doctor_user_id):
+    return f"assigned-patients:{doctor_user_id}"
+
+
+def _cache_between_requests():
+    # these ids gate access: a per-process cache would keep serving a revoked
+    # assignment in every worker but the one whose signal dropped it
+    return settings.ASSIGNMENT_CACHE_TTL > 0 and not isinstance(caches["default"], LocMemCache)
+
+
+def _assignments(user):
+    return Assignment.objects.filter(doctorprofile__user_id=user.id).values_list("patientprofile_id", flat=True)
+
+
+def assigned_patient_ids(user):
+    """
+    PatientProfile ids assigned to a doctor user.
+    Memoised on the user object for the current request and, with a shared
+    cache backend, kept in the cache between requests; signals.py drops the
+    cached set when assignments change.
+    """
+    ids = getattr(user, "_assigned_patient_ids", None)
+    if ids is not None:
+        return ids
+
+    if not _cache_between_requests():
+        ids = frozenset(_assignments(user))
+    else:
+        key = _cache_key(user.id)
+        ids = cache.get(key)
+        if ids is None:
+            ids = frozenset(_assignments(user))
+            cache.set(key, ids, settings.ASSIGNMENT_CACHE_TTL)
+    user._assigned_patient_ids = ids
+    return ids
+
+
+async def aassigned_patient_ids(user):
+    """assigned_patient_ids for async views: same memo and cache entry, async iteration on a miss."""
+    ids = getattr(user, "_assigned_patient_ids", None)
+    if ids is not None:
+        return ids
+
+    if not _cache_between_requests():
+        ids = frozenset([pk async for pk in _assignments(user)])
+    else:
+        key = _cache_key(user.id)
+        ids = await cache.aget(key)
+        if ids is None:
+            ids = frozenset([pk async for pk in _assignments(user)])
+            await cache.aset(key, ids, settings.ASSIGNMENT_CACHE_TTL)
+    user._assigned_patient_ids = ids
+    return ids
+
+
+def own_patient_filter(user, path):
+    """
+    Q selecting a patient user's own rows, `path` being the lookup to their
+    PatientProfile (usually "patient"). Users built from token claims
+    already carry the profile id, which saves the join through to the user table.
+    """
+    if "patient_profile" in user._state.fields_cache:
+        profile = user._state.fields_cache["patient_profile"]
+        return Q(**{f"{path}_id": profile.pk}) if profile else Q(pk__in=[])
+    return Q(**{f"{path}__user_id": user.id})
+
+
+def can_access_patient(user, patient):
+    """Admins see everyone, patients themselves, doctors their assigned patients."""
+    if user.role == "admin":
+        return True
+    if user.role == "patient":
+        return patient.user_id == user.id
+    if user.role == "doctor":
+        return patient.pk in assigned_patient_ids(user)
+    return False
+
+
+def invalidate_assignments(doctor_user_ids):
+    cache.delete_many([_cache_key(uid) for uid in doctor_user_ids])
+
+
+def can_access_patient_id(user, patient_id):
+    """can_access_patient by PatientProfile id, for rows that only carry the id."""
+    if user.role == "admin":
+        return True
+    if user.role == "patient":
+        profile = getattr(user, "patient_profile", None)
+        return profile is not None and profile.pk == patient_id
+    if user.role == "doctor":
+        return patient_id in assigned_patient_ids(user)
+    return False
+
+
+async def acan_access_patient(user, patient):
+    if user.role == "doctor":
+        return patient.pk in await aassigned_patient_ids(user)
+    return can_access_patient(user, patient)
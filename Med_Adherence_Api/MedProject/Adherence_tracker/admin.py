@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from .models import User, PatientProfile, DoctorProfile, MedicationSchedule, Activity, Notification
+from .models import User, PatientProfile, DoctorProfile, MedicationSchedule, Activity, DailyAdherence, Notification, PatientAlertState, Job, SweepState
 
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
@@ -10,4 +10,8 @@ admin.site.register(PatientProfile)
 admin.site.register(DoctorProfile)
 admin.site.register(MedicationSchedule)
 admin.site.register(Activity)
+admin.site.register(DailyAdherence)
 admin.site.register(Notification)
+admin.site.register(PatientAlertState)
+admin.site.register(Job)
+admin.site.register(SweepState)
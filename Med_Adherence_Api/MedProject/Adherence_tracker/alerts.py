@@ -0,0 +1,123 @@
+"""
+Adherence alert rules.
+
+Rules live in settings.ADHERENCE_ALERT_RULES and are evaluated whenever new
+activities are recorded, from counters already at hand: the patient's running
+consecutive-missed counter and the rollup rows of the rule's window. Edits and
+deletes recount that counter from the stored activities. Every
+evaluation writes its notifications with one bulk_create and queues their
+delivery; a rule does not fire again for a patient within its cooldown.
+
+Rule kinds:
+  rate_below          {"days": 7, "threshold": 70, "min_doses": 3}
+  consecutive_missed  {"count": 2}
+Common keys: name, notify (["patient", "doctors"]), cooldown_hours, message.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .jobs import enqueue_many
+from .models import Activity, DailyAdherence, Notification, PatientAlertState, PatientProfile
+from .services import window_start
+
+
+def _cooled_down(state, rule, now):
+    fired = state.last_fired.get(rule["name"])
+    if not fired:
+        return True
+    return now - datetime.fromisoformat(fired) >= timedelta(hours=rule.get("cooldown_hours", 24))
+
+
+def _check(rule, patient_id, state, had_missed):
+    """Return the message context if the rule fires, else None."""
+    if rule["kind"] == "consecutive_missed":
+        if had_missed and state.consecutive_missed >= rule["count"]:
+            return {"count": state.consecutive_missed}
+        return None
+    if rule["kind"] == "rate_below":
+        if not had_missed:
+            return None  # a taken dose cannot lower the rate
+        agg = DailyAdherence.objects.filter(patient_id=patient_id, date__gte=window_start(rule["days"])).aggregate(
+            taken=Sum("taken"), missed=Sum("missed"),
+        )
+        taken, total = agg["taken"] or 0, (agg["taken"] or 0) + (agg["missed"] or 0)
+        if total < rule.get("min_doses", 3):
+            return None
+        rate = taken * 100 / total
+        return {"rate": rate, "days": rule["days"]} if rate < rule["threshold"] else None
+    raise ImproperlyConfigured(f"unknown alert rule kind {rule['kind']!r}")
+
+
+def _consecutive_missed(patient_id):
+    """Missed doses logged after the patient's latest taken one."""
+    activities = Activity.objects.filter(patient_id=patient_id)
+    last_taken = activities.filter(status="taken").order_by("-date_time").values_list("date_time", flat=True).first()
+    missed = activities.filter(status="missed")
+    return (missed.filter(date_time__gt=last_taken) if last_taken else missed).count()
+
+
+def evaluate_alerts(events, recount=False):
+    """
+    `events` are (patient_id, status, date_time) for newly recorded activities.
+    With recount=True they describe edited or deleted activities instead (status
+    None for a delete): the consecutive-missed counter is recomputed from the
+    stored activities rather than advanced. Returns the created notifications.
+    """
+    rules = settings.ADHERENCE_ALERT_RULES
+    by_patient = defaultdict(list)
+    for patient_id, status, when in events:
+        by_patient[patient_id].append((when, status))
+    if not rules or not by_patient:
+        return []
+
+    now = timezone.now()
+    fired = []
+    with transaction.atomic():
+        for patient_id, items in by_patient.items():
+            PatientAlertState.objects.get_or_create(patient_id=patient_id)
+            state = PatientAlertState.objects.select_for_update().get(patient_id=patient_id)
+            if recount:
+                state.consecutive_missed = _consecutive_missed(patient_id)
+            else:
+                for _, status in sorted(items, key=lambda item: item[0]):
+                    state.consecutive_missed = state.consecutive_missed + 1 if status == "missed" else 0
+            had_missed = any(status == "missed" for _, status in items)
+
+            for rule in rules:
+                if not _cooled_down(state, rule, now):
+                    continue
+                context = _check(rule, patient_id, state, had_missed)
+                if context is not None:
+                    state.last_fired[rule["name"]] = now.isoformat()
+                    fired.append((patient_id, rule, context))
+            state.save(update_fields=["consecutive_missed", "last_fired"])
+
+        if not fired:
+            return []
+
+        recipients = defaultdict(lambda: {"patient": None, "doctors": set()})
+        rows = PatientProfile.objects.filter(pk__in={pid for pid, _, _ in fired}).values_list("id", "user_id", "doctors__user_id")
+        for pid, user_id, doctor_user_id in rows:
+            recipients[pid]["patient"] = user_id
+            if doctor_user_id:
+                recipients[pid]["doctors"].add(doctor_user_id)
+
+        notifications = []
+        for pid, rule, context in fired:
+            message = rule["message"].format(**context)
+            targets = []
+            if "patient" in rule.get("notify", ["patient"]):
+                targets.append(recipients[pid]["patient"])
+            if "doctors" in rule.get("notify", ["patient"]):
+                targets.extend(sorted(recipients[pid]["doctors"]))
+            notifications += [
+                Notification(patient_id=pid, recipient_id=user_id, message=message, sent_at=now)
+                for user_id in targets
+            ]
+        notifications = Notification.objects.bulk_create(notifications)
+        enqueue_many("notification.deliver", [{"notification_id": n.pk} for n in notifications])
+    return notifications
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AdherenceTrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Adherence_tracker'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,115 @@
+"""
+JWT authentication without a user-table hit per request.
+
+Tokens issued at login and refresh carry the user's role, username and
+patient/doctor profile ids. ClaimsJWTAuthentication builds the request user
+from those claims: a User instance whose other fields are deferred (loaded
+only if some code reads them) and whose profile relations are pre-filled with
+id-only instances. The token's jti, and whether its user is still active, are
+checked against the revocation store instead of the database. Tokens issued
+without the claims fall back to the regular lookup.
+
+Claims are as fresh as the token: a role or profile change applies from the
+next refresh.
+"""
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from .models import DoctorProfile, PatientProfile, User
+from .revocation import is_revoked, is_user_active, revoke
+
+CLAIMS = ("role", "username", "patient_id", "doctor_id")
+
+
+def user_claims(user_id):
+    """Claims for one user, in one query (None if the user is gone)."""
+    row = (
+        User.objects.filter(pk=user_id)
+        .values("role", "username", "patient_profile__id", "doctor_profile__id")
+        .first()
+    )
+    if row is None:
+        return None
+    return {
+        "role": row["role"],
+        "username": row["username"],
+        "patient_id": row["patient_profile__id"],
+        "doctor_id": row["doctor_profile__id"],
+    }
+
+
+class ClaimsRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.payload.update(user_claims(user.pk) or {})
+        return token
+
+    def check_blacklist(self):
+        # in-memory revocation set instead of a BlacklistedToken query
+        if is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        return revoke(self)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-reads the claims on refresh, so role and profile changes reach the new tokens."""
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        user_id = RefreshToken(attrs["refresh"], verify=False).payload.get(api_settings.USER_ID_CLAIM)
+        claims = user_claims(user_id)
+        if claims:
+            for key, token_class in (("access", AccessToken), ("refresh", RefreshToken)):
+                if key in data:
+                    token = token_class(data[key], verify=False)
+                    token.payload.update(claims)
+                    data[key] = str(token)
+        return data
+
+
+def _stub(model, db, **values):
+    """Instance with only `values` loaded; every other field is deferred."""
+    # from_db takes the values in concrete field order
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    return model.from_db(db, names, [values[name] for name in names])
+
+
+def user_from_claims(token):
+    """The request user for a token whose user ClaimsJWTAuthentication found active."""
+    user_id = User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM])
+    db = router.db_for_read(User)
+    user = _stub(User, db, id=user_id, username=token["username"], role=token["role"], is_active=True)
+    for relation, model, claim in (
+        ("patient_profile", PatientProfile, "patient_id"),
+        ("doctor_profile", DoctorProfile, "doctor_id"),
+    ):
+        profile = None
+        if token.get(claim):
+            profile = _stub(model, db, id=token[claim], user_id=user_id)
+            profile._state.fields_cache["user"] = user
+        # a cached None makes hasattr(user, relation) False without a query
+        user._state.fields_cache[relation] = profile
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if is_revoked(validated_token.get(api_settings.JTI_CLAIM)):
+            raise InvalidToken(_("Token has been revoked"))
+        if not all(claim in validated_token for claim in CLAIMS):
+            return super().get_user(validated_token)
+        if not is_user_active(User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user_from_claims(validated_token)
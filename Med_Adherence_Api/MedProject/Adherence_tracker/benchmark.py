@@ -0,0 +1,354 @@
+"""
+Benchmark harness for the API hot paths.
+
+seed() fills the configured database (SQLite or PostgreSQL via DATABASE_URL) with
+a synthetic clinic: users prefixed "bench_", profiles, doctor assignments,
+schedules and activities, written with bulk_create in batches so millions of
+activities stay cheap, then rebuilds their daily rollup.
+
+run() replays named scenarios against that data, either in-process through
+Django's test client (which also counts SQL queries per request) or over HTTP
+against a running server, and reports per-scenario latency percentiles,
+requests per second and query counts. compare() diffs two such reports.
+Run with DEBUG=False for representative numbers.
+"""
+import json
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from .access import Assignment
+from .authentication import ClaimsRefreshToken
+from .metrics import QueryRecorder
+from .models import Activity, DoctorProfile, MedicationSchedule, PatientProfile, User
+from .serializers import ActivitySerializer, FastReadSerializer
+from .services import rebuild_rollup
+
+PREFIX = "bench_"
+PASSWORD = "bench-Pass-2024!"
+FREQUENCIES = ("once daily", "twice daily", "every 8 hours", "weekly")
+BATCH_SIZE = 10000
+
+
+# ---------- SEEDING ----------
+def reset():
+    """Delete every bench_ user and, through cascades, their data."""
+    users = User.objects.filter(username__startswith=PREFIX)
+    Activity.objects.filter(patient__user__in=users).delete()
+    return users.delete()[0]
+
+
+def seed(patients=100, doctors=10, schedules_per_patient=2, activities_per_schedule=100, days=90,
+         seed_value=0, log=lambda msg: None):
+    rng = random.Random(seed_value)
+    password = make_password(PASSWORD)  # hashed once, shared by every bench user
+
+    names = [f"{PREFIX}patient{i}" for i in range(patients)] + [f"{PREFIX}doctor{i}" for i in range(doctors)]
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [User(username=n, role="patient" if "patient" in n else "doctor", password=password) for n in names]
+            + [User(username=f"{PREFIX}admin", role="admin", password=password)],
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = dict(User.objects.filter(username__startswith=PREFIX).values_list("username", "id"))
+        PatientProfile.objects.bulk_create(
+            [PatientProfile(user_id=user_ids[f"{PREFIX}patient{i}"]) for i in range(patients)], batch_size=BATCH_SIZE,
+        )
+        DoctorProfile.objects.bulk_create(
+            [DoctorProfile(user_id=user_ids[f"{PREFIX}doctor{i}"]) for i in range(doctors)], batch_size=BATCH_SIZE,
+        )
+        patient_ids = list(
+            PatientProfile.objects.filter(user__username__startswith=PREFIX).order_by("id").values_list("id", flat=True)
+        )
+        doctor_ids = list(
+            DoctorProfile.objects.filter(user__username__startswith=PREFIX).order_by("id").values_list("id", flat=True)
+        )
+        if doctor_ids:
+            Assignment.objects.bulk_create([
+                Assignment(doctorprofile_id=doctor_ids[i % len(doctor_ids)], patientprofile_id=pid)
+                for i, pid in enumerate(patient_ids)
+            ], batch_size=BATCH_SIZE)
+
+        today = timezone.localdate()
+        schedules = []
+        for pid in patient_ids:
+            for k in range(schedules_per_patient):
+                schedule = MedicationSchedule(
+                    patient_id=pid, medication_name=f"Med {k}", dosage="5mg", frequency=rng.choice(FREQUENCIES),
+                    start_date=today - timedelta(days=days), end_date=today + timedelta(days=days),
+                )
+                schedule.apply_frequency()
+                schedules.append(schedule)
+        MedicationSchedule.objects.bulk_create(schedules, batch_size=BATCH_SIZE)
+    log(f"{len(names) + 1} users, {len(schedules)} schedules")
+
+    schedule_ids = list(
+        MedicationSchedule.objects.filter(patient_id__in=patient_ids).values_list("id", "patient_id")
+    )
+    now = timezone.now()
+    span = days * 86400
+    batch, written = [], 0
+    for sid, pid in schedule_ids:
+        for _ in range(activities_per_schedule):
+            sys_ = rng.randint(105, 165) if rng.random() < 0.3 else None
+            batch.append(Activity(
+                schedule_id=sid, patient_id=pid,
+                date_time=now - timedelta(seconds=rng.randrange(span)),
+                status="taken" if rng.random() < 0.8 else "missed",
+                blood_pressure_reading=f"{sys_}/{sys_ - 40}" if sys_ else "",
+                systolic=sys_, diastolic=sys_ - 40 if sys_ else None,
+            ))
+            if len(batch) >= BATCH_SIZE:
+                Activity.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+                log(f"{written} activities")
+    if batch:
+        Activity.objects.bulk_create(batch)
+        written += len(batch)
+    rows = rebuild_rollup(patient_ids=patient_ids)
+    log(f"{written} activities, {rows} rollup rows")
+    return {"users": len(names) + 1, "schedules": len(schedule_ids), "activities": written}
+
+
+# ---------- SCENARIOS ----------
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register func(ctx, rng) -> (method, path, body or None, username or None)."""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+@scenario("login")
+def _login(ctx, rng):
+    return "POST", "/api/auth/login/", {"username": rng.choice(ctx["patients"])[0], "password": PASSWORD}, None
+
+
+@scenario("activity_create")
+def _activity_create(ctx, rng):
+    username, _, schedule_ids = rng.choice(ctx["patients"])
+    return "POST", "/api/activities/", {"schedule": rng.choice(schedule_ids), "status": "taken"}, username
+
+
+@scenario("history")
+def _history(ctx, rng):
+    username, pid, _ = rng.choice(ctx["patients"])
+    return "GET", f"/api/patients/{pid}/adherence/history/", None, username
+
+
+@scenario("summary")
+def _summary(ctx, rng):
+    username, pid, _ = rng.choice(ctx["patients"])
+    return "GET", f"/api/patients/{pid}/adherence/summary/?range={rng.choice((7, 30, 90))}d", None, username
+
+
+@scenario("doctor_panel")
+def _doctor_panel(ctx, rng):
+    return "GET", "/api/doctors/me/adherence/?range=30d", None, rng.choice(ctx["doctors"])
+
+
+@scenario("activity_list")
+def _activity_list(ctx, rng):
+    return "GET", "/api/activities/", None, rng.choice(ctx["patients"])[0]
+
+
+def load_context():
+    schedules = {}
+    for pid, sid in MedicationSchedule.objects.filter(
+        patient__user__username__startswith=PREFIX
+    ).values_list("patient_id", "id"):
+        schedules.setdefault(pid, []).append(sid)
+    patients = [
+        (username, pid, schedules.get(pid, []))
+        for pid, username in PatientProfile.objects.filter(user__username__startswith=PREFIX).values_list(
+            "id", "user__username"
+        )
+    ]
+    doctors = list(DoctorProfile.objects.filter(user__username__startswith=PREFIX).values_list("user__username", flat=True))
+    if not patients or not doctors:
+        raise RuntimeError("no benchmark data, run `manage.py seed_benchmark_data` first")
+    return {"patients": [p for p in patients if p[2]], "doctors": doctors}
+
+
+# ---------- TRANSPORTS ----------
+class _Tokens:
+    def __init__(self):
+        self.tokens = {}
+
+    def header(self, username):
+        if username not in self.tokens:
+            self.tokens[username] = str(ClaimsRefreshToken.for_user(User.objects.get(username=username)).access_token)
+        return f"Bearer {self.tokens[username]}"
+
+
+class ClientTransport:
+    """In-process requests through the test client; counts queries on every database."""
+    counts_queries = True
+
+    def __init__(self):
+        self.client = Client()
+        self.tokens = _Tokens()
+
+    def __call__(self, method, path, body, username):
+        extra = {"HTTP_AUTHORIZATION": self.tokens.header(username)} if username else {}
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            start = time.perf_counter()
+            response = self.client.generic(
+                method, path, json.dumps(body) if body is not None else "", content_type="application/json", **extra,
+            )
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, recorder.count
+
+
+class HttpTransport:
+    """Requests to a running server; query counts are not visible from here (see /api/_metrics/)."""
+    counts_queries = False
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.tokens = _Tokens()
+
+    def __call__(self, method, path, body, username):
+        headers = {"Content-Type": "application/json"}
+        if username:
+            headers["Authorization"] = self.tokens.header(username)
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                code = response.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            code = exc.code
+        return code, time.perf_counter() - start, None
+
+
+# ---------- RUNNER ----------
+def _percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def run_scenario(transport, name, ctx, requests=200, warmup=10, concurrency=1, seed_value=0):
+    rng = random.Random(seed_value)
+    func = SCENARIOS[name]
+    for _ in range(warmup):
+        transport(*func(ctx, rng))
+    plan = [func(ctx, rng) for _ in range(requests)]
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda call: transport(*call), plan))
+    else:
+        results = [transport(*call) for call in plan]
+    wall = time.perf_counter() - start
+
+    latencies = [elapsed * 1000 for _, elapsed, _ in results]
+    queries = [q for _, _, q in results if q is not None]
+    errors = sum(1 for code, _, _ in results if code >= 400)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "rps": round(len(results) / wall, 2) if wall else None,
+        "latency_ms": {
+            **{k: round(v, 3) for k, v in _percentiles(latencies).items()},
+            "mean": round(statistics.fmean(latencies), 3) if latencies else None,
+            "max": round(max(latencies), 3) if latencies else None,
+        },
+        "queries": {
+            "mean": round(statistics.fmean(queries), 2),
+            "max": max(queries),
+        } if queries else None,
+    }
+
+
+def run(scenarios=None, base_url=None, requests=200, warmup=10, concurrency=1, seed_value=0):
+    ctx = load_context()
+    transport = HttpTransport(base_url) if base_url else ClientTransport()
+    if not base_url:
+        concurrency = 1  # the test client shares this thread's connection
+    results = {
+        name: run_scenario(transport, name, ctx, requests, warmup, concurrency, seed_value)
+        for name in (scenarios or SCENARIOS)
+    }
+    return {
+        "meta": {
+            "timestamp": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "transport": "http" if base_url else "client",
+            "base_url": base_url,
+            "requests_per_scenario": requests,
+            "concurrency": concurrency,
+            "patients": len(ctx["patients"]),
+            "doctors": len(ctx["doctors"]),
+            "activities": Activity.objects.filter(patient__user__username__startswith=PREFIX).count(),
+        },
+        "scenarios": results,
+    }
+
+
+def serializer_benchmark(rows=10000, repeat=5):
+    """
+    Fetch and render the newest `rows` activities as JSON with ActivitySerializer
+    and with FastReadSerializer; best-of-`repeat` milliseconds for each.
+    """
+    qs = Activity.objects.order_by("-date_time", "-id")[:rows]
+    reader = FastReadSerializer.for_serializer(ActivitySerializer)
+    renderer = JSONRenderer()
+
+    def best(func):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = func()
+            times.append((time.perf_counter() - start) * 1000)
+        return min(times), body
+
+    model_ms, model_body = best(lambda: renderer.render(ActivitySerializer(list(qs), many=True).data))
+    fast_ms, fast_body = best(lambda: renderer.render(reader.many(qs.values(*reader.columns))))
+    return {
+        "rows": qs.count(),
+        "model_serializer_ms": round(model_ms, 2),
+        "fast_read_ms": round(fast_ms, 2),
+        "speedup": round(model_ms / fast_ms, 2) if fast_ms else None,
+        "identical": model_body == fast_body,
+    }
+
+
+def compare(baseline, current, tolerance=0.2):
+    """Regressions of `current` against `baseline`: p95 latency beyond tolerance, or more queries."""
+    regressions = []
+    for name, now in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        old, new = before["latency_ms"]["p95"], now["latency_ms"]["p95"]
+        if old and new > old * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old:.1f} ms -> {new:.1f} ms")
+        if before.get("queries") and now.get("queries") and now["queries"]["max"] > before["queries"]["max"]:
+            regressions.append(f"{name}: max queries {before['queries']['max']} -> {now['queries']['max']}")
+    return regressions
@@ -0,0 +1,40 @@
+import json
+import logging
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def recipient_id(notification):
+    """The user a notification goes to: its recipient, else the patient it is about."""
+    return notification.recipient_id or notification.patient.user_id
+
+
+class BaseDeliveryBackend:
+    """Delivers a batch of Notifications; returns {notification_id: error} for failures."""
+    def send_many(self, notifications):
+        raise NotImplementedError
+
+
+class ConsoleDeliveryBackend(BaseDeliveryBackend):
+    def send_many(self, notifications):
+        for n in notifications:
+            logger.info(
+                "notification %s to user %s (patient %s): %s", n.pk, recipient_id(n), n.patient_id, n.message,
+            )
+        return {}
+
+
+class FileDeliveryBackend(BaseDeliveryBackend):
+    """Appends one JSON line per notification to NOTIFICATION_FILE_PATH."""
+    def send_many(self, notifications):
+        with open(settings.NOTIFICATION_FILE_PATH, "a", encoding="utf-8") as fh:
+            for n in notifications:
+                record = {"id": n.pk, "recipient": recipient_id(n), "patient": n.patient_id, "message": n.message}
+                fh.write(json.dumps(record) + "\n")
+        return {}
+
+
+def get_backend():
+    return import_string(settings.NOTIFICATION_DELIVERY_BACKEND)()
@@ -0,0 +1,80 @@
+"""
+Structured dosing frequencies.
+
+MedicationSchedule.frequency is free text ("once daily", "BID", "every 8 hours").
+parse_frequency turns it into (doses, period_days): `doses` taken every
+`period_days` days, counted from the schedule's start_date.
+"""
+import re
+from math import gcd
+
+WORD_NUMBERS = {
+    "once": 1, "one": 1, "a": 1, "twice": 2, "two": 2, "thrice": 3, "three": 3,
+    "four": 4, "five": 5, "six": 6,
+}
+ABBREVIATIONS = {
+    "qd": (1, 1), "od": (1, 1), "daily": (1, 1), "bid": (2, 1), "tid": (3, 1), "qid": (4, 1),
+    "qod": (1, 2), "weekly": (1, 7), "biweekly": (1, 14), "fortnightly": (1, 14), "monthly": (1, 30),
+    "nightly": (1, 1), "every day": (1, 1), "every other day": (1, 2), "alternate days": (1, 2),
+}
+PERIOD_DAYS = {"day": 1, "daily": 1, "week": 7, "weekly": 7, "month": 30, "monthly": 30}
+# anything beyond these is a typo, and would overflow the schedule's small integer columns
+MAX_DOSES = 48
+MAX_PERIOD_DAYS = 366
+
+_COUNT = r"(\d{1,3}|" + "|".join(WORD_NUMBERS) + r")"
+_TIMES_PER = re.compile(_COUNT + r"(?:\s*(?:times?|x))?\s*(?:a|per|each|every|/)?\s*(day|daily|week|weekly|month|monthly)$")
+_EVERY_HOURS = re.compile(r"(?:every|q)\s*(\d{1,4})\s*(?:h|hr|hrs|hours?)$")
+_EVERY_DAYS = re.compile(r"every\s*(\d{1,3})\s*days?$")
+
+
+def _count(token):
+    return int(token) if token.isdigit() else WORD_NUMBERS[token]
+
+
+def _bounded(doses, period_days):
+    return (doses, period_days) if 0 < doses <= MAX_DOSES and 0 < period_days <= MAX_PERIOD_DAYS else None
+
+
+def parse_frequency(text):
+    """
+    'twice daily' -> (2, 1), 'every 8 hours' -> (3, 1), 'weekly' -> (1, 7); None if
+    unrecognised or out of range (more than MAX_DOSES doses or MAX_PERIOD_DAYS days).
+    """
+    text = re.sub(r"[.,]", "", (text or "").strip().lower())
+    text = re.sub(r"\s+", " ", text)
+    if not text:
+        return None
+    if text in ABBREVIATIONS:
+        return ABBREVIATIONS[text]
+
+    match = _TIMES_PER.fullmatch(text)
+    if match:
+        doses = _count(match.group(1))
+        return _bounded(doses, PERIOD_DAYS[match.group(2)])
+
+    match = _EVERY_HOURS.fullmatch(text)
+    if match and int(match.group(1)):
+        # 24 doses every `hours` days; reduced so "every 8 hours" is (3, 1)
+        hours = int(match.group(1))
+        common = gcd(24, hours)
+        return _bounded(24 // common, hours // common)
+
+    match = _EVERY_DAYS.fullmatch(text)
+    if match:
+        return _bounded(1, int(match.group(1)))
+    return None
+
+
+def doses_due(doses, period_days, start_date, end_date, window_start, window_end):
+    """
+    Doses expected from one schedule inside [window_start, window_end] (inclusive),
+    in O(1): counts the dosing days start_date + k * period_days in the overlap.
+    """
+    lo = max(start_date, window_start)
+    hi = min(end_date, window_end)
+    if not doses or not period_days or lo > hi:
+        return 0
+    first = -(-(lo - start_date).days // period_days)  # ceil
+    last = (hi - start_date).days // period_days
+    return max(0, last - first + 1) * doses
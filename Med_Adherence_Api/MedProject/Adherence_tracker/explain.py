@@ -0,0 +1,106 @@
+"""
+EXPLAIN for the hot queries.
+
+Each HOT_QUERIES entry builds the queryset that an endpoint or job runs, with
+ids sampled from the configured database, so `manage.py explain_queries` shows
+whether the plan uses the intended index on SQLite and PostgreSQL. Keep the
+entries in step with the views they mirror.
+
+What to look for: "SEARCH ... USING INDEX" (SQLite) or "Index Scan" /
+"Index Only Scan" (PostgreSQL) on the index named in the description, and no
+"SCAN"/"Seq Scan" of activity or notification on a populated database.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from django.db import connections
+from django.db.models import Count
+from django.utils import timezone
+from .access import Assignment
+from .models import Activity, DailyAdherence, Job, Notification
+from .pagination import ActivityCursorPagination, NotificationCursorPagination
+from .services import adherence_panel, dosing_schedules, local_date_range
+
+Sample = namedtuple("Sample", "patient_id patient_ids today since")
+
+
+def sample():
+    """The busiest patient and doctor panel in the database (zeros when empty)."""
+    patient_id = (
+        Activity.objects.values("patient_id").annotate(n=Count("id")).order_by("-n")
+        .values_list("patient_id", flat=True).first()
+    ) or 0
+    doctor = (
+        Assignment.objects.values("doctorprofile_id").annotate(n=Count("id")).order_by("-n")
+        .values_list("doctorprofile_id", flat=True).first()
+    )
+    panel = list(Assignment.objects.filter(doctorprofile_id=doctor).values_list("patientprofile_id", flat=True))
+    today = timezone.localdate()
+    return Sample(patient_id, panel or [0], today, today - timedelta(days=30))
+
+
+def _page(queryset, pagination):
+    # what the cursor paginator fetches for a first page
+    return queryset.order_by(*pagination.ordering)[:pagination.page_size + 1]
+
+
+# name -> (what runs it and the index it should use, queryset builder)
+HOT_QUERIES = {
+    "activities.patient": (
+        "GET /api/activities/ as a patient; (patient, date_time)",
+        lambda s: _page(Activity.objects.filter(patient_id=s.patient_id), ActivityCursorPagination),
+    ),
+    "activities.doctor": (
+        "GET /api/activities/ as a doctor; (patient, date_time)",
+        lambda s: _page(Activity.objects.filter(patient_id__in=s.patient_ids), ActivityCursorPagination),
+    ),
+    "activities.missed": (
+        "GET /api/activities/?status=missed&start= as an admin; (status, date_time)",
+        lambda s: _page(
+            Activity.objects.filter(local_date_range("date_time", s.since), status="missed"), ActivityCursorPagination,
+        ),
+    ),
+    "history.window": (
+        "GET /api/patients/<id>/adherence/history/?start=&end=; (patient, date_time)",
+        lambda s: _page(
+            Activity.objects.filter(local_date_range("date_time", s.since, s.today), patient_id=s.patient_id),
+            ActivityCursorPagination,
+        ),
+    ),
+    "schedules.active": (
+        "expected doses in summaries and the missed-dose sweep; (patient, end_date)",
+        lambda s: dosing_schedules(s.patient_id, s.since, s.today),
+    ),
+    "rollup.summary": (
+        "adherence summary and analytics; daily adherence (patient, date)",
+        lambda s: DailyAdherence.objects.filter(patient_id=s.patient_id, date__gte=s.since),
+    ),
+    "panel.doctor": (
+        "GET /api/doctors/me/adherence/; daily adherence (patient, date)",
+        lambda s: adherence_panel(s.patient_ids, days=30).order_by("rate", "id")[:50],
+    ),
+    "notifications.patient": (
+        "GET /api/notifications/?patient=; (patient, sent_at)",
+        lambda s: _page(Notification.objects.filter(patient_id=s.patient_id), NotificationCursorPagination),
+    ),
+    "jobs.due": (
+        "run_jobs claiming queued jobs; (status, run_after)",
+        lambda s: Job.objects.filter(status="queued", run_after__lte=timezone.now())
+        .order_by("run_after", "id")[:50],  # run_jobs --batch-size default
+    ),
+}
+
+
+def explain(queryset, analyze=False):
+    """The plan as text. `analyze` runs the query (PostgreSQL only; SQLite has no EXPLAIN ANALYZE)."""
+    if connections[queryset.db].vendor == "postgresql":
+        return queryset.explain(analyze=analyze, buffers=analyze)
+    return queryset.explain()
+
+
+def explain_hot_queries(names=None, analyze=False):
+    """Yield (name, description, sql, plan) for the given HOT_QUERIES names, or all of them."""
+    s = sample()
+    for name in names or HOT_QUERIES:
+        description, build = HOT_QUERIES[name]
+        queryset = build(s)
+        yield name, description, str(queryset.query), explain(queryset, analyze=analyze)
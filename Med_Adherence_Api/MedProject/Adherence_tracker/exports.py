@@ -0,0 +1,89 @@
+"""
+Full-dataset Activity exports.
+
+Rows are read with .values_list(...).iterator(), which uses a server-side cursor
+on PostgreSQL, and are encoded one at a time. The CSV/NDJSON generators, and the
+optional gzip wrapper, never hold more than one fetch chunk, so memory stays flat
+whatever the size of the export.
+"""
+import csv
+import json
+import zlib
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Activity
+from .services import STREAM_CHUNK_SIZE, local_date_range
+
+# (column name, ORM lookup)
+EXPORT_COLUMNS = (
+    ("activity_id", "id"),
+    ("date_time", "date_time"),
+    ("status", "status"),
+    ("notes", "notes"),
+    ("blood_pressure_reading", "blood_pressure_reading"),
+    ("systolic", "systolic"),
+    ("diastolic", "diastolic"),
+    ("schedule_id", "schedule_id"),
+    ("medication_name", "schedule__medication_name"),
+    ("dosage", "schedule__dosage"),
+    ("frequency", "schedule__frequency"),
+    ("patient_id", "patient_id"),
+    ("patient_username", "patient__user__username"),
+)
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def export_rows(start=None, end=None, patient_ids=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield one tuple per Activity (columns as in EXPORT_COLUMNS), in id order."""
+    qs = Activity.objects.filter(local_date_range("date_time", start, end))
+    if patient_ids:
+        qs = qs.filter(patient_id__in=patient_ids)
+    qs = qs.order_by("id").values_list(*(lookup for _, lookup in EXPORT_COLUMNS))
+    return qs.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """File-like sink for csv.writer: write() hands the line back."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    names = [name for name, _ in EXPORT_COLUMNS]
+    when = names.index("date_time")
+    yield writer.writerow(names)
+    for row in rows:
+        row = list(row)
+        row[when] = row[when].isoformat()
+        yield writer.writerow(row)
+
+
+def iter_ndjson_rows(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def iter_gzip(chunks, flush_bytes=64 * 1024):
+    """Gzip a stream of str chunks on the fly, emitting roughly flush_bytes at a time."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            pending.append(data)
+            size += len(data)
+        if size >= flush_bytes:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(compressor.flush())
+    yield b"".join(pending)
+
+
+def export_stream(fmt, start=None, end=None, patient_ids=None, gzip=False):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {sorted(EXPORT_FORMATS)}")
+    rows = export_rows(start, end, patient_ids)
+    chunks = iter_csv(rows) if fmt == "csv" else iter_ndjson_rows(rows)
+    return iter_gzip(chunks) if gzip else chunks
@@ -0,0 +1,230 @@
+"""
+Bulk clinic onboarding from CSV.
+
+import_clinic validates every row of the users, assignments and schedules files
+before writing anything: field checks through the row serializers, then the
+cross-row checks (duplicate or existing usernames, references to unknown
+doctors/patients) with a handful of IN queries. Only a clean file set is loaded,
+with bulk_create inside one transaction. A file that isn't UTF-8 CSV is
+reported as an error on that file, like a bad row. Password hashing dominates
+the cost of a large import and can be spread over a process pool.
+
+  users.csv        username,email,password,role,date_of_birth,medical_history,specialization
+  assignments.csv  doctor,patient            (usernames, from the file or already registered)
+  schedules.csv    patient,medication_name,dosage,frequency,start_date,end_date
+"""
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from .access import Assignment, invalidate_assignments
+from .models import DoctorProfile, MedicationSchedule, PatientProfile, User
+from .serializers import ImportAssignmentRowSerializer, ImportScheduleRowSerializer, ImportUserRowSerializer
+from .services import invalidate_adherence_summary
+
+BATCH_SIZE = 1000
+# stays under SQLite's default limit on bound parameters
+IN_CHUNK_SIZE = 900
+REQUIRED_COLUMNS = {
+    "users": {"username", "password"},
+    "assignments": {"doctor", "patient"},
+    "schedules": {"patient", "medication_name", "dosage", "frequency", "start_date", "end_date"},
+}
+
+
+class UnreadableFile(Exception):
+    def __init__(self, line, message):
+        super().__init__(message)
+        self.line = line
+
+
+def read_rows(fh):
+    """
+    (line number, row) pairs from a CSV file; blank cells are dropped so optional
+    fields stay unset. Raises UnreadableFile if the file isn't UTF-8 CSV.
+    """
+    reader = csv.DictReader(fh)
+    rows = []
+    try:
+        for row in reader:
+            cleaned = {k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()}
+            if cleaned:
+                rows.append((reader.line_num, cleaned))
+    except UnicodeDecodeError:
+        raise UnreadableFile(reader.line_num + 1, "not UTF-8 text; save the file as CSV UTF-8") from None
+    except csv.Error as exc:
+        raise UnreadableFile(reader.line_num, f"malformed CSV: {exc}") from None
+    return reader.fieldnames or [], rows
+
+
+def _chunked_in(queryset, field, values, *columns):
+    values = list(values)
+    for i in range(0, len(values), IN_CHUNK_SIZE):
+        yield from queryset.filter(**{f"{field}__in": values[i:i + IN_CHUNK_SIZE]}).values_list(*columns)
+
+
+def _hash_passwords(passwords, workers=0):
+    if workers > 1 and len(passwords) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+    return [make_password(p) for p in passwords]
+
+
+class ClinicImport:
+    def __init__(self, users=None, assignments=None, schedules=None, check_passwords=True):
+        self.files = {"users": users, "assignments": assignments, "schedules": schedules}
+        self.check_passwords = check_passwords
+        self.errors = []
+        self.users, self.assignments, self.schedules = [], set(), []
+        self.patients, self.doctors = {}, {}  # existing username -> profile id
+
+    def _fail(self, file, line, errors):
+        self.errors.append({"file": file, "row": line, "errors": errors})
+
+    def _rows(self, name):
+        fh = self.files[name]
+        if fh is None:
+            return []
+        try:
+            header, rows = read_rows(fh)
+        except UnreadableFile as exc:
+            self._fail(name, exc.line, {"file": [str(exc)]})
+            return []
+        missing = REQUIRED_COLUMNS[name] - {h.strip() for h in header if h}
+        if missing:
+            self._fail(name, 1, {"header": [f"missing columns: {', '.join(sorted(missing))}"]})
+            return []
+        return rows
+
+    def validate(self):
+        seen = {}
+        for line, row in self._rows("users"):
+            s = ImportUserRowSerializer(data=row, check_password=self.check_passwords)
+            if not s.is_valid():
+                self._fail("users", line, s.errors)
+            elif s.validated_data["username"] in seen:
+                self._fail("users", line, {"username": [f"duplicate of row {seen[s.validated_data['username']]}"]})
+            else:
+                seen[s.validated_data["username"]] = line
+                self.users.append((line, s.validated_data))
+
+        taken = set(name for (name,) in _chunked_in(User.objects, "username", seen, "username"))
+        for line, data in self.users:
+            if data["username"] in taken:
+                self._fail("users", line, {"username": ["a user with that username already exists"]})
+        self.users = [(line, data) for line, data in self.users if data["username"] not in taken]
+        new_roles = {data["username"]: data.get("role", "patient") for _, data in self.users}
+
+        assignment_rows, schedule_rows = [], []
+        for line, row in self._rows("assignments"):
+            s = ImportAssignmentRowSerializer(data=row)
+            if s.is_valid():
+                assignment_rows.append((line, s.validated_data))
+            else:
+                self._fail("assignments", line, s.errors)
+        for line, row in self._rows("schedules"):
+            s = ImportScheduleRowSerializer(data=row)
+            if s.is_valid():
+                schedule_rows.append((line, s.validated_data))
+            else:
+                self._fail("schedules", line, s.errors)
+
+        # profiles of already registered users referenced by the file
+        refs = {d["patient"] for _, d in assignment_rows + schedule_rows} - new_roles.keys()
+        self.patients = dict(_chunked_in(PatientProfile.objects, "user__username", refs, "user__username", "id"))
+        refs = {d["doctor"] for _, d in assignment_rows} - new_roles.keys()
+        self.doctors = dict(_chunked_in(DoctorProfile.objects, "user__username", refs, "user__username", "id"))
+
+        def is_(role, known, username):
+            return new_roles.get(username) == role or username in known
+
+        for line, data in assignment_rows:
+            errors = {}
+            if not is_("doctor", self.doctors, data["doctor"]):
+                errors["doctor"] = [f"no doctor named {data['doctor']!r}"]
+            if not is_("patient", self.patients, data["patient"]):
+                errors["patient"] = [f"no patient named {data['patient']!r}"]
+            if errors:
+                self._fail("assignments", line, errors)
+            else:
+                self.assignments.add((data["doctor"], data["patient"]))
+        for line, data in schedule_rows:
+            if is_("patient", self.patients, data["patient"]):
+                self.schedules.append(data)
+            else:
+                self._fail("schedules", line, {"patient": [f"no patient named {data['patient']!r}"]})
+
+        self.errors.sort(key=lambda e: (list(self.files).index(e["file"]), e["row"]))
+        return not self.errors
+
+    def counts(self):
+        roles = [data.get("role", "patient") for _, data in self.users]
+        return {
+            "users": len(self.users),
+            "patients": roles.count("patient"),
+            "doctors": roles.count("doctor"),
+            "assignments": len(self.assignments),
+            "schedules": len(self.schedules),
+        }
+
+    @transaction.atomic
+    def load(self, workers=0):
+        users = [data for _, data in self.users]
+        hashes = _hash_passwords([data["password"] for data in users], workers)
+        User.objects.bulk_create([
+            User(username=data["username"], email=data.get("email", ""), role=data.get("role", "patient"), password=pw)
+            for data, pw in zip(users, hashes)
+        ], batch_size=BATCH_SIZE)
+        # re-read ids rather than rely on the backend returning them from bulk inserts
+        user_ids = dict(_chunked_in(User.objects, "username", [d["username"] for d in users], "username", "id"))
+
+        PatientProfile.objects.bulk_create([
+            PatientProfile(
+                user_id=user_ids[data["username"]],
+                date_of_birth=data.get("date_of_birth"),
+                medical_history=data.get("medical_history", ""),
+            )
+            for data in users if data.get("role", "patient") == "patient"
+        ], batch_size=BATCH_SIZE)
+        DoctorProfile.objects.bulk_create([
+            DoctorProfile(user_id=user_ids[data["username"]], specialization=data.get("specialization", ""))
+            for data in users if data.get("role") == "doctor"
+        ], batch_size=BATCH_SIZE)
+        self.patients.update(_chunked_in(PatientProfile.objects, "user_id", user_ids.values(), "user__username", "id"))
+        self.doctors.update(_chunked_in(DoctorProfile.objects, "user_id", user_ids.values(), "user__username", "id"))
+
+        Assignment.objects.bulk_create([
+            Assignment(doctorprofile_id=self.doctors[doctor], patientprofile_id=self.patients[patient])
+            for doctor, patient in sorted(self.assignments)
+        ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+        schedules = []
+        for data in self.schedules:
+            fields = {k: v for k, v in data.items() if k != "patient"}
+            schedule = MedicationSchedule(patient_id=self.patients[data["patient"]], **fields)
+            schedule.apply_frequency()
+            schedules.append(schedule)
+        MedicationSchedule.objects.bulk_create(schedules, batch_size=BATCH_SIZE)
+
+        # bulk_create sends no signals: drop what signals.py would have invalidated
+        doctor_user_ids = list(DoctorProfile.objects.filter(
+            pk__in={self.doctors[d] for d, _ in self.assignments}
+        ).values_list("user_id", flat=True))
+        if doctor_user_ids:
+            invalidate_assignments(doctor_user_ids)
+            transaction.on_commit(lambda: invalidate_assignments(doctor_user_ids))
+        if schedules:
+            invalidate_adherence_summary({s.patient_id for s in schedules})
+        return self.counts()
+
+
+def import_clinic(users=None, assignments=None, schedules=None, dry_run=False, workers=0, check_passwords=True):
+    """
+    Validate the given CSV files (text file objects, any may be None) and, unless
+    dry_run, load them. Nothing is written if any row is invalid.
+    Returns {"ok", "dry_run", "counts", "errors": [{"file", "row", "errors"}]}.
+    """
+    job = ClinicImport(users, assignments, schedules, check_passwords=check_passwords)
+    ok = job.validate()
+    counts = job.counts() if dry_run or not ok else job.load(workers=workers)
+    return {"ok": ok, "dry_run": dry_run, "counts": counts, "errors": job.errors}
@@ -0,0 +1,116 @@
+"""
+Broker-less job queue on top of the Job table.
+
+Workers (`manage.py run_jobs`) claim batches with SELECT ... FOR UPDATE SKIP LOCKED
+where the database supports it (PostgreSQL). SQLite has no row locks but
+serialises writers, so there the claim is a conditional UPDATE on status and
+each worker reads back only the rows it stamped.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .delivery import get_backend
+from .models import Job, Notification
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+MAX_BACKOFF_SECONDS = 3600
+
+
+def register(kind):
+    """Register a batch handler: handler(jobs) -> {job_id: error} for the jobs that failed."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload, run_after=None):
+    return Job.objects.create(kind=kind, payload=payload, run_after=run_after or timezone.now())
+
+
+def enqueue_many(kind, payloads):
+    now = timezone.now()
+    return Job.objects.bulk_create([Job(kind=kind, payload=p, run_after=now) for p in payloads])
+
+
+def claim_batch(worker_id, limit):
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.filter(status="queued", run_after__lte=now).order_by("run_after", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list("id", flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.filter(pk__in=ids, status="queued").update(
+            status="running", locked_by=worker_id, locked_at=now, attempts=F("attempts") + 1,
+        )
+    return list(Job.objects.filter(pk__in=ids, status="running", locked_by=worker_id, locked_at=now))
+
+
+def release_stale(lease_seconds):
+    """
+    Requeue jobs whose worker died mid-batch. A job that has used up its attempts
+    is marked failed instead, so one that keeps killing its worker stops being retried.
+    Returns the number of jobs requeued.
+    """
+    cutoff = timezone.now() - timedelta(seconds=lease_seconds)
+    stale = Job.objects.filter(status="running", locked_at__lt=cutoff)
+    stale.filter(attempts__gte=F("max_attempts")).update(
+        status="failed", locked_by="", last_error="lease expired: the worker died while running this job",
+    )
+    return stale.update(status="queued", locked_by="")
+
+
+def backoff(attempts):
+    return min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+
+
+def run_batch(jobs):
+    by_kind = defaultdict(list)
+    for job in jobs:
+        by_kind[job.kind].append(job)
+
+    failures = {}
+    for kind, batch in by_kind.items():
+        handler = HANDLERS.get(kind)
+        if handler is None:
+            failures.update({j.pk: f"no handler for {kind!r}" for j in batch})
+            continue
+        try:
+            failures.update(handler(batch) or {})
+        except Exception as exc:
+            logger.exception("job batch %s failed", kind)
+            failures.update({j.pk: repr(exc) for j in batch})
+
+    now = timezone.now()
+    Job.objects.filter(pk__in=[j.pk for j in jobs if j.pk not in failures]).update(
+        status="done", locked_by="", last_error="",
+    )
+    for job in jobs:
+        if job.pk not in failures:
+            continue
+        if job.attempts >= job.max_attempts:
+            fields = {"status": "failed"}
+        else:
+            fields = {"status": "queued", "run_after": now + timedelta(seconds=backoff(job.attempts))}
+        Job.objects.filter(pk=job.pk).update(locked_by="", last_error=str(failures[job.pk])[:2000], **fields)
+    return len(jobs) - len(failures), len(failures)
+
+
+@register("notification.deliver")
+def deliver_notifications(jobs):
+    notifications = Notification.objects.select_related("patient").in_bulk([j.payload["notification_id"] for j in jobs])
+    pending = [n for n in notifications.values() if n.delivered_at is None]
+    errors = get_backend().send_many(pending) if pending else {}
+    Notification.objects.filter(pk__in=[n.pk for n in pending if n.pk not in errors]).update(
+        delivered_at=timezone.now(),
+    )
+    # a job whose notification was deleted has nothing left to do
+    return {j.pk: errors[j.payload["notification_id"]] for j in jobs if j.payload["notification_id"] in errors}
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from Adherence_tracker.explain import HOT_QUERIES, explain_hot_queries
+
+
+class Command(BaseCommand):
+    help = "Print the EXPLAIN plan of each hot query against the configured database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help=f"Queries to explain (default: all of {', '.join(HOT_QUERIES)}).")
+        parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (PostgreSQL; runs the queries).")
+        parser.add_argument("--no-sql", action="store_true", help="Print only the plans.")
+
+    def handle(self, *args, **options):
+        unknown = set(options["names"]) - HOT_QUERIES.keys()
+        if unknown:
+            raise CommandError(f"unknown queries: {', '.join(sorted(unknown))}")
+        for name, description, sql, plan in explain_hot_queries(options["names"], analyze=options["analyze"]):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {name}: {description}"))
+            if not options["no_sql"]:
+                self.stdout.write(sql)
+            self.stdout.write(plan + "\n")
@@ -0,0 +1,43 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from Adherence_tracker.exports import EXPORT_FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = "Stream every Activity, with schedule and patient context, as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--start", help="First local date (YYYY-MM-DD).")
+        parser.add_argument("--end", help="Last local date (YYYY-MM-DD).")
+        parser.add_argument("--patient", type=int, action="append", dest="patients",
+                            help="Only export this patient profile id (repeatable).")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output on the fly.")
+        parser.add_argument("-o", "--output", help="File to write (default: stdout).")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for key in ("start", "end"):
+            dates[key] = parse_date(options[key]) if options[key] else None
+            if options[key] and dates[key] is None:
+                raise CommandError(f"--{key} must be a YYYY-MM-DD date")
+
+        chunks = export_stream(
+            options["format"], dates["start"], dates["end"], options["patients"], gzip=options["gzip"],
+        )
+        if options["output"]:
+            if options["gzip"]:
+                fh = open(options["output"], "wb")
+            else:
+                fh = open(options["output"], "w", encoding="utf-8", newline="")
+            with fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Export written to {options['output']} ✅"))
+        elif options["gzip"]:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
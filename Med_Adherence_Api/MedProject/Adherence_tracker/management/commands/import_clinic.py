@@ -0,0 +1,39 @@
+import json
+import os
+from contextlib import ExitStack
+from django.core.management.base import BaseCommand, CommandError
+from Adherence_tracker.imports import import_clinic
+
+
+class Command(BaseCommand):
+    help = "Bulk-create users, doctor-patient assignments and medication schedules from CSV files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", help="CSV: username,email,password,role,date_of_birth,medical_history,specialization")
+        parser.add_argument("--assignments", help="CSV: doctor,patient (usernames)")
+        parser.add_argument("--schedules", help="CSV: patient,medication_name,dosage,frequency,start_date,end_date")
+        parser.add_argument("--dry-run", action="store_true", help="Validate only.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Processes used to hash passwords (1 = no pool).")
+        parser.add_argument("--skip-password-validation", action="store_true",
+                            help="Do not run AUTH_PASSWORD_VALIDATORS (e.g. for generated initial passwords).")
+
+    def handle(self, *args, **options):
+        names = [n for n in ("users", "assignments", "schedules") if options[n]]
+        if not names:
+            raise CommandError("give at least one of --users, --assignments, --schedules")
+
+        with ExitStack() as stack:
+            files = {n: stack.enter_context(open(options[n], encoding="utf-8-sig", newline="")) for n in names}
+            report = import_clinic(
+                **files, dry_run=options["dry_run"], workers=options["workers"],
+                check_passwords=not options["skip_password_validation"],
+            )
+
+        if not report["ok"]:
+            for error in report["errors"]:
+                self.stderr.write(f"{error['file']} row {error['row']}: {json.dumps(error['errors'])}")
+            raise CommandError(f"{len(report['errors'])} invalid rows, nothing was imported")
+        verb = "Validated" if report["dry_run"] else "Imported"
+        summary = ", ".join(f"{n} {k}" for k, n in report["counts"].items())
+        self.stdout.write(self.style.SUCCESS(f"{verb}: {summary} ✅"))
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from Adherence_tracker.revocation import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding and blacklisted JWTs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Tokens scanned per batch.")
+        parser.add_argument("--loop", action="store_true", help="Keep running, pruning every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=3600)
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = prune_expired_tokens(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"{deleted} expired tokens deleted ✅"))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
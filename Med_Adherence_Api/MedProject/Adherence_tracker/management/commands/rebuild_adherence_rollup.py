@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from Adherence_tracker.services import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyAdherence rollup table from raw Activity rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patient", type=int, action="append", dest="patients",
+            help="Only rebuild this patient profile id (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_rollup(patient_ids=options["patients"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily adherence rows ✅"))
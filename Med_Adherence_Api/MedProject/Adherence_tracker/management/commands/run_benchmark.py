@@ -0,0 +1,62 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from Adherence_tracker.benchmark import SCENARIOS, compare, run, serializer_benchmark
+
+
+class Command(BaseCommand):
+    help = "Replay API scenarios against seeded bench_* data and report latency, throughput and query counts as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", action="append", dest="scenarios", choices=sorted(SCENARIOS),
+                            help="Scenario to run (repeatable, default: all).")
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument("--base-url", help="Benchmark a running server (e.g. http://127.0.0.1:8000) "
+                                               "instead of the in-process test client.")
+        parser.add_argument("--concurrency", type=int, default=1, help="Parallel requests (--base-url only).")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--serializer-rows", type=int, default=0,
+                            help="Also time ActivitySerializer against the fast read path on this many rows.")
+        parser.add_argument("-o", "--output", help="Write the JSON report here (default: stdout).")
+        parser.add_argument("--baseline", help="Earlier report to compare against; exits non-zero on regressions.")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown (0.2 = 20%%).")
+
+    def handle(self, *args, **options):
+        try:
+            report = run(
+                scenarios=options["scenarios"], base_url=options["base_url"], requests=options["requests"],
+                warmup=options["warmup"], concurrency=options["concurrency"], seed_value=options["seed"],
+            )
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        if options["serializer_rows"]:
+            report["serializers"] = serializer_benchmark(options["serializer_rows"])
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(text + "\n")
+        else:
+            self.stdout.write(text)
+
+        for name, r in report["scenarios"].items():
+            queries = f", {r['queries']['mean']} queries" if r["queries"] else ""
+            self.stderr.write(
+                f"{name:16} p50 {r['latency_ms']['p50']:8.2f} ms  p95 {r['latency_ms']['p95']:8.2f} ms  "
+                f"p99 {r['latency_ms']['p99']:8.2f} ms  {r['rps']:8.1f} rps  {r['errors']} errors{queries}"
+            )
+
+        if "serializers" in report:
+            r = report["serializers"]
+            self.stderr.write(
+                f"serializers      {r['rows']} rows: model {r['model_serializer_ms']} ms, "
+                f"fast read {r['fast_read_ms']} ms ({r['speedup']}x, identical={r['identical']})"
+            )
+
+        if options["baseline"]:
+            with open(options["baseline"]) as fh:
+                regressions = compare(json.load(fh), report, options["tolerance"])
+            if regressions:
+                raise CommandError("regressions:\n  " + "\n  ".join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against baseline ✅"))
@@ -0,0 +1,29 @@
+import os
+import socket
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from Adherence_tracker.jobs import claim_batch, release_stale, run_batch
+
+
+class Command(BaseCommand):
+    help = "Process queued background jobs (notification delivery, ...). Run more copies to scale out."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--idle-sleep", type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain what is due now, then exit.")
+        parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+
+    def handle(self, *args, **options):
+        worker_id = options["worker_id"][:64]
+        while True:
+            release_stale(settings.JOB_LEASE_SECONDS)
+            jobs = claim_batch(worker_id, options["batch_size"])
+            if not jobs:
+                if options["once"]:
+                    break
+                time.sleep(options["idle_sleep"])
+                continue
+            done, failed = run_batch(jobs)
+            self.stdout.write(f"{worker_id}: {done} done, {failed} failed")
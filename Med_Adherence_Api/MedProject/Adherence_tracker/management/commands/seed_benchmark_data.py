@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from Adherence_tracker.benchmark import reset, seed
+
+
+class Command(BaseCommand):
+    help = "Seed the configured database with a synthetic clinic (bench_* users) for run_benchmark."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=100)
+        parser.add_argument("--doctors", type=int, default=10)
+        parser.add_argument("--schedules-per-patient", type=int, default=2)
+        parser.add_argument("--activities-per-schedule", type=int, default=100)
+        parser.add_argument("--days", type=int, default=90, help="Spread activities over this many past days.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--reset", action="store_true", help="Delete existing bench_* data first.")
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            self.stdout.write(f"deleted {reset()} rows")
+        counts = seed(
+            patients=options["patients"], doctors=options["doctors"],
+            schedules_per_patient=options["schedules_per_patient"],
+            activities_per_schedule=options["activities_per_schedule"],
+            days=options["days"], seed_value=options["seed"], log=self.stdout.write,
+        )
+        summary = ", ".join(f"{n} {k}" for k, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} ✅"))
@@ -0,0 +1,42 @@
+import os
+import socket
+import time
+from django.core.management.base import BaseCommand, CommandError
+from Adherence_tracker.sweeps import sweep_missed_doses
+
+
+class Command(BaseCommand):
+    help = "Record 'missed' activities for expected doses that were never logged."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Patients per batch.")
+        parser.add_argument("--lookback-days", type=int, help="Days to cover on the very first run.")
+        parser.add_argument("--shard", default="0/1", help="Process patients with id %% N == i, given as i/N.")
+        parser.add_argument("--loop", action="store_true", help="Keep running, sweeping every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=3600)
+        parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+
+    def handle(self, *args, **options):
+        try:
+            index, count = (int(x) for x in options["shard"].split("/"))
+        except ValueError:
+            raise CommandError("--shard must look like 0/4")
+        if not 0 <= index < count:
+            raise CommandError("--shard index must be in [0, N)")
+
+        while True:
+            result = sweep_missed_doses(
+                options["worker_id"][:64], chunk_size=options["chunk_size"],
+                shard=(index, count), lookback_days=options["lookback_days"],
+            )
+            if result is None:
+                self.stdout.write("another worker is sweeping this shard, skipping")
+            elif result["since"] > result["until"]:
+                self.stdout.write(f"already swept up to {result['until']}")
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{result['since']}..{result['until']}: {result['created']} missed doses recorded ✅"
+                ))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
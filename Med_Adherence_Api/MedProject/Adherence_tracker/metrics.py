@@ -0,0 +1,262 @@
+"""
+Per-view request metrics.
+
+RequestMetricsMiddleware times every request, counts its SQL queries and their
+time through a connection execute_wrapper (so DEBUG is not needed), and feeds
+in-process histograms labelled by the resolved view ("ActivityViewSet.list",
+"AdherenceSummaryView", ...). Slow requests and requests with many queries are
+logged with their most repeated statement, which is usually the N+1.
+
+Under gunicorn each worker has its own registry. With METRICS_DIR set, every
+worker writes a snapshot to METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS
+and /api/_metrics/ sums all snapshots, replacing the serving worker's file with
+its live state. Empty the directory when the app is restarted, as with any
+Prometheus multi-process setup.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAMS = {
+    "request_duration_seconds": (
+        "Wall time per request.",
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ),
+    "request_db_queries": (
+        "SQL queries per request.",
+        (0, 1, 2, 5, 10, 20, 50, 100, 250),
+    ),
+    "request_db_duration_seconds": (
+        "Time spent in SQL per request.",
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    ),
+    "response_size_bytes": (
+        "Response body size (streaming responses are not measured).",
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+    ),
+}
+PREFIX = "medadherence_"
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()  # (view, method, status) -> n
+        self.histograms = {name: {} for name in HISTOGRAMS}  # name -> {(view, method): [buckets..., sum, count]}
+
+    def observe(self, view, method, status, values):
+        with self.lock:
+            self.requests[(view, method, str(status))] += 1
+            for name, value in values.items():
+                if value is None:
+                    continue
+                bounds = HISTOGRAMS[name][1]
+                series = self.histograms[name].setdefault((view, method), [0] * (len(bounds) + 2))
+                for i, bound in enumerate(bounds):
+                    if value <= bound:
+                        series[i] += 1
+                series[-2] += value
+                series[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": [[*labels, n] for labels, n in self.requests.items()],
+                "histograms": {
+                    name: [[*labels, list(series)] for labels, series in data.items()]
+                    for name, data in self.histograms.items()
+                },
+            }
+
+
+def merge(snapshots):
+    requests = Counter()
+    histograms = {name: {} for name in HISTOGRAMS}
+    for snap in snapshots:
+        for view, method, status, n in snap["requests"]:
+            requests[(view, method, status)] += n
+        for name, rows in snap["histograms"].items():
+            if name not in histograms:
+                continue
+            for view, method, series in rows:
+                total = histograms[name].setdefault((view, method), [0] * len(series))
+                for i, value in enumerate(series):
+                    total[i] += value
+    return requests, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def render_prometheus(requests, histograms):
+    lines = [
+        f"# HELP {PREFIX}requests_total Requests by view, method and status.",
+        f"# TYPE {PREFIX}requests_total counter",
+    ]
+    for (view, method, status), n in sorted(requests.items()):
+        lines.append(f"{PREFIX}requests_total{{{_labels(view=view, method=method, status=status)}}} {n}")
+    for name, (help_text, bounds) in HISTOGRAMS.items():
+        metric = PREFIX + name
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        for (view, method), series in sorted(histograms[name].items()):
+            base = _labels(view=view, method=method)
+            for bound, n in zip(bounds, series):
+                lines.append(f'{metric}_bucket{{{base},le="{bound}"}} {n}')
+            lines.append(f'{metric}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{metric}_sum{{{base}}} {round(series[-2], 6)}")
+            lines.append(f"{metric}_count{{{base}}} {series[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+_last_flush = 0.0
+
+
+def _snapshot_path(pid=None):
+    return os.path.join(settings.METRICS_DIR, f"{pid or os.getpid()}.json")
+
+
+def flush(force=False):
+    """Write this worker's snapshot to METRICS_DIR (at most every METRICS_FLUSH_SECONDS)."""
+    global _last_flush
+    if not settings.METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < settings.METRICS_FLUSH_SECONDS:
+        return
+    _last_flush = now
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    path = _snapshot_path()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(REGISTRY.snapshot(), fh)
+    os.replace(tmp, path)
+
+
+atexit.register(lambda: flush(force=True))
+
+
+def collect():
+    """Prometheus text for this worker, plus every other worker's latest snapshot."""
+    snapshots = [REGISTRY.snapshot()]
+    if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+        own = os.path.basename(_snapshot_path())
+        for name in os.listdir(settings.METRICS_DIR):
+            if not name.endswith(".json") or name == own:
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, name)) as fh:
+                    snapshots.append(json.load(fh))
+            except (OSError, ValueError):
+                logger.warning("skipping unreadable metrics snapshot %s", name)
+    return render_prometheus(*merge(snapshots))
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    cls = getattr(match.func, "cls", None)
+    if cls is None:
+        return match.view_name or match._func_path
+    actions = getattr(match.func, "actions", None)
+    if actions:
+        action = actions.get(request.method.lower())
+        if action:
+            return f"{cls.__name__}.{action}"
+    return cls.__name__
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+
+def record_queries(recorder):
+    """ExitStack with `recorder` wrapped around every database connection of this thread."""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(recorder))
+    return stack
+
+
+class RequestMetricsMiddleware:
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # under ASGI stay async, so async views are not pushed onto a thread
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        self.observe(request, response, recorder)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        # the wrappers go on the connections of the thread that runs the ORM calls
+        stack = await sync_to_async(record_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.observe(request, response, recorder)
+        return response
+
+    def observe(self, request, response, recorder):
+        elapsed = time.perf_counter() - recorder.start
+        view = view_name(request)
+        size = None if response.streaming else len(response.content)
+        REGISTRY.observe(view, request.method, response.status_code, {
+            "request_duration_seconds": elapsed,
+            "request_db_queries": recorder.count,
+            "request_db_duration_seconds": recorder.duration,
+            "response_size_bytes": size,
+        })
+
+        if elapsed >= settings.METRICS_SLOW_REQUEST_SECONDS or recorder.count > settings.METRICS_QUERY_WARN:
+            sql, repeats = recorder.statements.most_common(1)[0] if recorder.statements else ("", 0)
+            logger.warning(
+                "%s %s (%s): %.0f ms, %d queries in %.0f ms; most repeated (%dx): %s",
+                request.method, request.path, view, elapsed * 1000, recorder.count,
+                recorder.duration * 1000, repeats, sql[:300],
+            )
+        flush()
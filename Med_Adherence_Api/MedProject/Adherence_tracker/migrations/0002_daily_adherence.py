@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def populate_rollup(apps, schema_editor):
+    Activity = apps.get_model("Adherence_tracker", "Activity")
+    DailyAdherence = apps.get_model("Adherence_tracker", "DailyAdherence")
+    rows = (
+        Activity.objects.annotate(day=TruncDate("date_time"))
+        .values("schedule_id", "schedule__patient_id", "day")
+        .annotate(taken=Count("id", filter=Q(status="taken")), missed=Count("id", filter=Q(status="missed")))
+        .order_by()
+    )
+    DailyAdherence.objects.bulk_create(
+        (
+            DailyAdherence(
+                patient_id=r["schedule__patient_id"], schedule_id=r["schedule_id"],
+                date=r["day"], taken=r["taken"], missed=r["missed"],
+            )
+            for r in rows.iterator(chunk_size=1000)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Adherence_tracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAdherence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('taken', models.IntegerField(default=0)),
+                ('missed', models.IntegerField(default=0)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_adherence', to='Adherence_tracker.patientprofile')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_adherence', to='Adherence_tracker.medicationschedule')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'date'], name='Adherence_t_patient_f9b15b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('schedule', 'date'), name='uniq_daily_adherence')],
+            },
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Adherence_tracker', '0002_daily_adherence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='activity',
+            constraint=models.UniqueConstraint(fields=('schedule', 'idempotency_key'), name='uniq_activity_idempotency_key'),
+        ),
+    ]
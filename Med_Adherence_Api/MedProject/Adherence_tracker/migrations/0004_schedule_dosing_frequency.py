@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:06
+
+import re
+from math import gcd
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Frozen copy of Adherence_tracker.dosing.parse_frequency as of this migration, so
+# later changes to the live parser don't change what this migration writes. It is
+# bounded like the live one, so free text can't overflow the small integer columns.
+WORD_NUMBERS = {
+    "once": 1, "one": 1, "a": 1, "twice": 2, "two": 2, "thrice": 3, "three": 3,
+    "four": 4, "five": 5, "six": 6,
+}
+ABBREVIATIONS = {
+    "qd": (1, 1), "od": (1, 1), "daily": (1, 1), "bid": (2, 1), "tid": (3, 1), "qid": (4, 1),
+    "qod": (1, 2), "weekly": (1, 7), "biweekly": (1, 14), "fortnightly": (1, 14), "monthly": (1, 30),
+    "nightly": (1, 1), "every day": (1, 1), "every other day": (1, 2), "alternate days": (1, 2),
+}
+PERIOD_DAYS = {"day": 1, "daily": 1, "week": 7, "weekly": 7, "month": 30, "monthly": 30}
+MAX_DOSES = 48
+MAX_PERIOD_DAYS = 366
+
+_COUNT = r"(\d{1,3}|" + "|".join(WORD_NUMBERS) + r")"
+_TIMES_PER = re.compile(_COUNT + r"(?:\s*(?:times?|x))?\s*(?:a|per|each|every|/)?\s*(day|daily|week|weekly|month|monthly)$")
+_EVERY_HOURS = re.compile(r"(?:every|q)\s*(\d{1,4})\s*(?:h|hr|hrs|hours?)$")
+_EVERY_DAYS = re.compile(r"every\s*(\d{1,3})\s*days?$")
+
+
+def _count(token):
+    return int(token) if token.isdigit() else WORD_NUMBERS[token]
+
+
+def _bounded(doses, period_days):
+    return (doses, period_days) if 0 < doses <= MAX_DOSES and 0 < period_days <= MAX_PERIOD_DAYS else None
+
+
+def parse_frequency(text):
+    text = re.sub(r"[.,]", "", (text or "").strip().lower())
+    text = re.sub(r"\s+", " ", text)
+    if not text:
+        return None
+    if text in ABBREVIATIONS:
+        return ABBREVIATIONS[text]
+
+    match = _TIMES_PER.fullmatch(text)
+    if match:
+        doses = _count(match.group(1))
+        return _bounded(doses, PERIOD_DAYS[match.group(2)])
+
+    match = _EVERY_HOURS.fullmatch(text)
+    if match and int(match.group(1)):
+        hours = int(match.group(1))
+        common = gcd(24, hours)
+        return _bounded(24 // common, hours // common)
+
+    match = _EVERY_DAYS.fullmatch(text)
+    if match:
+        return _bounded(1, int(match.group(1)))
+    return None
+
+
+def parse_existing_frequencies(apps, schema_editor):
+    MedicationSchedule = apps.get_model("Adherence_tracker", "MedicationSchedule")
+    last_pk = 0
+    while True:
+        batch = list(MedicationSchedule.objects.filter(pk__gt=last_pk).order_by("pk")[:BATCH_SIZE])
+        if not batch:
+            break
+        for schedule in batch:
+            schedule.doses_per_period, schedule.period_days = parse_frequency(schedule.frequency) or (None, None)
+        MedicationSchedule.objects.bulk_update(batch, ["doses_per_period", "period_days"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Adherence_tracker', '0003_activity_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicationschedule',
+            name='doses_per_period',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicationschedule',
+            name='period_days',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(parse_existing_frequencies, migrations.RunPython.noop),
+    ]
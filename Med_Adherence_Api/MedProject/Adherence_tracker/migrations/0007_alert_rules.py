@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Adherence_tracker', '0006_sweep_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='recipient',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='PatientAlertState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consecutive_missed', models.PositiveIntegerField(default=0)),
+                ('last_fired', models.JSONField(blank=True, default=dict)),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='alert_state', to='Adherence_tracker.patientprofile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:11
+
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+# Frozen copy of Adherence_tracker.vitals.parse_blood_pressure as of this migration,
+# so later changes to the live parser don't change what this migration writes.
+_BP = re.compile(r"\s*(\d{2,3})\s*/\s*(\d{2,3})\s*(?:mm\s*hg)?\s*", re.IGNORECASE)
+SYSTOLIC_RANGE = (50, 300)
+DIASTOLIC_RANGE = (20, 200)
+
+
+def parse_blood_pressure(text):
+    match = _BP.fullmatch(text or "")
+    if not match:
+        return None
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if not (SYSTOLIC_RANGE[0] <= systolic <= SYSTOLIC_RANGE[1] and DIASTOLIC_RANGE[0] <= diastolic <= DIASTOLIC_RANGE[1]):
+        return None
+    return systolic, diastolic
+
+
+def parse_existing_readings(apps, schema_editor):
+    Activity = apps.get_model("Adherence_tracker", "Activity")
+    readings = Activity.objects.exclude(blood_pressure_reading="").order_by("pk")
+    last_pk = 0
+    while True:
+        batch = list(readings.filter(pk__gt=last_pk).only("pk", "blood_pressure_reading")[:BATCH_SIZE])
+        if not batch:
+            break
+        for activity in batch:
+            activity.systolic, activity.diastolic = parse_blood_pressure(activity.blood_pressure_reading) or (None, None)
+        Activity.objects.bulk_update(batch, ["systolic", "diastolic"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Adherence_tracker', '0007_alert_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='diastolic',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='systolic',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(parse_existing_readings, migrations.RunPython.noop),
+    ]
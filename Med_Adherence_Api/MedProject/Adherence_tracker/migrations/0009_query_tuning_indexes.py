@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Adherence_tracker', '0008_activity_blood_pressure'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['status', 'date_time'], name='Adherence_t_status_0276e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicationschedule',
+            index=models.Index(fields=['patient', 'end_date'], name='Adherence_t_patient_8cee73_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['patient', 'sent_at'], name='Adherence_t_patient_85758e_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:02
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def copy_schedule_patient(apps, schema_editor):
+    """Fill Activity.patient from the schedule, one committed id range at a time."""
+    Activity = apps.get_model("Adherence_tracker", "Activity")
+    MedicationSchedule = apps.get_model("Adherence_tracker", "MedicationSchedule")
+    patient = Subquery(MedicationSchedule.objects.filter(pk=OuterRef("schedule_id")).values("patient_id")[:1])
+    last_pk = 0
+    while True:
+        # last id of the next batch; None once fewer than BATCH_SIZE rows remain
+        ids = Activity.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)
+        upper = next(iter(ids[BATCH_SIZE - 1:BATCH_SIZE]), None)
+        with transaction.atomic():
+            rows = Activity.objects.filter(pk__gt=last_pk, patient__isnull=True)
+            if upper is not None:
+                rows = rows.filter(pk__lte=upper)
+            rows.update(patient_id=patient)
+        if upper is None:
+            break
+        last_pk = upper
+
+
+class Migration(migrations.Migration):
+    # the backfill commits per batch instead of holding one long transaction
+    atomic = False
+
+    dependencies = [
+        ('Adherence_tracker', '0009_query_tuning_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='patient',
+            field=models.ForeignKey(
+                editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                related_name='activities', to='Adherence_tracker.patientprofile',
+            ),
+        ),
+        migrations.RunPython(copy_schedule_patient, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='activity',
+            name='patient',
+            field=models.ForeignKey(
+                editable=False, on_delete=django.db.models.deletion.CASCADE,
+                related_name='activities', to='Adherence_tracker.patientprofile',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['patient', 'date_time'], name='Adherence_t_patient_305f1e_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from .dosing import parse_frequency
+from .vitals import parse_blood_pressure
 
 class User(AbstractUser):
     ROLE_CHOICES = (("patient","Patient"),("doctor","Doctor"),("admin","Admin"))
@@ -32,34 +34,155 @@ class MedicationSchedule(models.Model):
     medication_name = models.CharField(max_length=120)
     dosage = models.CharField(max_length=60)
     frequency = models.CharField(max_length=60)  # e.g., "once daily"
+    # parsed from `frequency`: doses_per_period doses every period_days days (null if unrecognised)
+    doses_per_period = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    period_days = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
     start_date = models.DateField()
     end_date = models.DateField()
 
+    class Meta:
+        # active-schedule scans: patient=..., end_date >= window start
+        indexes = [models.Index(fields=["patient","end_date"])]
+
     def clean(self):
         if self.end_date < self.start_date:
             raise ValidationError("end_date cannot be earlier than start_date")
 
+    def apply_frequency(self):
+        self.doses_per_period, self.period_days = parse_frequency(self.frequency) or (None, None)
+
+    def save(self, *args, **kwargs):
+        self.apply_frequency()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "frequency" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "doses_per_period", "period_days"}
+        # activities and their rollup rows carry a copy of the patient; follow a reassigned schedule
+        moving = self.pk is not None and (update_fields is None or "patient" in update_fields)
+        with transaction.atomic():
+            # read before saving: the post_save signal drops these patients' cached summaries too
+            self._moved_from = set(
+                self.daily_adherence.exclude(patient_id=self.patient_id).values_list("patient_id", flat=True).distinct()
+            ) if moving else set()
+            super().save(*args, **kwargs)
+            if moving:
+                self.daily_adherence.exclude(patient_id=self.patient_id).update(patient_id=self.patient_id)
+                self.activities.exclude(patient_id=self.patient_id).update(patient_id=self.patient_id)
+
     def __str__(self):
         return f"{self.medication_name} for {self.patient.user.username}"
 
 class Activity(models.Model):
     STATUS_CHOICES = (("taken","Taken"),("missed","Missed"))
     schedule = models.ForeignKey(MedicationSchedule, on_delete=models.CASCADE, related_name="activities")
+    # copy of schedule.patient, so patient-scoped reads skip the schedule join (set on save)
+    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name="activities", editable=False)
     date_time = models.DateTimeField(default=timezone.now)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)
     notes = models.TextField(blank=True, default="")
     blood_pressure_reading = models.CharField(max_length=15, blank=True, default="")  # "120/80"
+    # parsed from blood_pressure_reading on save (null when blank or unparseable)
+    systolic = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    diastolic = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    # client-generated key so offline replays don't create duplicates
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
-        indexes = [models.Index(fields=["schedule","date_time"])]
+        indexes = [
+            models.Index(fields=["schedule","date_time"]),
+            # patient-scoped lists and windows in date order
+            models.Index(fields=["patient","date_time"]),
+            # status-filtered lists in date order, across patients
+            models.Index(fields=["status","date_time"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["schedule","idempotency_key"], name="uniq_activity_idempotency_key"),
+        ]
+
+    def apply_blood_pressure(self):
+        self.systolic, self.diastolic = parse_blood_pressure(self.blood_pressure_reading) or (None, None)
+
+    def apply_patient(self):
+        self.patient_id = self.schedule.patient_id
+
+    def save(self, *args, **kwargs):
+        self.apply_blood_pressure()
+        self.apply_patient()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "blood_pressure_reading" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "systolic", "diastolic"}
+        if update_fields is not None and "schedule" in update_fields:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "patient"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.schedule.medication_name} @ {self.date_time:%Y-%m-%d %H:%M} - {self.status}"
 
+class DailyAdherence(models.Model):
+    """Per-schedule, per-day taken/missed counters maintained alongside Activity."""
+    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name="daily_adherence")
+    schedule = models.ForeignKey(MedicationSchedule, on_delete=models.CASCADE, related_name="daily_adherence")
+    date = models.DateField()
+    taken = models.IntegerField(default=0)
+    missed = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["schedule","date"], name="uniq_daily_adherence")]
+        indexes = [models.Index(fields=["patient","date"])]
+
+    def __str__(self):
+        return f"{self.schedule_id} @ {self.date} - {self.taken} taken / {self.missed} missed"
+
 class Notification(models.Model):  # optional
     patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name="notifications")
+    # who receives it when that is not the patient (e.g. an assigned doctor)
+    recipient = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name="received_notifications"
+    )
     message = models.TextField()
     sent_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)  # set by the job worker
+
+    class Meta:
+        indexes = [models.Index(fields=["patient","sent_at"])]
 
     def __str__(self):
         return f"Notif to {self.patient.user.username} @ {self.sent_at:%Y-%m-%d %H:%M}"
+
+class PatientAlertState(models.Model):
+    """Running counters and cooldowns for the adherence alert rules (see alerts.py)."""
+    patient = models.OneToOneField(PatientProfile, on_delete=models.CASCADE, related_name="alert_state")
+    consecutive_missed = models.PositiveIntegerField(default=0)
+    last_fired = models.JSONField(default=dict, blank=True)  # rule name -> ISO timestamp
+
+    def __str__(self):
+        return f"Alerts<{self.patient_id}>"
+
+class Job(models.Model):
+    """Database-backed background job, claimed in batches by `manage.py run_jobs`."""
+    STATUS_CHOICES = (("queued","Queued"),("running","Running"),("done","Done"),("failed","Failed"))
+    kind = models.CharField(max_length=60)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status","run_after"])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} - {self.status}"
+
+class SweepState(models.Model):
+    """High-water mark and lease for a periodic sweep (see sweeps.py)."""
+    name = models.CharField(max_length=60, unique=True)
+    high_water = models.DateField(null=True, blank=True)  # last fully processed day
+    locked_by = models.CharField(max_length=64, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.high_water}"
@@ -0,0 +1,24 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class DefaultCursorPagination(CursorPagination):
+    """Project default: keyset pagination on id, no COUNT(*) query."""
+    ordering = "-id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class NotificationCursorPagination(DefaultCursorPagination):
+    ordering = ("-sent_at", "-id")
+
+
+class ActivityCursorPagination(DefaultCursorPagination):
+    """Keyset pagination on (date_time, id), newest first; backed by the (schedule, date_time) index."""
+    ordering = ("-date_time", "-id")
+
+
+class PanelPagination(LimitOffsetPagination):
+    """Offset pages for per-doctor panels; the COUNT is bounded by the doctor's assigned patients."""
+    default_limit = 50
+    max_limit = 500
@@ -1,5 +1,6 @@
 from rest_framework.permissions import BasePermission
-from .models import PatientProfile, DoctorProfile, MedicationSchedule, Activity
+from .access import can_access_patient_id
+from .models import MedicationSchedule, Activity
 
 class IsAdmin(BasePermission):
     def has_permission(self, request, view):
@@ -15,21 +16,7 @@ class IsOwnerPatientOrAssignedDoctor(BasePermission):
         return request.user and request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
-        # resolve obj -> PatientProfile
-        if isinstance(obj, MedicationSchedule):
-            patient = obj.patient
-        elif isinstance(obj, Activity):
-            patient = obj.schedule.patient
-        else:
-            return request.user.role == "admin"
-
-        if request.user.role == "admin":
-            return True
-        if request.user.role == "patient":
-            return patient.user_id == request.user.id
-        if request.user.role == "doctor":
-            try:
-                return request.user.doctor_profile.patients.filter(pk=patient.pk).exists()
-            except DoctorProfile.DoesNotExist:
-                return False
-        return False
+        # both carry patient_id; no related rows are loaded
+        if isinstance(obj, (MedicationSchedule, Activity)):
+            return can_access_patient_id(request.user, obj.patient_id)
+        return request.user.role == "admin"
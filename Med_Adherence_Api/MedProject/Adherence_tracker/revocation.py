@@ -0,0 +1,177 @@
+"""
+Token revocation.
+
+Revoked tokens, refresh and access alike, are recorded in simplejwt's
+OutstandingToken/BlacklistedToken tables. Checks never query them: every
+process holds the blacklisted jtis of still-valid tokens as a sorted array of
+64-bit fingerprints (8 bytes per token), plus a small set of its own revocations
+since the last build, and the ids of deactivated users. The set is rebuilt when
+the revocation version moves, polled at most every REVOCATION_POLL_SECONDS, and
+at least every REVOCATION_REBUILD_SECONDS. The version is a counter in the
+cache when the cache is shared; a per-process cache never sees other processes
+bump it, so then the poll reads the newest blacklist row instead.
+Deactivating a user blacklists their outstanding tokens, which moves the
+version either way. prune_expired_tokens keeps the tables, and so the rebuild,
+bounded by the tokens that are still valid.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+VERSION_KEY = "revocation-version"
+
+
+def fingerprint(jti):
+    return int.from_bytes(blake2b(jti.encode(), digest_size=8).digest(), "big")
+
+
+class RevocationSet:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fingerprints = array("Q")
+        self.recent = set()
+        self.inactive = frozenset()
+        self.version = None
+        self.polled_at = self.built_at = float("-inf")
+
+    def rebuild(self, version=None):
+        with self.lock:
+            pending = set(self.recent)
+        jtis = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list(
+            "token__jti", flat=True,
+        )
+        fingerprints = array("Q", sorted(fingerprint(jti) for jti in jtis.iterator()))
+        inactive = frozenset(get_user_model().objects.filter(is_active=False).values_list("pk", flat=True))
+        with self.lock:
+            self.fingerprints = fingerprints
+            self.inactive = inactive
+            self.recent -= pending  # now part of the array
+            self.version = version
+            self.built_at = time.monotonic()
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self.polled_at < settings.REVOCATION_POLL_SECONDS:
+            return
+        self.polled_at = now
+        version = current_version()
+        if version != self.version or now - self.built_at >= settings.REVOCATION_REBUILD_SECONDS:
+            self.rebuild(version)
+
+    def add(self, jti):
+        with self.lock:
+            self.recent.add(fingerprint(jti))
+
+    def set_active(self, user_id, active):
+        with self.lock:
+            self.inactive = self.inactive - {user_id} if active else self.inactive | {user_id}
+
+    def __contains__(self, jti):
+        fp = fingerprint(jti)
+        if fp in self.recent:
+            return True
+        fingerprints = self.fingerprints
+        i = bisect_left(fingerprints, fp)
+        return i < len(fingerprints) and fingerprints[i] == fp
+
+
+def _shared_cache():
+    return not isinstance(caches["default"], LocMemCache)
+
+
+def current_version():
+    if _shared_cache():
+        return cache.get(VERSION_KEY, 0)
+    # other processes' bumps never reach a per-process cache; every revocation adds a row
+    return BlacklistedToken.objects.aggregate(newest=Max("id"))["newest"] or 0
+
+
+REVOKED = RevocationSet()
+
+
+def is_revoked(jti):
+    if not jti:
+        return False
+    REVOKED.refresh()
+    return jti in REVOKED
+
+
+def is_user_active(user_id):
+    REVOKED.refresh()
+    return user_id not in REVOKED.inactive
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+def revoke(token):
+    """Blacklist a simplejwt token (refresh or access) everywhere."""
+    jti = token[api_settings.JTI_CLAIM]
+    with transaction.atomic():
+        outstanding, _ = OutstandingToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                "user_id": token.get(api_settings.USER_ID_CLAIM),
+                "token": str(token),
+                "created_at": timezone.now(),
+                "expires_at": datetime_from_epoch(token["exp"]),
+            },
+        )
+        BlacklistedToken.objects.get_or_create(token=outstanding)
+    REVOKED.add(jti)
+    # other processes rebuild once they see the new version; again after
+    # commit, in case one rebuilt before the row was visible
+    _bump_version()
+    transaction.on_commit(_bump_version)
+
+
+def set_user_active(user_id, active):
+    """
+    Apply a user's (de)activation to the revocation set. Deactivating blacklists
+    the user's outstanding tokens, so the tokens are refused even where only the
+    blacklist table is polled; reactivation reaches such processes at their next
+    rebuild (REVOCATION_REBUILD_SECONDS).
+    """
+    if not active:
+        outstanding = OutstandingToken.objects.filter(user_id=user_id, expires_at__gt=timezone.now())
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(token_id=pk) for pk in outstanding.values_list("id", flat=True)], ignore_conflicts=True,
+        )
+    REVOKED.set_active(user_id, active)
+    _bump_version()
+    transaction.on_commit(_bump_version)
+
+
+def prune_expired_tokens(batch_size=1000, now=None):
+    """Delete expired outstanding tokens (and their blacklist rows) in id-ordered batches."""
+    now = now or timezone.now()
+    deleted, last_id = 0, 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(id__gt=last_id).order_by("id").values_list("id", "expires_at")[:batch_size]
+        )
+        if not ids:
+            return deleted
+        last_id = ids[-1][0]
+        expired = [pk for pk, expires_at in ids if expires_at <= now]
+        if expired:
+            with transaction.atomic():
+                BlacklistedToken.objects.filter(token_id__in=expired).delete()
+                OutstandingToken.objects.filter(id__in=expired).delete()
+            deleted += len(expired)
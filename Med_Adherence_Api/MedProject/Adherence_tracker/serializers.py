@@ -1,25 +1,163 @@
+import functools
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from .models import (
     User, PatientProfile, DoctorProfile,
     MedicationSchedule, Activity, Notification
 )
 
+def requested_fields(request):
+    """Field names from `?fields=a,b,c` on a read request, or None."""
+    if request is None or request.method != "GET":
+        return None
+    raw = request.query_params.get("fields")
+    if not raw:
+        return None
+    return {name.strip() for name in raw.split(",") if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """Drop serializer fields not listed in `?fields=`."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = requested_fields(self.context.get("request"))
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class EagerLoadingMixin:
+    """
+    Serializers declare the joins their output needs, as lookups relative to
+    their model; viewsets apply them through setup_eager_loading.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+        return queryset
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Resolves every submitted pk with one IN query instead of one lookup per item."""
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+
+        child = self.child_relation
+        pk_field = child.get_queryset().model._meta.pk
+        pks = []
+        for item in data:
+            if child.pk_field is not None:
+                item = child.pk_field.to_internal_value(item)
+            if isinstance(item, bool):
+                child.fail("incorrect_type", data_type=type(item).__name__)
+            try:
+                pks.append(pk_field.to_python(item))
+            except DjangoValidationError:
+                child.fail("incorrect_type", data_type=type(item).__name__)
+
+        found = child.get_queryset().in_bulk(set(pks))
+        for pk in pks:
+            if pk not in found:
+                child.fail("does_not_exist", pk_value=pk)
+        return [found[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField whose many=True form validates in a single query."""
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {"child_relation": cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class FastReadSerializer:
+    """
+    Renders `.values()` rows exactly as `serializer_class` renders model
+    instances, without instantiating models or serializers per row: each field
+    is compiled once into (output name, values column, to_representation).
+    Only flat serializers qualify (model fields and pk-related fields).
+    """
+    # to_representation is the identity for the values these fields read from the database
+    PASSTHROUGH = (serializers.IntegerField, serializers.CharField)
+
+    def __init__(self, serializer_class, fields=None):
+        serializer = serializer_class(context={})
+        opts = serializer_class.Meta.model._meta
+        self.mappers = []
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField,
+                                  serializers.SerializerMethodField)) or "." in field.source or field.source == "*":
+                raise TypeError(f"{serializer_class.__name__}.{name} is not supported by the fast read path")
+            if isinstance(field, serializers.PrimaryKeyRelatedField):
+                column = opts.get_field(field.source).attname
+                func = field.pk_field.to_representation if field.pk_field else None
+            elif isinstance(field, serializers.RelatedField):
+                raise TypeError(f"{serializer_class.__name__}.{name} is not supported by the fast read path")
+            else:
+                column = opts.get_field(field.source).attname
+                func = None if type(field) in self.PASSTHROUGH else field.to_representation
+            self.mappers.append((name, column, func))
+        self.columns = [column for _, column, _ in self.mappers]
+
+    @classmethod
+    @functools.lru_cache(maxsize=256)
+    def _compile(cls, serializer_class, fields):
+        return cls(serializer_class, fields)
+
+    @classmethod
+    def for_serializer(cls, serializer_class, fields=None):
+        reader = cls._compile(serializer_class, None)
+        if not fields:
+            return reader
+        # key on the readable fields asked for, so made-up names can't add cache entries
+        return cls._compile(serializer_class, frozenset(fields) & {name for name, _, _ in reader.mappers})
+
+    def to_representation(self, row):
+        return {
+            name: value if func is None or value is None else func(value)
+            for name, column, func in self.mappers
+            for value in (row[column],)
+        }
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
 class PatientProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = PatientProfile
         fields = ["id", "date_of_birth", "medical_history"]
 
-class DoctorProfileSerializer(serializers.ModelSerializer):
-    patients = serializers.PrimaryKeyRelatedField(queryset=PatientProfile.objects.all(), many=True, required=False)
+class DoctorProfileSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    patients = BulkPrimaryKeyRelatedField(queryset=PatientProfile.objects.all(), many=True, required=False)
+    prefetch_related_fields = ("patients",)
 
     class Meta:
         model = DoctorProfile
         fields = ["id", "specialization", "patients"]
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(EagerLoadingMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     patient_profile = PatientProfileSerializer(read_only=True)
     doctor_profile = DoctorProfileSerializer(read_only=True)
+    select_related_fields = ("patient_profile", "doctor_profile")
+    prefetch_related_fields = ("doctor_profile__patients",)
 
     class Meta:
         model = User
@@ -54,7 +192,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             )
         return user
 
-class MedicationScheduleSerializer(serializers.ModelSerializer):
+class MedicationScheduleSerializer(EagerLoadingMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = MedicationSchedule
         fields = "__all__"
@@ -65,7 +203,13 @@ class MedicationScheduleSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"end_date": "cannot be earlier than start_date"})
         return attrs
 
-class ActivitySerializer(serializers.ModelSerializer):
+class IdempotencyKeyMixin:
+    """A blank idempotency_key means no key: stored as NULL so blanks never collide."""
+    def validate_idempotency_key(self, value):
+        return value or None
+
+
+class ActivitySerializer(IdempotencyKeyMixin, EagerLoadingMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Activity
         fields = "__all__"
@@ -74,12 +218,51 @@ class ActivitySerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
         request = self.context.get("request")
 
-        if request and request.user.role == "patient":
+        if request and request.user.role == "patient" and "schedule" in self.fields:
             # Hide `schedule` field for patients (auto-linked in perform_create)
             self.fields["schedule"].read_only = True
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class ActivityBulkItemSerializer(IdempotencyKeyMixin, serializers.ModelSerializer):
+    """One entry of a bulk upload; schedule ownership is checked by the view in one query."""
+    schedule = serializers.IntegerField()
+
+    class Meta:
+        model = Activity
+        fields = ["schedule", "date_time", "status", "notes", "blood_pressure_reading", "idempotency_key"]
+        validators = []
+
+
+# ---------- CLINIC IMPORT ROWS (cross-row checks live in imports.py) ----------
+class ImportUserRowSerializer(RegisterSerializer):
+    # uniqueness is checked for the whole file in one query
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+
+    def __init__(self, *args, check_password=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not check_password:
+            self.fields["password"].validators = []
+
+
+class ImportAssignmentRowSerializer(serializers.Serializer):
+    doctor = serializers.CharField(max_length=150)
+    patient = serializers.CharField(max_length=150)
+
+
+class ImportScheduleRowSerializer(serializers.ModelSerializer):
+    patient = serializers.CharField(max_length=150)
+
+    class Meta:
+        model = MedicationSchedule
+        fields = ["patient", "medication_name", "dosage", "frequency", "start_date", "end_date"]
+
+    def validate(self, attrs):
+        if attrs["end_date"] < attrs["start_date"]:
+            raise serializers.ValidationError({"end_date": "cannot be earlier than start_date"})
+        return attrs
+
+
+class NotificationSerializer(EagerLoadingMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = "__all__"
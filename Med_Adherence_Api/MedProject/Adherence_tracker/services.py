@@ -1,13 +1,492 @@
-from datetime import timedelta
+import asyncio
+import hashlib
+import json
+import re
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from asgiref.sync import sync_to_async
+from rest_framework.utils.encoders import JSONEncoder
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
-from django.db.models import Count, Q
-from .models import Activity, PatientProfile
+from django.db import transaction
+from django.db.models import Avg, Case, Count, F, FloatField, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf, TruncDate, TruncDay, TruncMonth, TruncWeek
+from django.utils.dateparse import parse_date
+from .dosing import doses_due
+from .models import Activity, DailyAdherence, MedicationSchedule, PatientProfile
+
+ROLLUP_BATCH_SIZE = 1000
+STREAM_CHUNK_SIZE = 2000
+STREAM_FLUSH_BYTES = 64 * 1024
+MAX_RANGE_DAYS = 3660
+BUCKETS = {"day": None, "week": TruncWeek, "month": TruncMonth}
+
+
+def _rate(taken, total):
+    return round((taken / total) * 100, 2) if total else 0.0
+
+
+# ---------- TIME WINDOWS ----------
+def parse_range_days(rng):
+    """'7d', '30d', '90d' ... -> number of days. Raises ValueError otherwise."""
+    match = re.fullmatch(r"(\d+)d", rng or "")
+    if not match or not 1 <= int(match.group(1)) <= MAX_RANGE_DAYS:
+        raise ValueError(f"range must look like '7d' (1-{MAX_RANGE_DAYS} days)")
+    return int(match.group(1))
+
+
+def window_start(days):
+    """First local date of a `days`-day window ending today (today included)."""
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+def parse_window(params, default_range="30d"):
+    """
+    Resolve `?start=YYYY-MM-DD&end=YYYY-MM-DD` or `?range=Nd` into inclusive local
+    (start, end) dates. Raises ValueError on malformed or inverted input.
+    """
+    today = timezone.localdate()
+    if params.get("start") or params.get("end"):
+        start = parse_date(params["start"]) if params.get("start") else None
+        end = parse_date(params["end"]) if params.get("end") else today
+        if start is None or end is None:
+            raise ValueError("start and end must be YYYY-MM-DD dates")
+        if start > end:
+            raise ValueError("start cannot be later than end")
+        if (end - start).days > MAX_RANGE_DAYS:
+            raise ValueError(f"windows are limited to {MAX_RANGE_DAYS} days")
+        return start, end
+    days = parse_range_days(params.get("range", default_range))
+    return window_start(days), today
+
+
+def dosing_schedules(patient, start, end):
+    """(doses_per_period, period_days, start_date, end_date) of parsed schedules overlapping [start, end]."""
+    return MedicationSchedule.objects.filter(
+        patient=patient, start_date__lte=end, end_date__gte=start, doses_per_period__isnull=False,
+    ).values_list("doses_per_period", "period_days", "start_date", "end_date")
+
+
+def expected_doses(patient: PatientProfile, start, end):
+    """Doses the patient's schedules call for in [start, end]; O(schedules), no per-dose rows."""
+    schedules = dosing_schedules(patient, start, end)
+    return sum(doses_due(doses, period, s, e, start, end) for doses, period, s, e in schedules)
+
+
+async def aexpected_doses(patient, start, end):
+    total = 0
+    async for doses, period, s, e in dosing_schedules(patient, start, end):
+        total += doses_due(doses, period, s, e, start, end)
+    return total
+
+
+def _summary_window(patient, days):
+    """
+    (start, last complete day, aggregates) for the last `days` days. Today's
+    doses may not be due yet, so expected doses stop at yesterday.
+    """
+    start, today = window_start(days), timezone.localdate()
+    qs = DailyAdherence.objects.filter(patient=patient, date__gte=start)
+    aggregates = {
+        "taken_doses": Sum("taken"), "missed_doses": Sum("missed"),
+        "taken_by_yesterday": Sum("taken", filter=Q(date__lt=today)),
+    }
+    return start, today - timedelta(days=1), qs, aggregates
+
 
 def adherence_summary_for_patient(patient: PatientProfile, days: int = 7):
-    start = timezone.now() - timedelta(days=days)
-    qs = Activity.objects.filter(schedule__patient=patient, date_time__gte=start)
-    agg = qs.aggregate(total=Count("id"), taken=Count("id", filter=Q(status="taken")))
-    total = agg["total"] or 0
-    taken = agg["taken"] or 0
-    rate = round((taken / total) * 100, 2) if total else 0.0
-    return {"total": total, "taken": taken, "rate": rate}
+    start, last, qs, aggregates = _summary_window(patient, days)
+    return _summary(qs.aggregate(**aggregates), expected_doses(patient, start, last))
+
+
+async def aadherence_summary_for_patient(patient, days: int = 7):
+    """adherence_summary_for_patient with the aggregate and the schedule scan in flight together."""
+    start, last, qs, aggregates = _summary_window(patient, days)
+    agg, expected = await asyncio.gather(qs.aaggregate(**aggregates), aexpected_doses(patient, start, last))
+    return _summary(agg, expected)
+
+
+def _summary(agg, expected):
+    taken = agg["taken_doses"] or 0
+    total = taken + (agg["missed_doses"] or 0)
+    return {
+        "total": total,
+        "taken": taken,
+        "rate": _rate(taken, total),
+        "expected": expected,
+        # share of the complete days' scheduled doses actually taken; unlogged doses count against it
+        "true_rate": min(_rate(agg["taken_by_yesterday"] or 0, expected), 100.0),
+    }
+
+
+def _bucket_start(day, bucket):
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _bucket_starts(start, end, bucket):
+    current = _bucket_start(start, bucket)
+    while current <= end:
+        yield current
+        if bucket == "month":
+            current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        else:
+            current += timedelta(days=7 if bucket == "week" else 1)
+
+
+def adherence_analytics(patient: PatientProfile, start, end, bucket="day"):
+    """
+    Time-bucketed series plus per-medication breakdown for [start, end] from one
+    grouped query over the rollup. Empty buckets are reported as zeroes.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {sorted(BUCKETS)}")
+    trunc = BUCKETS[bucket]
+    rows = (
+        DailyAdherence.objects.filter(patient=patient, date__range=(start, end))
+        .annotate(bucket=trunc("date") if trunc else F("date"))
+        .values("bucket", "schedule_id", "schedule__medication_name")
+        .annotate(taken=Sum("taken"), missed=Sum("missed"))
+        .order_by()
+    )
+
+    series = {b: [0, 0] for b in _bucket_starts(start, end, bucket)}
+    medications = {}
+    for r in rows:
+        day = r["bucket"].date() if hasattr(r["bucket"], "date") else r["bucket"]
+        point = series.setdefault(day, [0, 0])
+        point[0] += r["taken"]
+        point[1] += r["taken"] + r["missed"]
+        med = medications.setdefault(r["schedule_id"], {
+            "schedule_id": r["schedule_id"], "medication_name": r["schedule__medication_name"], "taken": 0, "total": 0,
+        })
+        med["taken"] += r["taken"]
+        med["total"] += r["taken"] + r["missed"]
+
+    taken = sum(p[0] for p in series.values())
+    total = sum(p[1] for p in series.values())
+    return {
+        "start": start,
+        "end": end,
+        "bucket": bucket,
+        "total": total,
+        "taken": taken,
+        "rate": _rate(taken, total),
+        "series": [
+            {"bucket": b, "total": t, "taken": k, "rate": _rate(k, t)}
+            for b, (k, t) in sorted(series.items())
+        ],
+        "medications": [
+            {**m, "rate": _rate(m["taken"], m["total"])}
+            for m in sorted(medications.values(), key=lambda m: m["schedule_id"])
+        ],
+    }
+
+
+def adherence_panel(patient_ids, days: int = 7):
+    """
+    Taken/total/rate for many patients in one grouped query over the rollup.
+    `rate` is NULL for patients with no logged doses in the window.
+    """
+    in_window = Q(daily_adherence__date__gte=window_start(days))
+    return (
+        PatientProfile.objects.filter(pk__in=patient_ids)
+        .annotate(
+            taken=Coalesce(Sum("daily_adherence__taken", filter=in_window), 0),
+            total=Coalesce(Sum(F("daily_adherence__taken") + F("daily_adherence__missed"), filter=in_window), 0),
+        )
+        .annotate(rate=Cast(F("taken"), FloatField()) * Value(100.0) / NullIf(F("total"), 0))
+        .values("id", "user__username", "taken", "total", "rate")
+    )
+
+
+# ---------- BLOOD PRESSURE ----------
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+def _pearson(pairs):
+    n = len(pairs)
+    if n < 3:
+        return None
+    mx = sum(x for x, _ in pairs) / n
+    my = sum(y for _, y in pairs) / n
+    sxy = sum((x - mx) * (y - my) for x, y in pairs)
+    sxx = sum((x - mx) ** 2 for x, _ in pairs)
+    syy = sum((y - my) ** 2 for _, y in pairs)
+    return round(sxy / (sxx * syy) ** 0.5, 3) if sxx and syy else None
+
+
+def blood_pressure_trends(patient: PatientProfile, start, end, bucket="week"):
+    """
+    BP min/max/avg over [start, end] and per-bucket averages with that bucket's
+    adherence, aggregated in SQL (one query for the stats, one for the series).
+    `correlation` is Pearson's r between bucket adherence and average BP.
+    """
+    trunc = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}.get(bucket)
+    if trunc is None:
+        raise ValueError(f"bucket must be one of {sorted(BUCKETS)}")
+    lo, hi = local_day_bounds(start, end)
+    qs = Activity.objects.filter(patient=patient, date_time__gte=lo, date_time__lt=hi)
+
+    stats = qs.aggregate(
+        readings=Count("systolic"),
+        systolic_min=Min("systolic"), systolic_max=Max("systolic"), systolic_avg=Avg("systolic"),
+        diastolic_min=Min("diastolic"), diastolic_max=Max("diastolic"), diastolic_avg=Avg("diastolic"),
+    )
+    rows = (
+        qs.annotate(bucket=trunc("date_time"))
+        .values("bucket")
+        .annotate(
+            readings=Count("systolic"), systolic_avg=Avg("systolic"), diastolic_avg=Avg("diastolic"),
+            taken=Count("id", filter=Q(status="taken")), total=Count("id"),
+        )
+        .order_by("bucket")
+    )
+
+    series = []
+    for r in rows:
+        series.append({
+            "bucket": r["bucket"].date() if hasattr(r["bucket"], "date") else r["bucket"],
+            "readings": r["readings"],
+            "systolic_avg": _round(r["systolic_avg"]),
+            "diastolic_avg": _round(r["diastolic_avg"]),
+            "doses": r["total"],
+            "adherence_rate": _rate(r["taken"], r["total"]),
+        })
+    with_bp = [p for p in series if p["readings"]]
+    return {
+        "start": start,
+        "end": end,
+        "bucket": bucket,
+        "stats": {k: _round(v) if k.endswith("_avg") else v for k, v in stats.items()},
+        "series": series,
+        "correlation": {
+            "systolic": _pearson([(p["adherence_rate"], p["systolic_avg"]) for p in with_bp]),
+            "diastolic": _pearson([(p["adherence_rate"], p["diastolic_avg"]) for p in with_bp]),
+        },
+    }
+
+
+# ---------- SUMMARY CACHE ----------
+# Entries are namespaced by a per-patient version token plus a global one;
+# replacing a token orphans every cached range for that patient at once.
+def _version(key):
+    return cache.get_or_set(key, lambda: uuid.uuid4().hex, None)
+
+
+async def _aversion(key):
+    return await cache.aget_or_set(key, lambda: uuid.uuid4().hex, None)
+
+
+def _summary_key(patient_id, days):
+    global_v = _version("adherence-summary-version")
+    patient_v = _version(f"adherence-summary-version:{patient_id}")
+    return f"adherence-summary:{patient_id}:{days}:{global_v}:{patient_v}"
+
+
+async def _asummary_key(patient_id, days):
+    global_v, patient_v = await asyncio.gather(
+        _aversion("adherence-summary-version"), _aversion(f"adherence-summary-version:{patient_id}"),
+    )
+    return f"adherence-summary:{patient_id}:{days}:{global_v}:{patient_v}"
+
+
+def _with_etag(data):
+    return data, '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def cached_adherence_summary(patient: PatientProfile, days: int = 7):
+    """Read-through cache for adherence_summary_for_patient. Returns (data, etag)."""
+    key = _summary_key(patient.pk, days)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    entry = _with_etag(adherence_summary_for_patient(patient, days=days))
+    cache.set(key, entry, settings.ADHERENCE_SUMMARY_CACHE_TTL)
+    return entry
+
+
+async def acached_summary_hit(patient_id, days: int = 7):
+    """The cached (data, etag) for this patient and range, or None; never computes."""
+    return await cache.aget(await _asummary_key(patient_id, days))
+
+
+async def acached_adherence_summary(patient_id, days: int = 7):
+    """Async cached_adherence_summary, keyed by patient id alone."""
+    key = await _asummary_key(patient_id, days)
+    hit = await cache.aget(key)
+    if hit is not None:
+        return hit
+    entry = _with_etag(await aadherence_summary_for_patient(patient_id, days=days))
+    await cache.aset(key, entry, settings.ADHERENCE_SUMMARY_CACHE_TTL)
+    return entry
+
+
+def invalidate_adherence_summary(patient_ids=None):
+    """Drop cached summaries for these patients, or for everyone when patient_ids is None."""
+    def bump():
+        if patient_ids is None:
+            cache.set("adherence-summary-version", uuid.uuid4().hex, None)
+        else:
+            cache.set_many({f"adherence-summary-version:{pid}": uuid.uuid4().hex for pid in patient_ids}, None)
+    bump()
+    # again after commit, in case a concurrent request re-cached the old numbers
+    transaction.on_commit(bump)
+
+
+# ---------- DAILY ROLLUP ----------
+def update_rollup(added=(), removed=()):
+    """
+    Apply created/deleted activities to DailyAdherence.
+    An edited activity is passed as removed (old state) + added (new state).
+    Writes one INSERT and one UPDATE per ROLLUP_BATCH_SIZE (schedule, day) pairs.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for sign, activities in ((1, added), (-1, removed)):
+        for a in activities:
+            key = (a.patient_id, a.schedule_id, timezone.localdate(a.date_time))
+            deltas[key][0 if a.status == "taken" else 1] += sign
+
+    changed = {key: delta for key, delta in deltas.items() if any(delta)}
+    with transaction.atomic():
+        invalidate_adherence_summary({patient_id for patient_id, _, _ in deltas})
+        keys = list(changed)
+        for i in range(0, len(keys), ROLLUP_BATCH_SIZE):
+            batch = keys[i:i + ROLLUP_BATCH_SIZE]
+            # make sure every row exists (rows created concurrently are left alone),
+            # then add all the deltas in a single UPDATE
+            DailyAdherence.objects.bulk_create(
+                [DailyAdherence(patient_id=p, schedule_id=s, date=d) for p, s, d in batch], ignore_conflicts=True,
+            )
+            rows = Q()
+            for _, schedule_id, day in batch:
+                rows |= Q(schedule_id=schedule_id, date=day)
+            DailyAdherence.objects.filter(rows).update(**{
+                field: F(field) + Case(
+                    *(When(schedule_id=s, date=d, then=Value(changed[p, s, d][index])) for p, s, d in batch
+                      if changed[p, s, d][index]),
+                    default=Value(0),
+                )
+                for index, field in enumerate(("taken", "missed"))
+            })
+
+
+def local_day_bounds(start, end):
+    """Aware datetimes [start 00:00, day after end 00:00) in the current time zone."""
+    return (
+        timezone.make_aware(datetime.combine(start, time.min)),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+    )
+
+
+def local_date_range(field, start=None, end=None):
+    """
+    Q for a datetime column within the local dates [start, end], either bound
+    optional. A plain range on the column can use its indexes; `field__date` can't.
+    """
+    q = Q()
+    if start:
+        q &= Q(**{f"{field}__gte": local_day_bounds(start, start)[0]})
+    if end:
+        q &= Q(**{f"{field}__lt": local_day_bounds(end, end)[1]})
+    return q
+
+
+def parse_dates(params, *names):
+    """Optional YYYY-MM-DD query params -> dates, None where absent. Raises ValueError."""
+    dates = []
+    for name in names:
+        raw = params.get(name)
+        try:
+            value = parse_date(raw) if raw else None
+        except ValueError:
+            value = None
+        if raw and value is None:
+            raise ValueError(f"{name} must be a YYYY-MM-DD date")
+        dates.append(value)
+    return dates
+
+
+def rebuild_rollup(patient_ids=None, schedule_ids=None, start=None, end=None):
+    """
+    Recompute DailyAdherence from raw Activity rows, optionally limited to some
+    patients/schedules and to the local dates [start, end]. Returns the number of rows written.
+    """
+    activities = Activity.objects.all()
+    rollups = DailyAdherence.objects.all()
+    if patient_ids is not None:
+        activities = activities.filter(patient_id__in=patient_ids)
+        rollups = rollups.filter(patient_id__in=patient_ids)
+    if schedule_ids is not None:
+        activities = activities.filter(schedule_id__in=schedule_ids)
+        rollups = rollups.filter(schedule_id__in=schedule_ids)
+    if start is not None and end is not None:
+        lo, hi = local_day_bounds(start, end)
+        activities = activities.filter(date_time__gte=lo, date_time__lt=hi)
+        rollups = rollups.filter(date__range=(start, end))
+
+    rows = (
+        activities.annotate(day=TruncDate("date_time"))
+        .values("schedule_id", "patient_id", "day")
+        .annotate(taken=Count("id", filter=Q(status="taken")), missed=Count("id", filter=Q(status="missed")))
+        .order_by()
+    )
+
+    written = 0
+    with transaction.atomic():
+        invalidate_adherence_summary(patient_ids)
+        rollups.delete()
+        batch = []
+        for r in rows.iterator(chunk_size=ROLLUP_BATCH_SIZE):
+            batch.append(DailyAdherence(
+                patient_id=r["patient_id"], schedule_id=r["schedule_id"],
+                date=r["day"], taken=r["taken"], missed=r["missed"],
+            ))
+            if len(batch) >= ROLLUP_BATCH_SIZE:
+                DailyAdherence.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            DailyAdherence.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+# ---------- STREAMING ----------
+def iter_ndjson(queryset, serializer_class, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield one JSON line per row, reading through a server-side cursor."""
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield json.dumps(serializer_class(obj).data, cls=JSONEncoder, ensure_ascii=False) + "\n"
+
+
+def _take(iterator, size):
+    chunks, total = [], 0
+    for chunk in iterator:
+        chunks.append(chunk)
+        total += len(chunk)
+        if total >= size:
+            break
+    return chunks
+
+
+async def aiter_stream(chunks, flush_bytes=STREAM_FLUSH_BYTES):
+    """
+    Async view of a sync chunk generator that reads the database. Each step runs
+    the generator in the ORM thread until about flush_bytes are ready, so an ASGI
+    server streams it at constant memory instead of loading it whole.
+    """
+    iterator = iter(chunks)
+    take = sync_to_async(_take)
+    try:
+        while batch := await take(iterator, flush_bytes):
+            yield batch[0][:0].join(batch)
+    finally:
+        if hasattr(iterator, "close"):
+            # a disconnected client: release the cursor in the thread that opened it
+            await sync_to_async(iterator.close)()
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .access import invalidate_assignments
+from .models import DoctorProfile, MedicationSchedule, PatientProfile, User
+from .revocation import set_user_active
+from .services import invalidate_adherence_summary
+
+
+def _invalidate(doctor_user_ids):
+    doctor_user_ids = list(doctor_user_ids)
+    if doctor_user_ids:
+        invalidate_assignments(doctor_user_ids)
+        # again after commit, in case a concurrent request re-cached the old set
+        transaction.on_commit(lambda: invalidate_assignments(doctor_user_ids))
+
+
+@receiver(m2m_changed, sender=DoctorProfile.patients.through)
+def doctor_patients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # doctor.patients.add/remove/clear(...)
+        if action in ("post_add", "post_remove", "post_clear"):
+            _invalidate([instance.user_id])
+        return
+
+    # patient.doctors.add/remove/clear(...): pk_set holds DoctorProfile ids
+    if action == "pre_clear":
+        _invalidate(instance.doctors.values_list("user_id", flat=True))
+    elif action in ("post_add", "post_remove"):
+        _invalidate(DoctorProfile.objects.filter(pk__in=pk_set).values_list("user_id", flat=True))
+
+
+@receiver(pre_delete, sender=PatientProfile)
+def patient_deleted(sender, instance, **kwargs):
+    _invalidate(instance.doctors.values_list("user_id", flat=True))
+
+
+@receiver(pre_delete, sender=DoctorProfile)
+def doctor_deleted(sender, instance, **kwargs):
+    _invalidate([instance.user_id])
+
+
+@receiver(post_save, sender=MedicationSchedule)
+@receiver(post_delete, sender=MedicationSchedule)
+def schedule_changed(sender, instance, **kwargs):
+    invalidate_adherence_summary([instance.patient_id, *getattr(instance, "_moved_from", ())])
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    instance._was_active = None
+    if instance.pk and (update_fields is None or "is_active" in update_fields):
+        instance._was_active = User.objects.filter(pk=instance.pk).values_list("is_active", flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # claims-authenticated requests never load the user, so (de)activation goes through the revocation set
+    if instance._was_active is not None and instance._was_active != instance.is_active:
+        set_user_active(instance.pk, instance.is_active)
@@ -0,0 +1,125 @@
+"""
+Missed-dose detection.
+
+sweep_missed_doses compares what each active schedule calls for (its parsed
+frequency) with what was logged per day, and inserts "missed" activities for the
+shortfall. A run only covers the days after the stored high-water mark. A lease
+on the SweepState row keeps concurrent runs of the same shard apart, and
+deterministic idempotency keys make an overlapping or repeated run harmless:
+rows already recorded are neither inserted nor alerted on again.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+from .alerts import evaluate_alerts
+from .dosing import doses_due
+from .models import Activity, DailyAdherence, MedicationSchedule, PatientProfile, SweepState
+from .services import local_date_range, local_day_bounds, rebuild_rollup
+
+MISSED_NOTE = "auto: dose not logged"
+
+
+def _claim(name, worker_id, lease_seconds):
+    try:
+        SweepState.objects.get_or_create(name=name)
+    except IntegrityError:
+        pass  # created by a concurrent worker
+    now = timezone.now()
+    claimed = (
+        SweepState.objects.filter(name=name)
+        .filter(Q(locked_by="") | Q(locked_at__lt=now - timedelta(seconds=lease_seconds)))
+        .update(locked_by=worker_id, locked_at=now)
+    )
+    return SweepState.objects.get(name=name) if claimed else None
+
+
+def _sweep_chunk(patient_ids, since, until):
+    schedules = list(
+        MedicationSchedule.objects.filter(
+            patient_id__in=patient_ids, start_date__lte=until, end_date__gte=since, doses_per_period__isnull=False,
+        ).values_list("id", "patient_id", "doses_per_period", "period_days", "start_date", "end_date")
+    )
+    logged = {
+        (sid, day): n for sid, day, n in DailyAdherence.objects.filter(
+            schedule_id__in=[s[0] for s in schedules], date__range=(since, until),
+        ).annotate(n=F("taken") + F("missed")).values_list("schedule_id", "date", "n")
+    }
+
+    missing = []
+    for sid, pid, doses, period, start, end in schedules:
+        day, last = max(start, since), min(end, until)
+        while day <= last:
+            due = doses_due(doses, period, start, end, day, day)
+            end_of_day = local_day_bounds(day, day)[1] - timedelta(seconds=1)
+            for k in range(logged.get((sid, day), 0), due):
+                missing.append(Activity(
+                    schedule_id=sid, patient_id=pid, status="missed", date_time=end_of_day, notes=MISSED_NOTE,
+                    idempotency_key=f"missed:{day.isoformat()}:{k}",
+                ))
+            day += timedelta(days=1)
+    if not missing:
+        return 0
+
+    schedule_ids = {a.schedule_id for a in missing}
+    with transaction.atomic():
+        # an overlapping sweep of these schedules waits here (PostgreSQL), so the keys read below are current
+        list(MedicationSchedule.objects.select_for_update().filter(pk__in=schedule_ids).values_list("pk"))
+        stored = set(
+            Activity.objects.filter(
+                local_date_range("date_time", since, until), schedule_id__in=schedule_ids,
+                idempotency_key__startswith="missed:",
+            ).values_list("schedule_id", "idempotency_key")
+        )
+        # rows an earlier run already recorded are skipped, and raise no second alert
+        inserted = [a for a in missing if (a.schedule_id, a.idempotency_key) not in stored]
+        Activity.objects.bulk_create(inserted, ignore_conflicts=True, batch_size=1000)
+        rebuild_rollup(
+            patient_ids={a.patient_id for a in missing}, schedule_ids=schedule_ids, start=since, end=until,
+        )
+        # backfilled rows are dated at the end of past days, after doses the patient may have
+        # logged since, so the consecutive-missed counter is recounted rather than advanced
+        evaluate_alerts([(a.patient_id, "missed", a.date_time) for a in inserted], recount=True)
+    return len(inserted)
+
+
+def sweep_missed_doses(worker_id, until=None, chunk_size=500, shard=(0, 1), lookback_days=None):
+    """
+    Record missed doses for the complete days after the high-water mark, up to
+    `until` (default yesterday). Returns None if another worker holds this shard.
+    """
+    index, count = shard
+    name = "missed-doses" if count == 1 else f"missed-doses:{index}/{count}"
+    state = _claim(name, worker_id, settings.SWEEP_LEASE_SECONDS)
+    if state is None:
+        return None
+
+    try:
+        until = until or timezone.localdate() - timedelta(days=1)
+        lookback_days = lookback_days or settings.MISSED_DOSE_LOOKBACK_DAYS
+        since = state.high_water + timedelta(days=1) if state.high_water else until - timedelta(days=lookback_days - 1)
+        created = 0
+        if since <= until:
+            patients = PatientProfile.objects.filter(
+                schedules__start_date__lte=until, schedules__end_date__gte=since,
+                schedules__doses_per_period__isnull=False,
+            )
+            if count > 1:
+                patients = patients.annotate(shard=Mod("id", count)).filter(shard=index)
+            patients = patients.values_list("id", flat=True).distinct().order_by("id")
+
+            last_id = 0
+            while True:
+                chunk = list(patients.filter(id__gt=last_id)[:chunk_size])
+                if not chunk:
+                    break
+                created += _sweep_chunk(chunk, since, until)
+                last_id = chunk[-1]
+                # keep the lease alive on long sweeps
+                SweepState.objects.filter(pk=state.pk, locked_by=worker_id).update(locked_at=timezone.now())
+            SweepState.objects.filter(pk=state.pk, locked_by=worker_id).update(high_water=until)
+        return {"since": since, "until": until, "created": created}
+    finally:
+        SweepState.objects.filter(pk=state.pk, locked_by=worker_id).update(locked_by="", locked_at=None)
@@ -1,3 +1,1385 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+import warnings
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.test import AsyncClient, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from . import metrics
+from .access import Assignment, _cache_key, assigned_patient_ids
+from .authentication import ClaimsRefreshToken
+from .dosing import doses_due, parse_frequency
+from .explain import HOT_QUERIES
+from .exports import EXPORT_COLUMNS
+from .imports import ClinicImport, import_clinic
+from .jobs import release_stale
+from .models import (
+    Activity, DailyAdherence, DoctorProfile, Job, MedicationSchedule, Notification, PatientAlertState, PatientProfile,
+    SweepState, User,
+)
+from .revocation import RevocationSet, prune_expired_tokens
+from .serializers import DoctorProfileSerializer, FastReadSerializer
+from .services import expected_doses, parse_window, rebuild_rollup
+from .sweeps import sweep_missed_doses
+from .vitals import parse_blood_pressure
 
-# Create your tests here.
+
+# ---------- QUERY BUDGETS ----------
+def make_users(case, n):
+    """n doctors, each with two assigned patients, so every nested serializer has data."""
+    for i in range(n):
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username=f"doc{i}", role="doctor"))
+        doctor.patients.add(*(
+            PatientProfile.objects.create(user=User.objects.create(username=f"pat{i}-{k}", role="patient"))
+            for k in range(2)
+        ))
+
+
+def make_activities(case, n):
+    Activity.objects.bulk_create(
+        Activity(
+            schedule=case.schedule, patient=case.patient, status="taken", date_time=timezone.now() - timedelta(hours=i),
+        )
+        for i in range(n)
+    )
+
+
+def make_notifications(case, n):
+    Notification.objects.bulk_create(
+        Notification(patient=case.patient, recipient=case.patient.user, message=f"m{i}", sent_at=timezone.now())
+        for i in range(n)
+    )
+
+
+Budget = namedtuple("Budget", "name url role factory max_queries")
+
+# Each list endpoint must stay within max_queries whether it returns 1, 10 or 100 objects.
+QUERY_BUDGETS = [
+    Budget("users", "/api/users/", "admin", make_users, 2),                    # users + doctor patients
+    Budget("activities (admin)", "/api/activities/", "admin", make_activities, 1),
+    Budget("activities (patient)", "/api/activities/", "patient", make_activities, 1),
+    Budget("activities (doctor)", "/api/activities/", "doctor", make_activities, 2),  # + assignments
+    Budget("notifications", "/api/notifications/", "admin", make_notifications, 1),
+]
+LIST_SIZES = (1, 10, 100)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()  # assignment/summary caches would hide queries
+        self.admin = User.objects.create(username="admin", role="admin")
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.doctor = DoctorProfile.objects.create(user=User.objects.create(username="doctor", role="doctor"))
+        self.doctor.patients.add(self.patient)
+        self.schedule = MedicationSchedule.objects.create(
+            patient=self.patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+            start_date=date.today() - timedelta(days=30), end_date=date.today() + timedelta(days=30),
+        )
+        self.users = {"admin": self.admin, "patient": self.patient.user, "doctor": self.doctor.user}
+
+    def assertWithinBudget(self, budget, n):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.users[budget.role].pk))
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(budget.url, {"page_size": 500})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertGreaterEqual(len(response.json()["results"]), n)
+        if len(ctx.captured_queries) > budget.max_queries:
+            sql = "\n".join(f"  {i}. {q['sql']}" for i, q in enumerate(ctx.captured_queries, 1))
+            self.fail(
+                f"{budget.name}: {len(ctx.captured_queries)} queries for {n} objects "
+                f"(budget {budget.max_queries}):\n{sql}"
+            )
+
+    def test_list_endpoints_stay_within_query_budget(self):
+        for budget in QUERY_BUDGETS:
+            for n in LIST_SIZES:
+                with self.subTest(endpoint=budget.name, objects=n), transaction.atomic():
+                    budget.factory(self, n)
+                    self.assertWithinBudget(budget, n)
+                    transaction.set_rollback(True)
+
+
+class BulkRelatedFieldTests(TestCase):
+    def setUp(self):
+        self.doctor = DoctorProfile.objects.create(user=User.objects.create(username="doctor", role="doctor"))
+        User.objects.bulk_create(User(username=f"pat{i}", role="patient") for i in range(500))
+        PatientProfile.objects.bulk_create(PatientProfile(user=u) for u in User.objects.filter(role="patient"))
+        self.patient_ids = list(PatientProfile.objects.values_list("id", flat=True))
+
+    def test_assigning_many_patients_validates_in_one_query(self):
+        ser = DoctorProfileSerializer(self.doctor, data={"patients": self.patient_ids}, partial=True)
+        with self.assertNumQueries(1):
+            self.assertTrue(ser.is_valid(), ser.errors)
+        self.assertEqual([p.pk for p in ser.validated_data["patients"]], self.patient_ids)
+
+    def test_unknown_and_malformed_ids_are_rejected(self):
+        missing = max(self.patient_ids) + 1
+        ser = DoctorProfileSerializer(self.doctor, data={"patients": [self.patient_ids[0], missing]}, partial=True)
+        self.assertFalse(ser.is_valid())
+        self.assertIn(str(missing), str(ser.errors["patients"]))
+        ser = DoctorProfileSerializer(self.doctor, data={"patients": ["abc"]}, partial=True)
+        self.assertFalse(ser.is_valid())
+
+
+class FastReadSerializerTests(TestCase):
+    def setUp(self):
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        schedule = MedicationSchedule.objects.create(
+            patient=self.patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+            start_date=date.today() - timedelta(days=30), end_date=date.today() + timedelta(days=30),
+        )
+        for i in range(30):
+            Activity.objects.create(
+                schedule=schedule, status="missed" if i % 3 else "taken", notes="ünïcode" if i % 2 else "",
+                date_time=timezone.now() - timedelta(hours=i, microseconds=i),
+                blood_pressure_reading="128/84" if i % 4 else "",
+                idempotency_key=f"k{i}" if i % 5 else None,
+            )
+        Notification.objects.create(patient=self.patient, message="hi", sent_at=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+
+    def test_fast_path_renders_identical_json(self):
+        urls = [
+            "/api/activities/?page_size=10",
+            "/api/activities/?fields=status,notes",
+            "/api/activities/?fields=status,bogus",
+            "/api/notifications/",
+            f"/api/patients/{self.patient.pk}/adherence/history/?page_size=7",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                fast = self.client.get(url)
+                with self.settings(FAST_READ_SERIALIZERS=False):
+                    slow = self.client.get(url)
+                self.assertEqual(fast.status_code, 200)
+                self.assertEqual(fast.content, slow.content)
+                next_url = fast.json().get("next")
+                if next_url:
+                    with self.settings(FAST_READ_SERIALIZERS=False):
+                        slow = self.client.get(next_url)
+                    self.assertEqual(self.client.get(next_url).content, slow.content)
+
+    def test_unknown_fields_do_not_grow_the_cache(self):
+        self.client.get("/api/activities/?fields=status")
+        size = FastReadSerializer._compile.cache_info().currsize
+        for i in range(50):
+            response = self.client.get(f"/api/activities/?fields=status,bogus{i}")
+            self.assertEqual(set(response.json()["results"][0]), {"status"})
+        self.assertEqual(FastReadSerializer._compile.cache_info().currsize, size)
+        # no known field at all renders empty objects, as the serializer does
+        self.assertEqual(self.client.get("/api/activities/?fields=bogus").json()["results"][0], {})
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("patient", password="Str0ng-pass!", role="patient")
+        self.patient = PatientProfile.objects.create(user=self.user)
+        self.client = APIClient()
+        tokens = self.client.post(
+            "/api/auth/login/", {"username": "patient", "password": "Str0ng-pass!"}, format="json",
+        ).json()["tokens"]
+        self.refresh, self.access = tokens["refresh"], tokens["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+    def test_authenticated_read_runs_no_auth_queries(self):
+        self.client.get("/api/activities/")  # may (re)build the revocation set
+        with self.assertNumQueries(1):  # the activity page itself
+            response = self.client.get("/api/activities/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_reflects_stored_user(self):
+        self.user.email = "p@example.com"
+        self.user.save()
+        profile = self.client.get("/api/auth/profile/").json()["profile"]
+        self.assertEqual(profile["email"], "p@example.com")
+        self.assertEqual(profile["patient_profile"]["id"], self.patient.pk)
+
+    def test_logout_revokes_access_token(self):
+        response = self.client.post("/api/auth/logout/", {"refresh": self.refresh}, format="json")
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.client.get("/api/activities/").status_code, 401)
+        response = self.client.post("/api/auth/token/refresh/", {"refresh": self.refresh}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_revocation_reaches_a_warm_set_without_a_shared_cache(self):
+        other = RevocationSet()  # another worker's set, built before the logout
+        other.refresh()
+        self.client.post("/api/auth/logout/", {"refresh": self.refresh}, format="json")
+        cache.clear()  # that worker's own cache never saw this one bump the version
+        with self.settings(REVOCATION_POLL_SECONDS=0):
+            other.refresh()
+        self.assertIn(AccessToken(self.access, verify=False)["jti"], other)
+
+    def test_revocation_reaches_a_warm_set_through_a_shared_cache(self):
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                                               "LOCATION": "test_cache"}}, REVOCATION_POLL_SECONDS=0):
+            call_command("createcachetable", verbosity=0)
+            other = RevocationSet()
+            other.refresh()
+            self.client.post("/api/auth/logout/", {"refresh": self.refresh}, format="json")
+            with self.assertNumQueries(3):  # the cache, then the blacklist and the inactive users
+                other.refresh()
+        self.assertIn(AccessToken(self.access, verify=False)["jti"], other)
+
+    def test_claims_path_rejects_a_token_blacklisted_elsewhere(self):
+        self.client.get("/api/activities/")
+        # another worker's logout: the rows exist, this process's set never heard of them
+        token = AccessToken(self.access, verify=False)
+        outstanding = OutstandingToken.objects.create(
+            jti=token["jti"], user=self.user, token=self.access, expires_at=timezone.now() + timedelta(minutes=5),
+        )
+        BlacklistedToken.objects.create(token=outstanding)
+        with self.settings(REVOCATION_POLL_SECONDS=0):
+            response = self.client.get("/api/activities/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_user_is_rejected_by_every_worker(self):
+        other = RevocationSet()
+        other.refresh()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/activities/").status_code, 401)
+        cache.clear()
+        with self.settings(REVOCATION_POLL_SECONDS=0):
+            other.refresh()
+        self.assertIn(self.user.pk, other.inactive)
+        self.assertIn(RefreshToken(self.refresh, verify=False)["jti"], other)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.client.get("/api/activities/").status_code, 200)
+
+    def test_prune_keeps_unexpired_tokens(self):
+        self.client.post("/api/auth/logout/", {"refresh": self.refresh}, format="json")
+        now = timezone.now()
+        self.assertEqual(prune_expired_tokens(batch_size=1, now=now), 0)
+        self.assertEqual(prune_expired_tokens(batch_size=1, now=now + timedelta(days=8)), 2)
+        self.assertFalse(OutstandingToken.objects.exists())
+
+    def test_refresh_picks_up_role_change(self):
+        User.objects.filter(pk=self.user.pk).update(role="admin")
+        access = self.client.post("/api/auth/token/refresh/", {"refresh": self.refresh}, format="json").json()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(self.client.get("/api/_metrics/").status_code, 200)
+
+    def test_patient_reads_own_summary(self):
+        response = self.client.get(f"/api/patients/{self.patient.pk}/adherence/summary/")
+        self.assertEqual(response.status_code, 200)
+
+
+# ---------- DATE RANGE FILTERS ----------
+class DateRangeFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        schedule = MedicationSchedule.objects.create(
+            patient=self.patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+            start_date=date(2025, 1, 1), end_date=date(2025, 12, 31),
+        )
+        # local (America/Chicago) evening of March 3rd is already March 4th in UTC
+        for day, hour, state in ((3, 23, "taken"), (4, 0, "missed"), (2, 12, "missed")):
+            Activity.objects.create(
+                schedule=schedule, status=state,
+                date_time=timezone.make_aware(datetime(2025, 3, day, hour, 30)),
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+
+    def test_history_window_is_local_days(self):
+        response = self.client.get(
+            f"/api/patients/{self.patient.pk}/adherence/history/", {"start": "2025-03-03", "end": "2025-03-03"},
+        )
+        self.assertEqual([a["status"] for a in response.json()["results"]], ["taken"])
+        response = self.client.get(f"/api/patients/{self.patient.pk}/adherence/history/", {"start": "2025-02-30"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_activity_list_filters_status_and_dates(self):
+        response = self.client.get("/api/activities/", {"status": "missed", "start": "2025-03-03"})
+        self.assertEqual([a["status"] for a in response.json()["results"]], ["missed"])
+        self.assertEqual(self.client.get("/api/activities/", {"end": "March"}).status_code, 400)
+
+
+# ---------- ANALYTICS ----------
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.schedules = [
+            MedicationSchedule.objects.create(
+                patient=self.patient, medication_name=name, dosage="5mg", frequency=frequency,
+                start_date=start, end_date=date(2025, 12, 31),
+            )
+            for name, frequency, start in (
+                ("Amlodipine", "twice daily", date(2025, 3, 5)),
+                ("Lisinopril", "weekly", date(2025, 3, 1)),
+                ("Ibuprofen", "as needed", date(2025, 3, 1)),
+            )
+        ]
+        amlodipine, lisinopril, _ = self.schedules
+        # local times; the first and last are already the next day in UTC
+        for schedule, (month, day, hour), state in (
+            (amlodipine, (3, 9, 23), "taken"),       # Sunday
+            (amlodipine, (3, 10, 0), "missed"),      # Monday
+            (lisinopril, (3, 10, 12), "taken"),
+            (amlodipine, (3, 31, 23), "taken"),
+        ):
+            Activity.objects.create(
+                schedule=schedule, status=state, date_time=timezone.make_aware(datetime(2025, month, day, hour, 30)),
+            )
+        rebuild_rollup()
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+        self.url = f"/api/patients/{self.patient.pk}/adherence/analytics/"
+
+    def analytics(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_parse_window(self):
+        today = timezone.localdate()
+        self.assertEqual(parse_window({}), (today - timedelta(days=29), today))
+        self.assertEqual(parse_window({"range": "7d"}), (today - timedelta(days=6), today))
+        self.assertEqual(parse_window({"start": "2025-03-01", "end": "2025-03-31"}), (date(2025, 3, 1), date(2025, 3, 31)))
+        self.assertEqual(parse_window({"start": str(today - timedelta(days=3))}), (today - timedelta(days=3), today))
+        for params in (
+            {"range": "7"}, {"range": "0d"}, {"range": "9999d"}, {"start": "March"}, {"end": "2025-03-01"},
+            {"start": "2025-03-10", "end": "2025-03-01"}, {"start": "2000-01-01", "end": "2025-01-01"},
+        ):
+            with self.subTest(params=params):
+                with self.assertRaises(ValueError):
+                    parse_window(params)
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"bucket": "hour"}).status_code, 400)
+
+    def test_buckets_follow_local_days(self):
+        data = self.analytics(start="2025-03-09", end="2025-03-10")
+        self.assertEqual(
+            [(p["bucket"], p["taken"], p["total"]) for p in data["series"]],
+            [("2025-03-09", 1, 1), ("2025-03-10", 1, 2)],
+        )
+        data = self.analytics(start="2025-03-01", end="2025-03-31", bucket="week")
+        self.assertEqual(
+            [(p["bucket"], p["taken"], p["total"]) for p in data["series"]],
+            [("2025-02-24", 0, 0), ("2025-03-03", 1, 1), ("2025-03-10", 1, 2), ("2025-03-17", 0, 0),
+             ("2025-03-24", 0, 0), ("2025-03-31", 1, 1)],
+        )
+        data = self.analytics(start="2025-03-01", end="2025-03-31", bucket="month")
+        self.assertEqual([(p["bucket"], p["taken"], p["total"], p["rate"]) for p in data["series"]],
+                         [("2025-03-01", 3, 4, 75.0)])
+        self.assertEqual(
+            [(m["medication_name"], m["taken"], m["total"], m["rate"]) for m in data["medications"]],
+            [("Amlodipine", 2, 3, 66.67), ("Lisinopril", 1, 1, 100.0)],
+        )
+
+    def test_expected_doses_count_parsed_schedules_from_their_start(self):
+        # twice daily from the 5th: 27 days; weekly from the 1st: the 1st, 8th, 15th, 22nd and 29th;
+        # "as needed" isn't a dosing frequency
+        self.assertEqual(expected_doses(self.patient, date(2025, 3, 1), date(2025, 3, 31)), 27 * 2 + 5)
+        self.assertEqual(expected_doses(self.patient, date(2025, 3, 1), date(2025, 3, 4)), 1)
+        self.assertEqual(expected_doses(self.patient, date(2026, 1, 1), date(2026, 1, 31)), 0)
+
+
+# ---------- ASYNC VIEWS ----------
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.other = PatientProfile.objects.create(user=User.objects.create(username="other", role="patient"))
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username="doctor", role="doctor"))
+        doctor.patients.add(self.patient)
+        token = ClaimsRefreshToken.for_user(doctor.user).access_token
+        self.headers = {"Authorization": f"Bearer {token}"}
+        token = ClaimsRefreshToken.for_user(User.objects.create(username="admin", role="admin")).access_token
+        self.admin_headers = {"Authorization": f"Bearer {token}"}
+
+    async def test_doctor_reads_assigned_patients_only(self):
+        client = AsyncClient()
+        response = await client.get(f"/api/patients/{self.patient.pk}/adherence/summary/", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = await client.get(f"/api/patients/{self.other.pk}/adherence/history/", headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+        response = await client.get("/api/patients/0/adherence/summary/", headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        response = await client.get("/api/doctors/me/adherence/", headers=self.headers)
+        self.assertEqual([row["patient_id"] for row in response.json()["results"]], [self.patient.pk])
+
+    async def test_streams_are_async_under_asgi(self):
+        schedule = await MedicationSchedule.objects.acreate(
+            patient=self.patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+            start_date=date.today() - timedelta(days=30), end_date=date.today() + timedelta(days=30),
+        )
+        for i in range(5):
+            await Activity.objects.acreate(schedule=schedule, status="taken", date_time=timezone.now() - timedelta(hours=i))
+        client = AsyncClient()
+        requests = [
+            (f"/api/patients/{self.patient.pk}/adherence/history/?stream=ndjson", self.headers, 5),
+            ("/api/exports/activities/?output=ndjson", self.admin_headers, 5),
+            ("/api/exports/activities/", self.admin_headers, 6),  # csv header
+        ]
+        for url, headers, lines in requests:
+            with self.subTest(url=url), warnings.catch_warnings():
+                # Django warns when it has to load a sync iterator whole to serve it over ASGI
+                warnings.filterwarnings("error", message="StreamingHttpResponse must consume")
+                response = await client.get(url, headers=headers)
+                self.assertTrue(response.is_async)
+                body = b"".join([chunk async for chunk in response.streaming_content])
+            self.assertEqual(len(body.splitlines()), lines)
+
+
+# ---------- IDEMPOTENCY KEYS ----------
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.schedule = MedicationSchedule.objects.create(
+            patient=self.patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+            start_date=date.today() - timedelta(days=30), end_date=date.today() + timedelta(days=30),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+
+    def test_blank_keys_are_no_keys(self):
+        for _ in range(2):
+            response = self.client.post(
+                "/api/activities/", {"schedule": self.schedule.pk, "status": "taken", "idempotency_key": ""},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201, response.content)
+        items = [{"schedule": self.schedule.pk, "status": "taken", "idempotency_key": ""}] * 2
+        response = self.client.post("/api/activities/bulk/", items, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertEqual(Activity.objects.filter(idempotency_key__isnull=True).count(), 4)
+
+    def test_reused_key_is_rejected(self):
+        data = {"schedule": self.schedule.pk, "status": "taken", "idempotency_key": "k1"}
+        self.assertEqual(self.client.post("/api/activities/", data, format="json").status_code, 201)
+        response = self.client.post("/api/activities/", data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("idempotency_key", response.json())
+        response = self.client.post("/api/activities/bulk/", [data], format="json")
+        self.assertEqual(response.json()["results"][0]["status"], "duplicate")
+
+# ---------- DAILY ROLLUP ----------
+class RollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.other = PatientProfile.objects.create(user=User.objects.create(username="other", role="patient"))
+        self.schedules = [
+            MedicationSchedule.objects.create(
+                patient=self.patient, medication_name=name, dosage="5mg", frequency="once daily",
+                start_date=date.today() - timedelta(days=30), end_date=date.today() + timedelta(days=30),
+            )
+            for name in ("Amlodipine", "Lisinopril")
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+
+    def assertRollupMatchesActivities(self):
+        recount = {
+            (r["schedule_id"], r["patient_id"], r["day"]): (r["taken"], r["missed"])
+            for r in Activity.objects.annotate(day=TruncDate("date_time")).values("schedule_id", "patient_id", "day")
+            .annotate(taken=Count("id", filter=Q(status="taken")), missed=Count("id", filter=Q(status="missed")))
+            .order_by()
+        }
+        rollup = {
+            (r.schedule_id, r.patient_id, r.date): (r.taken, r.missed)
+            for r in DailyAdherence.objects.all() if r.taken or r.missed
+        }
+        self.assertEqual(rollup, recount)
+
+    def log(self, schedule, state, days_ago=0):
+        when = timezone.now() - timedelta(days=days_ago)
+        response = self.client.post(
+            "/api/activities/", {"schedule": schedule.pk, "status": state, "date_time": when.isoformat()}, format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["data"]["id"]
+
+    def test_rollup_follows_creates_updates_and_deletes(self):
+        first = self.log(self.schedules[0], "taken")
+        self.log(self.schedules[0], "missed", days_ago=1)
+        second = self.log(self.schedules[1], "taken", days_ago=2)
+        self.assertRollupMatchesActivities()
+
+        self.client.patch(f"/api/activities/{first}/", {"status": "missed"}, format="json")
+        self.client.patch(
+            f"/api/activities/{second}/",
+            {"schedule": self.schedules[0].pk, "date_time": timezone.now().isoformat()}, format="json",
+        )
+        self.assertRollupMatchesActivities()
+
+        self.assertEqual(self.client.delete(f"/api/activities/{first}/").status_code, 200)
+        self.assertRollupMatchesActivities()
+
+    def test_rollup_follows_bulk_uploads(self):
+        items = [
+            {"schedule": s.pk, "status": "taken" if i % 3 else "missed",
+             "date_time": (timezone.now() - timedelta(days=i % 5)).isoformat()}
+            for i, s in enumerate(self.schedules * 10)
+        ]
+        response = self.client.post("/api/activities/bulk/", items, format="json")
+        self.assertEqual(response.json()["created"], 20)
+        self.assertRollupMatchesActivities()
+
+    def test_bulk_upload_writes_the_rollup_in_constant_queries(self):
+        def upload(days):
+            items = [
+                {"schedule": s.pk, "status": "taken" if i % 3 else "missed",
+                 "date_time": (timezone.now() - timedelta(days=i % days)).isoformat()}
+                for i, s in enumerate(self.schedules * days)
+            ]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post("/api/activities/bulk/", items, format="json")
+            self.assertEqual(response.json()["created"], 2 * days)
+            return len(ctx.captured_queries)
+
+        with self.settings(ADHERENCE_ALERT_RULES=[]):  # alerts have their own, per-patient queries
+            # schedules, activity insert, rollup insert + update, and three savepoints
+            self.assertEqual(upload(30), 10)
+            self.assertRollupMatchesActivities()
+            self.assertEqual(upload(1), 10)
+            self.assertEqual(upload(30), 10)  # every row exists now, so these are updates
+        self.assertRollupMatchesActivities()
+
+    def test_reassigned_schedule_moves_its_rollup(self):
+        self.log(self.schedules[0], "taken")
+        schedule = MedicationSchedule.objects.get(pk=self.schedules[0].pk)
+        schedule.patient = self.other
+        schedule.save()
+        self.assertRollupMatchesActivities()
+        self.assertFalse(DailyAdherence.objects.filter(schedule=schedule, patient=self.patient).exists())
+
+    def test_summary_is_cached_with_an_etag(self):
+        url = f"/api/patients/{self.patient.pk}/adherence/summary/"
+        self.log(self.schedules[0], "taken")
+        first = self.client.get(url)
+        self.assertEqual(first.json()["taken_doses"], 1)
+        with self.assertNumQueries(1):  # the patient lookup; the summary comes from the cache
+            cached = self.client.get(url)
+        self.assertEqual(cached["ETag"], first["ETag"])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+        # a new activity drops the cached summary, so the old ETag no longer matches
+        self.log(self.schedules[0], "taken")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["taken_doses"], 2)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+
+
+    def test_summary_window_is_the_last_n_days(self):
+        self.schedules[1].delete()
+        schedule = self.schedules[0]
+        schedule.frequency = "twice daily"
+        schedule.save()
+        for days_ago in range(8):  # the 8th day back is outside 7d
+            for _ in range(2):
+                Activity.objects.create(schedule=schedule, status="taken", date_time=timezone.now() - timedelta(days=days_ago))
+        rebuild_rollup()
+        data = self.client.get(f"/api/patients/{self.patient.pk}/adherence/summary/", {"range": "7d"}).json()
+        self.assertEqual(data["taken_doses"], 14)
+        self.assertEqual(data["expected_doses"], 12)  # today's doses aren't all due yet
+        self.assertEqual(data["true_adherence_rate"], "100.00%")
+
+# ---------- ASSIGNMENTS ----------
+class AssignmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.doctor = DoctorProfile.objects.create(user=User.objects.create(username="doctor", role="doctor"))
+        self.doctor.patients.add(self.patient)
+
+    def test_per_process_cache_only_memoises_per_request(self):
+        self.assertEqual(assigned_patient_ids(User.objects.get(pk=self.doctor.user_id)), {self.patient.pk})
+        self.assertIsNone(cache.get(_cache_key(self.doctor.user_id)))
+
+    def test_shared_cache_keeps_the_set_between_requests(self):
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                                               "LOCATION": "test_cache"}}):
+            call_command("createcachetable", verbosity=0)
+            assigned_patient_ids(User.objects.get(pk=self.doctor.user_id))
+            self.assertEqual(cache.get(_cache_key(self.doctor.user_id)), {self.patient.pk})
+            self.doctor.patients.remove(self.patient)
+            self.assertEqual(assigned_patient_ids(User.objects.get(pk=self.doctor.user_id)), set())
+
+
+# ---------- DOCTOR PANEL ----------
+class DoctorPanelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username="doctor", role="doctor"))
+        self.patients = {}
+        for name, statuses in (("steady", ["taken"] * 4), ("slipping", ["taken", "missed"]), ("silent", [])):
+            patient = PatientProfile.objects.create(user=User.objects.create(username=name, role="patient"))
+            doctor.patients.add(patient)
+            schedule = MedicationSchedule.objects.create(
+                patient=patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+                start_date=date.today() - timedelta(days=30), end_date=date.today() + timedelta(days=30),
+            )
+            for state in statuses:
+                Activity.objects.create(schedule=schedule, status=state)
+            self.patients[name] = patient.pk
+        rebuild_rollup()
+        self.client = APIClient()
+        self.client.force_authenticate(doctor.user)
+
+    def panel(self, **params):
+        response = self.client.get("/api/doctors/me/adherence/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row["username"]: row["adherence_rate"] for row in response.json()["results"]}
+
+    def test_max_rate_includes_patients_without_logged_doses(self):
+        self.assertEqual(self.panel(max_rate=80), {"slipping": "50.00%", "silent": None})
+        self.assertEqual(self.panel(min_rate=60), {"steady": "100.00%"})
+
+
+# ---------- JOBS ----------
+class JobLeaseTests(TestCase):
+    def test_stale_jobs_are_requeued_until_out_of_attempts(self):
+        expired = timezone.now() - timedelta(hours=1)
+        retry = Job.objects.create(kind="k", status="running", attempts=2, locked_by="w1", locked_at=expired)
+        spent = Job.objects.create(kind="k", status="running", attempts=5, locked_by="w1", locked_at=expired)
+        live = Job.objects.create(kind="k", status="running", attempts=5, locked_by="w2", locked_at=timezone.now())
+
+        self.assertEqual(release_stale(lease_seconds=300), 1)
+        statuses = dict(Job.objects.values_list("id", "status"))
+        self.assertEqual(statuses, {retry.pk: "queued", spent.pk: "failed", live.pk: "running"})
+
+
+# ---------- MISSED-DOSE SWEEP ----------
+class SweepTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.until = timezone.localdate() - timedelta(days=1)
+        self.patients = []
+        for i in range(4):
+            patient = PatientProfile.objects.create(user=User.objects.create(username=f"pat{i}", role="patient"))
+            MedicationSchedule.objects.create(
+                patient=patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+                start_date=self.until - timedelta(days=30), end_date=self.until + timedelta(days=30),
+            )
+            self.patients.append(patient.pk)
+        # the first patient logged the last day's dose
+        Activity.objects.create(
+            schedule=MedicationSchedule.objects.get(patient_id=self.patients[0]), status="taken",
+            date_time=timezone.make_aware(datetime.combine(self.until, datetime.min.time().replace(hour=9))),
+        )
+        rebuild_rollup()
+
+    def sweep(self, worker="w1", **kwargs):
+        return sweep_missed_doses(worker, until=self.until, lookback_days=3, **kwargs)
+
+    def test_sweep_records_missed_doses_up_to_the_high_water_mark(self):
+        self.assertEqual(self.sweep()["created"], 4 * 3 - 1)
+        self.assertEqual(SweepState.objects.get(name="missed-doses").high_water, self.until)
+        self.assertEqual(DailyAdherence.objects.filter(missed=1).count(), 4 * 3 - 1)
+        # nothing left to do until another day completes
+        result = self.sweep()
+        self.assertGreater(result["since"], result["until"])
+        self.assertEqual(result["created"], 0)
+
+    def test_rerun_neither_inserts_nor_alerts_again(self):
+        self.sweep()
+        counters = dict(PatientAlertState.objects.values_list("patient_id", "consecutive_missed"))
+        notifications = Notification.objects.count()
+        # an overlapping run: the mark is back and the rollup doesn't show the sweep's rows yet
+        SweepState.objects.update(high_water=None)
+        DailyAdherence.objects.filter(taken=0).delete()
+
+        self.assertEqual(self.sweep()["created"], 0)
+        self.assertEqual(dict(PatientAlertState.objects.values_list("patient_id", "consecutive_missed")), counters)
+        self.assertEqual(Notification.objects.count(), notifications)
+        self.assertEqual(DailyAdherence.objects.filter(missed=1).count(), 4 * 3 - 1)
+
+    def test_taken_doses_between_missed_days_break_the_run(self):
+        # the second patient took the middle day's dose but missed the days around it
+        Activity.objects.create(
+            schedule=MedicationSchedule.objects.get(patient_id=self.patients[1]), status="taken",
+            date_time=timezone.make_aware(datetime.combine(self.until - timedelta(days=1), datetime.min.time().replace(hour=9))),
+        )
+        rebuild_rollup()
+        with self.settings(ADHERENCE_ALERT_RULES=[CONSECUTIVE_MISSED]):
+            self.sweep()
+        counters = dict(PatientAlertState.objects.values_list("patient_id", "consecutive_missed"))
+        self.assertEqual([counters[pid] for pid in self.patients], [0, 1, 3, 3])
+        self.assertEqual(
+            set(Notification.objects.values_list("patient_id", flat=True)), set(self.patients[2:]),
+        )
+
+    def test_lease_keeps_concurrent_runs_apart(self):
+        SweepState.objects.create(name="missed-doses", locked_by="w2", locked_at=timezone.now())
+        self.assertIsNone(self.sweep())
+        SweepState.objects.update(locked_at=timezone.now() - timedelta(hours=1))  # w2 died
+        self.assertEqual(self.sweep()["created"], 4 * 3 - 1)
+        self.assertEqual(SweepState.objects.get(name="missed-doses").locked_by, "")
+
+    def test_shards_split_the_patients(self):
+        swept = []
+        for index in range(2):
+            before = set(Activity.objects.values_list("id", flat=True))
+            self.sweep(worker=f"w{index}", shard=(index, 2), chunk_size=1)
+            swept.append(set(Activity.objects.exclude(id__in=before).values_list("patient_id", flat=True)))
+        self.assertFalse(swept[0] & swept[1])
+        self.assertEqual(swept[0] | swept[1], set(self.patients))
+        self.assertEqual(set(SweepState.objects.values_list("name", flat=True)), {"missed-doses:0/2", "missed-doses:1/2"})
+
+
+# ---------- ALERTS ----------
+CONSECUTIVE_MISSED = {
+    "name": "consecutive-missed", "kind": "consecutive_missed", "count": 2,
+    "notify": ["patient", "doctors"], "cooldown_hours": 12, "message": "{count} doses missed in a row",
+}
+
+
+class AlertRuleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.doctors = [
+            DoctorProfile.objects.create(user=User.objects.create(username=f"doc{i}", role="doctor")) for i in range(2)
+        ]
+        for doctor in self.doctors:
+            doctor.patients.add(self.patient)
+        self.schedule = MedicationSchedule.objects.create(
+            patient=self.patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+            start_date=date.today() - timedelta(days=30), end_date=date.today() + timedelta(days=30),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+        self.hours_ago = 48
+
+    def log(self, state):
+        self.hours_ago -= 1
+        when = timezone.now() - timedelta(hours=self.hours_ago)
+        response = self.client.post(
+            "/api/activities/", {"schedule": self.schedule.pk, "status": state, "date_time": when.isoformat()},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["data"]["id"]
+
+    def counter(self):
+        return PatientAlertState.objects.get(patient=self.patient).consecutive_missed
+
+    def recipients(self):
+        return sorted(Notification.objects.values_list("recipient__username", flat=True))
+
+    def test_consecutive_missed_fires_once_per_cooldown(self):
+        with self.settings(ADHERENCE_ALERT_RULES=[CONSECUTIVE_MISSED]):
+            self.log("missed")
+            self.assertEqual((self.counter(), Notification.objects.count()), (1, 0))
+            self.log("missed")
+            self.assertEqual(self.counter(), 2)
+            self.assertEqual(self.recipients(), ["doc0", "doc1", "patient"])
+            self.assertEqual(Notification.objects.first().message, "2 doses missed in a row")
+
+            self.log("missed")  # still cooling down
+            self.assertEqual((self.counter(), Notification.objects.count()), (3, 3))
+            self.log("taken")
+            self.assertEqual(self.counter(), 0)
+
+            state = PatientAlertState.objects.get(patient=self.patient)
+            state.last_fired = {"consecutive-missed": (timezone.now() - timedelta(hours=13)).isoformat()}
+            state.save()
+            self.log("missed")
+            self.log("missed")
+            self.assertEqual(Notification.objects.count(), 6)
+
+    def test_notify_selects_the_recipients(self):
+        with self.settings(ADHERENCE_ALERT_RULES=[{**CONSECUTIVE_MISSED, "notify": ["doctors"]}]):
+            self.log("missed")
+            self.log("missed")
+        self.assertEqual(self.recipients(), ["doc0", "doc1"])
+        self.assertTrue(all(n.patient_id == self.patient.pk for n in Notification.objects.all()))
+
+    def test_delivery_reaches_each_recipient(self):
+        with self.settings(ADHERENCE_ALERT_RULES=[CONSECUTIVE_MISSED]):
+            self.log("missed")
+            self.log("missed")
+        with tempfile.TemporaryDirectory() as tmp, self.settings(
+            NOTIFICATION_DELIVERY_BACKEND="Adherence_tracker.delivery.FileDeliveryBackend",
+            NOTIFICATION_FILE_PATH=os.path.join(tmp, "notifications.log"),
+        ):
+            call_command("run_jobs", once=True, worker_id="w1", stdout=io.StringIO())
+            with open(settings.NOTIFICATION_FILE_PATH, encoding="utf-8") as fh:
+                records = [json.loads(line) for line in fh]
+        users = dict(User.objects.values_list("id", "username"))
+        self.assertEqual(sorted(users[r["recipient"]] for r in records), ["doc0", "doc1", "patient"])
+        self.assertTrue(all(r["patient"] == self.patient.pk for r in records))
+        self.assertFalse(Notification.objects.filter(delivered_at=None).exists())
+
+    def test_edits_and_deletes_recount_the_counter(self):
+        with self.settings(ADHERENCE_ALERT_RULES=[CONSECUTIVE_MISSED]):
+            first = self.log("missed")
+            second = self.log("missed")
+            self.assertEqual(self.counter(), 2)
+
+            self.client.patch(f"/api/activities/{second}/", {"status": "taken"}, format="json")
+            self.assertEqual(self.counter(), 0)
+            self.client.patch(f"/api/activities/{first}/", {"status": "taken"}, format="json")
+            self.client.patch(f"/api/activities/{second}/", {"status": "missed"}, format="json")
+            self.assertEqual(self.counter(), 1)
+            self.client.delete(f"/api/activities/{second}/")
+            self.assertEqual(self.counter(), 0)
+
+
+# ---------- DOSING ----------
+FREQUENCIES = [
+    ("once daily", (1, 1)), ("Twice a day", (2, 1)), ("three times per day", (3, 1)), ("six times a week", (6, 7)),
+    ("BID", (2, 1)), ("q.i.d.", (4, 1)), ("every other day", (1, 2)), ("weekly", (1, 7)), ("2x/day", (2, 1)),
+    ("q8h", (3, 1)), ("every 12 hours", (2, 1)), ("every 36 hrs", (2, 3)), ("q1h", (24, 1)),
+    ("every 3 days", (1, 3)), ("every 1 day", (1, 1)), ("every 366 days", (1, 366)),
+    # unrecognised
+    ("", None), (None, None), ("as needed", None), ("zero times a day", None),
+    # out of range for the schedule's columns
+    ("0 times a day", None), ("49 times a day", None), ("100000 times a day", None), ("q0h", None),
+    ("every 99999 hours", None), ("every 9000 hours", None), ("every 0 days", None), ("every 367 days", None),
+    ("every 99999 days", None),
+]
+DOSES_DUE = [
+    # doses, period_days, schedule start..end, window start..end, expected
+    (2, 1, (1, 31), (1, 7), 14),
+    (2, 1, (5, 31), (1, 7), 6),             # the schedule starts inside the window
+    (1, 2, (1, 31), (1, 7), 4),             # days 1, 3, 5, 7
+    (1, 2, (1, 31), (2, 7), 3),
+    (1, 7, (1, 31), (2, 7), 0),
+    (3, 1, (10, 20), (1, 7), 0),            # no overlap
+    (3, 1, (1, 31), (7, 1), 0),             # empty window
+]
+
+
+class DosingTests(TestCase):
+    def test_parse_frequency(self):
+        for text, expected in FREQUENCIES:
+            with self.subTest(text=text):
+                self.assertEqual(parse_frequency(text), expected)
+
+    def test_doses_due(self):
+        day = lambda d: date(2025, 1, d)
+        for doses, period, (start, end), (lo, hi), expected in DOSES_DUE:
+            with self.subTest(doses=doses, period=period, schedule=(start, end), window=(lo, hi)):
+                self.assertEqual(doses_due(doses, period, day(start), day(end), day(lo), day(hi)), expected)
+
+    def test_out_of_range_frequency_is_stored_as_unrecognised(self):
+        patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        schedule = MedicationSchedule.objects.create(
+            patient=patient, medication_name="Amlodipine", dosage="5mg", frequency="100000 times a day",
+            start_date=date.today(), end_date=date.today(),
+        )
+        self.assertEqual((schedule.doses_per_period, schedule.period_days), (None, None))
+
+
+# ---------- CLINIC IMPORT ----------
+USERS_CSV = """username,email,password,role,specialization
+drhouse,h@example.com,Str0ng-pass!,doctor,Cardiology
+alice,a@example.com,Str0ng-pass!,patient,
+bob,,Str0ng-pass!,patient,
+"""
+ASSIGNMENTS_CSV = """doctor,patient
+drhouse,alice
+drhouse,bob
+"""
+SCHEDULES_CSV = """patient,medication_name,dosage,frequency,start_date,end_date
+alice,Amlodipine,5mg,twice daily,2025-01-01,2025-12-31
+"""
+
+
+class ClinicImportTests(TestCase):
+    def run_import(self, users=USERS_CSV, assignments=ASSIGNMENTS_CSV, schedules=SCHEDULES_CSV, **kwargs):
+        return import_clinic(
+            users=io.StringIO(users), assignments=io.StringIO(assignments), schedules=io.StringIO(schedules), **kwargs,
+        )
+
+    def assertNothingImported(self):
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(MedicationSchedule.objects.exists())
+        self.assertFalse(Assignment.objects.exists())
+
+    def test_valid_files_load_everything(self):
+        report = self.run_import()
+        self.assertTrue(report["ok"], report["errors"])
+        self.assertEqual(
+            report["counts"], {"users": 3, "patients": 2, "doctors": 1, "assignments": 2, "schedules": 1},
+        )
+        doctor = DoctorProfile.objects.get(user__username="drhouse")
+        self.assertEqual(sorted(doctor.patients.values_list("user__username", flat=True)), ["alice", "bob"])
+        self.assertTrue(User.objects.get(username="alice").check_password("Str0ng-pass!"))
+        schedule = MedicationSchedule.objects.get()
+        self.assertEqual((schedule.patient.user.username, schedule.doses_per_period), ("alice", 2))
+
+    def test_dry_run_validates_without_writing(self):
+        report = self.run_import(dry_run=True)
+        self.assertTrue(report["ok"])
+        self.assertEqual(report["counts"]["users"], 3)
+        self.assertNothingImported()
+
+    def test_every_bad_row_is_reported_and_nothing_is_written(self):
+        User.objects.create(username="carol", role="patient")
+        users = USERS_CSV + "carol,,Str0ng-pass!,patient,\nalice,,Str0ng-pass!,patient,\ndave,,Str0ng-pass!,nurse,\n"
+        assignments = ASSIGNMENTS_CSV + "alice,bob\n"
+        schedules = SCHEDULES_CSV + "zed,Lisinopril,10mg,daily,2025-01-01,2025-12-31\nbob,Lisinopril,10mg,daily,2025-02-01,2025-01-01\n"
+        report = self.run_import(users, assignments, schedules)
+
+        self.assertFalse(report["ok"])
+        rows = [(e["file"], e["row"], sorted(e["errors"])) for e in report["errors"]]
+        self.assertEqual(rows, [
+            ("users", 5, ["username"]),               # already registered
+            ("users", 6, ["username"]),               # duplicate of row 3
+            ("users", 7, ["role"]),
+            ("assignments", 4, ["doctor"]),           # alice is a patient
+            ("schedules", 3, ["patient"]),            # unknown patient
+            ("schedules", 4, ["end_date"]),
+        ])
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["carol"])
+        self.assertFalse(MedicationSchedule.objects.exists())
+
+    def test_unreadable_upload_is_reported_not_raised(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        users = io.BytesIO((USERS_CSV + "zoë,,Str0ng-pass!,patient,\n").encode("latin-1"))
+        users.name = "users.csv"
+        schedules = io.BytesIO((SCHEDULES_CSV + "alice,Lisinopril," + "x" * 200_000 + "\n").encode())  # over csv's field limit
+        schedules.name = "schedules.csv"
+        response = client.post("/api/imports/clinic/", {"users": users, "schedules": schedules}, format="multipart")
+
+        self.assertEqual(response.status_code, 400)
+        errors = {e["file"]: e["errors"]["file"][0] for e in response.json()["errors"]}
+        self.assertIn("not UTF-8", errors["users"])
+        self.assertIn("malformed CSV", errors["schedules"])
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["admin"])
+
+    def test_failed_load_rolls_back_completely(self):
+        job = ClinicImport(io.StringIO(USERS_CSV), io.StringIO(ASSIGNMENTS_CSV), io.StringIO(SCHEDULES_CSV))
+        self.assertTrue(job.validate())
+        # registered between validation and load
+        User.objects.create(username="bob", role="patient")
+        with self.assertRaises(IntegrityError):
+            job.load()
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["bob"])
+        self.assertFalse(PatientProfile.objects.exists())
+        self.assertFalse(Assignment.objects.exists())
+
+
+# ---------- BLOOD PRESSURE ----------
+BP_READINGS = [
+    ("120/80", (120, 80)), (" 135 / 85 ", (135, 85)), ("140/90 mmHg", (140, 90)), ("118/76mm hg", (118, 76)),
+    ("", None), (None, None), ("high", None), ("120-80", None), ("120/", None), ("1200/80", None),
+    # implausible
+    ("40/30", None), ("310/90", None), ("120/10", None), ("90/210", None),
+]
+
+
+class BloodPressureTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.other = PatientProfile.objects.create(user=User.objects.create(username="other", role="patient"))
+        schedule = MedicationSchedule.objects.create(
+            patient=self.patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+            start_date=date(2025, 1, 1), end_date=date(2025, 12, 31),
+        )
+        # three weeks from Monday, March 3rd 2025: adherence falls as systolic rises, except in week two
+        for day, state, reading in (
+            (3, "taken", "150/95"), (5, "taken", "140/90"),
+            (11, "taken", "130/85"), (12, "missed", ""),
+            (18, "missed", "160/100"), (19, "missed", "n/a"),
+        ):
+            Activity.objects.create(
+                schedule=schedule, status=state, blood_pressure_reading=reading,
+                date_time=timezone.make_aware(datetime(2025, 3, day, 12)),
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+        self.url = f"/api/patients/{self.patient.pk}/bp/"
+
+    def test_parse_blood_pressure(self):
+        for text, expected in BP_READINGS:
+            with self.subTest(text=text):
+                self.assertEqual(parse_blood_pressure(text), expected)
+
+    def test_trends_bucket_readings_with_adherence(self):
+        data = self.client.get(self.url, {"start": "2025-03-01", "end": "2025-03-23"}).json()
+        self.assertEqual(data["stats"], {
+            "readings": 4, "systolic_min": 130, "systolic_max": 160, "systolic_avg": 145.0,
+            "diastolic_min": 85, "diastolic_max": 100, "diastolic_avg": 92.5,
+        })
+        self.assertEqual(
+            [(p["bucket"], p["readings"], p["systolic_avg"], p["diastolic_avg"], p["doses"], p["adherence_rate"])
+             for p in data["series"]],
+            [("2025-03-03", 2, 145.0, 92.5, 2, 100.0), ("2025-03-10", 1, 130.0, 85.0, 2, 50.0),
+             ("2025-03-17", 1, 160.0, 100.0, 2, 0.0)],
+        )
+        self.assertEqual(data["correlation"], {"systolic": -0.5, "diastolic": -0.5})
+
+    def test_trends_need_three_buckets_for_a_correlation(self):
+        data = self.client.get(self.url, {"start": "2025-03-01", "end": "2025-03-31", "bucket": "month"}).json()
+        self.assertEqual(len(data["series"]), 1)
+        self.assertEqual(data["correlation"], {"systolic": None, "diastolic": None})
+
+    def test_access_and_bad_input(self):
+        self.assertEqual(self.client.get(f"/api/patients/{self.other.pk}/bp/").status_code, 403)
+        self.assertEqual(self.client.get(self.url, {"bucket": "year"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"start": "2025-03-10", "end": "2025-03-01"}).status_code, 400)
+
+
+# ---------- MIGRATIONS ----------
+class MigrationTestCase(TransactionTestCase):
+    """Migrates the app back to `migrate_from`; the test seeds data through self.apps, then calls migrate()."""
+    app = "Adherence_tracker"
+    migrate_from = migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([(self.app, self.migrate_from)])
+        self.apps = executor.loader.project_state([(self.app, self.migrate_from)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([(self.app, self.migrate_to)])
+        return executor.loader.project_state([(self.app, self.migrate_to)]).apps
+
+    def make_schedules(self, n):
+        User = self.apps.get_model(self.app, "User")
+        PatientProfile = self.apps.get_model(self.app, "PatientProfile")
+        MedicationSchedule = self.apps.get_model(self.app, "MedicationSchedule")
+        return [
+            MedicationSchedule.objects.create(
+                patient=PatientProfile.objects.create(user=User.objects.create(username=f"pat{i}")),
+                medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+                start_date=date(2025, 1, 1), end_date=date(2025, 12, 31),
+            )
+            for i in range(n)
+        ]
+
+
+class BloodPressureMigrationTests(MigrationTestCase):
+    migrate_from = "0007_alert_rules"
+    migrate_to = "0008_activity_blood_pressure"
+
+    def test_existing_readings_are_split(self):
+        Activity = self.apps.get_model(self.app, "Activity")
+        schedule, = self.make_schedules(1)
+        for reading in ("120/80", " 145 / 95 mmHg", "", "garbage", "400/80"):
+            Activity.objects.create(
+                schedule=schedule, status="taken", blood_pressure_reading=reading, date_time=timezone.now(),
+            )
+
+        Activity = self.migrate().get_model(self.app, "Activity")
+        self.assertEqual(
+            list(Activity.objects.order_by("pk").values_list("systolic", "diastolic")),
+            [(120, 80), (145, 95), (None, None), (None, None), (None, None)],
+        )
+
+
+
+class ActivityPatientMigrationTests(MigrationTestCase):
+    migrate_from = "0009_query_tuning_indexes"
+    migrate_to = "0010_activity_patient"
+
+    def test_backfill_covers_every_batch(self):
+        Activity = self.apps.get_model(self.app, "Activity")
+        schedules = self.make_schedules(3)
+        Activity.objects.bulk_create(
+            Activity(schedule=schedules[i % 3], status="taken", date_time=timezone.now()) for i in range(11)
+        )
+        migration = importlib.import_module("Adherence_tracker.migrations.0010_activity_patient")
+        with mock.patch.object(migration, "BATCH_SIZE", 3):  # three full batches and a partial one
+            apps = self.migrate()
+
+        Activity = apps.get_model(self.app, "Activity")
+        rows = list(Activity.objects.values_list("patient_id", "schedule__patient_id"))
+        self.assertEqual(len(rows), 11)
+        self.assertTrue(all(patient == schedule_patient for patient, schedule_patient in rows), rows)
+        self.assertEqual(len({patient for patient, _ in rows}), 3)
+
+# ---------- METRICS ----------
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        self.admin = User.objects.create(username="admin", role="admin")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        registry = mock.patch.object(metrics, "REGISTRY", metrics.Registry())
+        self.registry = registry.start()
+        self.addCleanup(registry.stop)
+
+    def histogram(self, name, view, method="GET"):
+        series = self.registry.histograms[name][(view, method)]
+        return series[-2], series[-1]  # sum, count
+
+    def test_sync_requests_record_their_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/activities/")
+        queries = len(ctx)  # the next request resets the connection's query log
+        self.client.get("/api/activities/")
+        self.assertEqual(self.registry.requests[("ActivityViewSet.list", "GET", "200")], 2)
+        self.assertEqual(self.histogram("request_db_queries", "ActivityViewSet.list"), (2 * queries, 2))
+        self.assertEqual(self.histogram("response_size_bytes", "ActivityViewSet.list")[1], 2)
+
+    async def test_async_requests_are_recorded(self):
+        token = await sync_to_async(lambda: str(ClaimsRefreshToken.for_user(self.admin).access_token))()
+        response = await AsyncClient().get(
+            f"/api/patients/{self.patient.pk}/adherence/summary/", headers={"Authorization": f"Bearer {token}"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.registry.requests[("AdherenceSummaryView", "GET", "200")], 1)
+        queries, count = self.histogram("request_db_queries", "AdherenceSummaryView")
+        self.assertEqual(count, 1)
+        self.assertGreater(queries, 0)  # recorded on the thread that ran the ORM calls
+
+    def test_many_queries_are_logged_with_the_most_repeated(self):
+        with self.settings(METRICS_QUERY_WARN=0), self.assertLogs("Adherence_tracker.metrics", "WARNING") as logs:
+            self.client.get("/api/activities/")
+        self.assertIn("GET /api/activities/ (ActivityViewSet.list)", logs.output[0])
+        self.assertIn("most repeated (1x): SELECT", logs.output[0])
+
+    def test_prometheus_rendering(self):
+        registry = metrics.Registry()
+        registry.observe('Say "hi"', "GET", 200, {"request_db_queries": 3, "response_size_bytes": None})
+        registry.observe('Say "hi"', "GET", 200, {"request_db_queries": 30})
+        text = metrics.render_prometheus(*metrics.merge([registry.snapshot()]))
+        lines = text.splitlines()
+        self.assertIn('medadherence_requests_total{view="Say \\"hi\\"",method="GET",status="200"} 2', lines)
+        base = 'view="Say \\"hi\\"",method="GET"'
+        for line in (
+            f'medadherence_request_db_queries_bucket{{{base},le="2"}} 0',
+            f'medadherence_request_db_queries_bucket{{{base},le="5"}} 1',
+            f'medadherence_request_db_queries_bucket{{{base},le="50"}} 2',
+            f'medadherence_request_db_queries_bucket{{{base},le="+Inf"}} 2',
+            f"medadherence_request_db_queries_sum{{{base}}} 33",
+            f"medadherence_request_db_queries_count{{{base}}} 2",
+            "# TYPE medadherence_response_size_bytes histogram",
+        ):
+            self.assertIn(line, lines)
+        self.assertNotIn("medadherence_response_size_bytes_count", text)
+
+    def test_endpoint_is_admin_only_and_sums_worker_snapshots(self):
+        self.assertEqual(APIClient().get("/api/_metrics/").status_code, 401)
+        patient_client = APIClient()
+        patient_client.force_authenticate(self.patient.user)
+        self.assertEqual(patient_client.get("/api/_metrics/").status_code, 403)
+
+        other = metrics.Registry()
+        other.observe("ActivityViewSet.list", "GET", 200, {"request_db_queries": 1})
+        with tempfile.TemporaryDirectory() as tmp, self.settings(METRICS_DIR=tmp):
+            with open(os.path.join(tmp, "1.json"), "w") as fh:
+                json.dump(other.snapshot(), fh)
+            self.client.get("/api/activities/")
+            response = self.client.get("/api/_metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn(
+            'medadherence_requests_total{view="ActivityViewSet.list",method="GET",status="200"} 2',
+            response.content.decode().splitlines(),
+        )
+
+
+# ---------- EXPORTS ----------
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patients = [
+            PatientProfile.objects.create(user=User.objects.create(username=f"pat{i}", role="patient")) for i in range(2)
+        ]
+        for patient in self.patients:
+            schedule = MedicationSchedule.objects.create(
+                patient=patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+                start_date=date(2025, 1, 1), end_date=date(2025, 12, 31),
+            )
+            # the evening of the 3rd is local March 3rd, though already the 4th in UTC
+            for day, hour in ((2, 12), (3, 23), (4, 12)):
+                Activity.objects.create(
+                    schedule=schedule, status="taken", notes='says "ok", twice',
+                    blood_pressure_reading="120/80", date_time=timezone.make_aware(datetime(2025, 3, day, hour)),
+                )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+
+    def export(self, **params):
+        response = self.client.get("/api/exports/activities/", params)
+        self.assertEqual(response.status_code, 200, getattr(response, "content", b""))
+        return response, b"".join(response.streaming_content)
+
+    def test_csv(self):
+        response, body = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="activities.csv"')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(list(rows[0]), [name for name, _ in EXPORT_COLUMNS])
+        self.assertEqual(rows[0]["notes"], 'says "ok", twice')
+        self.assertEqual((rows[0]["systolic"], rows[0]["patient_username"]), ("120", "pat0"))
+        self.assertEqual(datetime.fromisoformat(rows[0]["date_time"]), timezone.make_aware(datetime(2025, 3, 2, 12)))
+
+    def test_ndjson(self):
+        response, body = self.export(output="ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([r["activity_id"] for r in rows], sorted(Activity.objects.values_list("id", flat=True)))
+        self.assertEqual((rows[0]["diastolic"], rows[0]["medication_name"]), (80, "Amlodipine"))
+
+    def test_gzip(self):
+        response, body = self.export(output="ndjson", gzip="1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="activities.ndjson.gz"')
+        self.assertEqual(gzip.decompress(body), self.export(output="ndjson")[1])
+
+    def test_filters(self):
+        _, body = self.export(output="ndjson", start="2025-03-03", end="2025-03-03")
+        self.assertEqual(len(body.splitlines()), 2)  # one local day, both patients
+        _, body = self.export(output="ndjson", patient=self.patients[1].pk, start="2025-03-03")
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual({(r["patient_id"], r["patient_username"]) for r in rows}, {(self.patients[1].pk, "pat1")})
+        self.assertEqual(len(rows), 2)
+        for params in ({"output": "xml"}, {"start": "March"}, {"patient": "me"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get("/api/exports/activities/", params).status_code, 400)
+
+    def test_admins_only(self):
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username="doctor", role="doctor"))
+        doctor.patients.add(self.patients[0])
+        client = APIClient()
+        client.force_authenticate(doctor.user)
+        # even scoped to an assigned patient
+        response = client.get("/api/exports/activities/", {"patient": self.patients[0].pk})
+        self.assertEqual(response.status_code, 403)
+
+    def test_command_matches_the_endpoint(self):
+        out = io.StringIO()
+        call_command("export_activities", "--format", "ndjson", "--patient", str(self.patients[0].pk), stdout=out)
+        _, body = self.export(output="ndjson", patient=self.patients[0].pk)
+        self.assertEqual(out.getvalue(), body.decode())
+
+
+# ---------- MANAGEMENT COMMANDS ----------
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def call(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command(*args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def seed(self, *args):
+        return self.call(
+            "seed_benchmark_data", "--patients", "3", "--doctors", "1", "--schedules-per-patient", "1",
+            "--activities-per-schedule", "5", "--days", "10", *args,
+        )[0]
+
+    def test_seed_and_run(self):
+        self.assertIn("Seeded 5 users, 3 schedules, 15 activities", self.seed())
+        self.assertIn("deleted", self.seed("--reset"))
+        self.assertEqual(User.objects.filter(username__startswith="bench_").count(), 5)
+
+        out, err = self.call(
+            "run_benchmark", "--scenario", "summary", "--scenario", "activity_list", "--requests", "3",
+            "--warmup", "1", "--serializer-rows", "10",
+        )
+        report = json.loads(out)
+        self.assertEqual(report["meta"]["transport"], "client")
+        self.assertEqual((report["meta"]["patients"], report["meta"]["activities"]), (3, 15))
+        self.assertEqual(set(report["scenarios"]), {"summary", "activity_list"})
+        for name, result in report["scenarios"].items():
+            with self.subTest(scenario=name):
+                self.assertEqual((result["requests"], result["errors"]), (3, 0))
+                self.assertEqual(set(result["latency_ms"]), {"p50", "p95", "p99", "mean", "max"})
+                self.assertGreater(result["queries"]["max"], 0)
+                self.assertIn(f"{name:16} p50", err)
+        self.assertEqual(report["serializers"]["rows"], 10)
+        self.assertTrue(report["serializers"]["identical"])
+
+    def test_baseline_comparison(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            self.call("run_benchmark", "--scenario", "activity_list", "--requests", "2", "--warmup", "0", "-o", path)
+            _, err = self.call(
+                "run_benchmark", "--scenario", "activity_list", "--requests", "2", "--warmup", "0",
+                "--baseline", path, "--tolerance", "1000",
+            )
+            self.assertIn("No regressions against baseline", err)
+
+            with open(path) as fh:
+                baseline = json.load(fh)
+            baseline["scenarios"]["activity_list"]["queries"]["max"] = 0
+            with open(path, "w") as fh:
+                json.dump(baseline, fh)
+            with self.assertRaisesMessage(CommandError, "activity_list: max queries 0 ->"):
+                self.call(
+                    "run_benchmark", "--scenario", "activity_list", "--requests", "2", "--warmup", "0",
+                    "--baseline", path, "--tolerance", "1000",
+                )
+
+    def test_run_needs_seeded_data(self):
+        with self.assertRaisesMessage(CommandError, "seed_benchmark_data"):
+            self.call("run_benchmark", "--requests", "1")
+
+
+class ExplainQueriesCommandTests(TestCase):
+    def call(self, *args):
+        out = io.StringIO()
+        call_command("explain_queries", *args, stdout=out, no_color=True)
+        return out.getvalue()
+
+    def test_every_hot_query_is_explained(self):
+        patient = PatientProfile.objects.create(user=User.objects.create(username="patient", role="patient"))
+        MedicationSchedule.objects.create(
+            patient=patient, medication_name="Amlodipine", dosage="5mg", frequency="once daily",
+            start_date=date.today(), end_date=date.today(),
+        )
+        out = self.call()
+        headings = [line for line in out.splitlines() if line.startswith("== ")]
+        self.assertEqual(
+            headings, [f"== {name}: {description}" for name, (description, _) in HOT_QUERIES.items()],
+        )
+        self.assertIn("SELECT", out)
+        # each heading is followed by the SQL and a plan
+        for block in out.split("== ")[1:]:
+            self.assertGreaterEqual(len(block.strip().splitlines()), 3, block)
+
+    def test_selected_queries_without_sql(self):
+        out = self.call("activities.patient", "jobs.due", "--no-sql")
+        self.assertEqual(
+            [line.split(":")[0] for line in out.splitlines() if line.startswith("== ")],
+            ["== activities.patient", "== jobs.due"],
+        )
+        self.assertNotIn("SELECT", out)
+        self.assertIn("INDEX", out.upper())
+
+    def test_unknown_query(self):
+        with self.assertRaisesMessage(CommandError, "unknown queries: nope"):
+            self.call("nope")
@@ -4,8 +4,10 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .views import (
     RegisterView, LoginView, LogoutView, MyProfileView, UserViewSet,
     MedicationScheduleViewSet, ActivityViewSet,
-    AdherenceSummaryView, AdherenceHistoryView,
-    NotificationViewSet, NotificationSendView
+    AdherenceSummaryView, AdherenceAnalyticsView, AdherenceHistoryView, DoctorAdherencePanelView,
+    BloodPressureView,
+    NotificationViewSet, NotificationSendView, ActivityExportView, ClinicImportView,
+    MetricsView,
 )
 
 router = DefaultRouter()
@@ -15,6 +17,9 @@ router.register(r"activities", ActivityViewSet, basename="activities")
 router.register(r"notifications", NotificationViewSet, basename="notifications")
 
 urlpatterns = [
+    # Notifications (before the router, whose notifications/<pk>/ route would swallow "send")
+    path("notifications/send/", NotificationSendView.as_view(), name="notifications-send"),
+
     # Router endpoints
     path("", include(router.urls)),
 
@@ -30,8 +35,15 @@ urlpatterns = [
 
     # Adherence endpoints
     path("patients/<int:patient_id>/adherence/summary/", AdherenceSummaryView.as_view(), name="adherence-summary"),
+    path("patients/<int:patient_id>/adherence/analytics/", AdherenceAnalyticsView.as_view(), name="adherence-analytics"),
     path("patients/<int:patient_id>/adherence/history/", AdherenceHistoryView.as_view(), name="adherence-history"),
+    path("patients/<int:patient_id>/bp/", BloodPressureView.as_view(), name="blood-pressure"),
+    path("doctors/me/adherence/", DoctorAdherencePanelView.as_view(), name="doctor-adherence-panel"),
 
-    # Notifications
-    path("notifications/send/", NotificationSendView.as_view(), name="notifications-send"),
+    # Exports / imports (admin)
+    path("exports/activities/", ActivityExportView.as_view(), name="export-activities"),
+    path("imports/clinic/", ClinicImportView.as_view(), name="import-clinic"),
+
+    # Monitoring (admin)
+    path("_metrics/", MetricsView.as_view(), name="metrics"),
 ]
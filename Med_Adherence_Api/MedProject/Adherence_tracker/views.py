@@ -1,11 +1,26 @@
+import asyncio
+import copy
+import inspect
+import io
+from asgiref.sync import sync_to_async
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import ParseError, PermissionDenied, ValidationError
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
 from django.utils import timezone
 from .models import (
     User, PatientProfile, DoctorProfile,
@@ -13,10 +28,23 @@ from .models import (
 )
 from .serializers import (
     RegisterSerializer, UserSerializer,
-    MedicationScheduleSerializer, ActivitySerializer, NotificationSerializer
+    MedicationScheduleSerializer, ActivitySerializer, ActivityBulkItemSerializer,
+    NotificationSerializer, FastReadSerializer, requested_fields,
 )
+from .access import aassigned_patient_ids, acan_access_patient, assigned_patient_ids, own_patient_filter
+from .authentication import ClaimsRefreshToken
+from .alerts import evaluate_alerts
+from .exports import EXPORT_FORMATS, export_stream
+from .imports import import_clinic
+from .metrics import collect as collect_metrics
+from .revocation import revoke
+from .jobs import enqueue
 from .permissions import IsAdmin, IsOwnerPatientOrAssignedDoctor
-from .services import adherence_summary_for_patient
+from .pagination import ActivityCursorPagination, NotificationCursorPagination, PanelPagination
+from .services import (
+    acached_adherence_summary, acached_summary_hit, adherence_analytics, adherence_panel, aiter_stream,
+    blood_pressure_trends, iter_ndjson, local_date_range, parse_dates, parse_range_days, parse_window, update_rollup,
+)
 
 # ---------- AUTH ----------
 class RegisterView(APIView):
@@ -56,26 +84,33 @@ class LogoutView(APIView):
         if not refresh:
             return Response({"detail": "refresh token required"}, status=400)
         try:
-            token = RefreshToken(refresh)
-            token.blacklist()
-            return Response({"message": "Logout successful ✅"}, status=status.HTTP_205_RESET_CONTENT)
-        except Exception:
+            token = ClaimsRefreshToken(refresh)
+        except TokenError:
             return Response({"detail": "invalid token"}, status=400)
+        revoke(token)
+        # the access token used for this request stops working too
+        if request.auth is not None:
+            revoke(request.auth)
+        return Response({"message": "Logout successful ✅"}, status=status.HTTP_205_RESET_CONTENT)
 
 
 class MyProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
+    def get_user(self, request):
+        # request.user may be built from token claims; serialize the stored row
+        return UserSerializer.setup_eager_loading(User.objects.all()).get(pk=request.user.pk)
+
     def get(self, request):
         return Response({
             "message": "Profile fetched successfully ✅",
-            "profile": UserSerializer(request.user).data
+            "profile": UserSerializer(self.get_user(request)).data
         })
 
     def put(self, request):
-        user = request.user
+        user = self.get_user(request)
         user.email = request.data.get("email", user.email)
-        user.save()
+        user.save(update_fields=["email"])
 
         if user.role == "patient" and hasattr(user, "patient_profile"):
             from .serializers import PatientProfileSerializer
@@ -95,13 +130,83 @@ class MyProfileView(APIView):
 
         return Response({
             "message": "Profile updated successfully ✅",
-            "profile": UserSerializer(user).data
+            "profile": UserSerializer(self.get_user(request)).data
         })
 
 
+ACTIVITY_BULK_MAX_ITEMS = 500
+
+
+# ---------- EAGER LOADING / SPARSE FIELDSETS ----------
+class EagerLoadingQuerysetMixin:
+    """Apply the joins the serializer declares (EagerLoadingMixin.setup_eager_loading)."""
+    def filter_queryset(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, "setup_eager_loading"):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        return super().filter_queryset(queryset)
+
+
+class FastReadListMixin:
+    """
+    list() from .values() rows through FastReadSerializer (same JSON, no model
+    or serializer instances per row). Off with FAST_READ_SERIALIZERS = False.
+    """
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_READ_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        reader = FastReadSerializer.for_serializer(self.get_serializer_class(), requested_fields(request))
+        # the cursor paginator reads its position from the ordering columns
+        ordering = getattr(self.paginator, "ordering", None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        columns = dict.fromkeys([*reader.columns, *(f.lstrip("-") for f in ordering)])
+        rows = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(reader.many(page))
+        return Response(reader.many(rows))
+
+
+class SparseFieldsetQuerysetMixin:
+    """
+    With `?fields=a,b` on a read, load only those columns (plus the pk) and
+    keep select_related joins only for the nested relations that were asked for.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        wanted = requested_fields(self.request)
+        if not wanted:
+            return queryset
+
+        opts = queryset.model._meta
+        ordering = getattr(self.paginator, "ordering", None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        # the cursor reads its position from the ordering columns
+        columns = [opts.pk.name] + [f.lstrip("-") for f in ordering]
+        joins = []
+        for name in wanted:
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete:
+                columns.append(field.name)
+            elif field.one_to_one:
+                joins.append(name)
+        queryset = queryset.select_related(None)
+        if joins:
+            queryset = queryset.select_related(*joins)
+        # likewise only prefetch below the relations that are still loaded
+        prefetches = [p for p in queryset._prefetch_related_lookups if str(p).split("__")[0] in joins]
+        queryset = queryset.prefetch_related(None).prefetch_related(*prefetches)
+        return queryset.only(*columns, *joins)
+
+
 # ---------- USER MANAGEMENT (Doctor/Admin only) ----------
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all().select_related("patient_profile", "doctor_profile")
+class UserViewSet(SparseFieldsetQuerysetMixin, EagerLoadingQuerysetMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all()
     serializer_class = UserSerializer
 
     def get_permissions(self):
@@ -111,7 +216,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
 
 # ---------- SCHEDULES ----------
-class MedicationScheduleViewSet(viewsets.ModelViewSet):
+class MedicationScheduleViewSet(SparseFieldsetQuerysetMixin, EagerLoadingQuerysetMixin, viewsets.ModelViewSet):
     queryset = MedicationSchedule.objects.select_related("patient", "patient__user")
     serializer_class = MedicationScheduleSerializer
     permission_classes = [IsAuthenticated, IsOwnerPatientOrAssignedDoctor]
@@ -123,12 +228,9 @@ class MedicationScheduleViewSet(viewsets.ModelViewSet):
         if user.role == "admin":
             return base
         if user.role == "patient":
-            return base.filter(patient__user=user)
+            return base.filter(own_patient_filter(user, "patient"))
         if user.role == "doctor":
-            try:
-                return base.filter(patient__in=user.doctor_profile.patients.all())
-            except:
-                return base.none()
+            return base.filter(patient_id__in=assigned_patient_ids(user))
         return base.none()
 
     def perform_create(self, serializer):
@@ -140,7 +242,7 @@ class MedicationScheduleViewSet(viewsets.ModelViewSet):
             patient = serializer.validated_data.get("patient")
             if not patient:
                 raise PermissionError("doctor must specify patient")
-            if not user.doctor_profile.patients.filter(pk=patient.pk).exists():
+            if patient.pk not in assigned_patient_ids(user):
                 raise PermissionError("doctor not assigned to this patient")
             serializer.save()
         else:
@@ -155,26 +257,38 @@ class MedicationScheduleViewSet(viewsets.ModelViewSet):
 
 
 # ---------- ACTIVITIES ----------
-class ActivityViewSet(viewsets.ModelViewSet):
-    queryset = Activity.objects.select_related("schedule", "schedule__patient", "schedule__patient__user")
+class ActivityViewSet(FastReadListMixin, SparseFieldsetQuerysetMixin, EagerLoadingQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Activity.objects.select_related("schedule")
     serializer_class = ActivitySerializer
+    pagination_class = ActivityCursorPagination
     permission_classes = [IsAuthenticated, IsOwnerPatientOrAssignedDoctor]
 
     def get_queryset(self):
         user = self.request.user
-        base = Activity.objects.select_related("schedule", "schedule__patient", "schedule__patient__user")
+        # schedule for the rollup and Activity.save() on writes; reads filter on the patient copy
+        base = Activity.objects.select_related("schedule")
         if user.role == "admin":
             return base
         if user.role == "patient":
-            return base.filter(schedule__patient__user=user)
+            return base.filter(own_patient_filter(user, "patient"))
         if user.role == "doctor":
-            try:
-                doc = user.doctor_profile
-                return base.filter(schedule__patient__in=doc.patients.all())
-            except DoctorProfile.DoesNotExist:
-                return base.none()
+            return base.filter(patient_id__in=assigned_patient_ids(user))
         return base.none()
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != "list":
+            return queryset
+        # ?status=missed&start=&end= ; served by the (status, date_time) index in list order
+        params = self.request.query_params
+        try:
+            start, end = parse_dates(params, "start", "end")
+        except ValueError as exc:
+            raise ParseError(str(exc))
+        if params.get("status"):
+            queryset = queryset.filter(status=params["status"])
+        return queryset.filter(local_date_range("date_time", start, end))
+
     def perform_create(self, serializer):
         user = self.request.user
         if user.role == "patient":
@@ -182,14 +296,42 @@ class ActivityViewSet(viewsets.ModelViewSet):
             if not schedule_id:
                 raise ValidationError({"schedule": "This field is required."})
             try:
-                schedule = MedicationSchedule.objects.get(pk=schedule_id, patient__user=user)
+                schedule = MedicationSchedule.objects.get(own_patient_filter(user, "patient"), pk=schedule_id)
             except MedicationSchedule.DoesNotExist:
                 raise PermissionDenied("You can only log activities for your own schedules.")
-            serializer.save(schedule=schedule)
+            self._save_new(serializer, schedule=schedule)
         elif user.role == "doctor":
             raise PermissionDenied("Doctors cannot create activities.")
         else:
+            self._save_new(serializer)
+
+    def _save_new(self, serializer, **kwargs):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    serializer.save(**kwargs)
+            except IntegrityError:
+                raise ValidationError({"idempotency_key": "already used for this schedule"})
+            activity = serializer.instance
+            update_rollup(added=[activity])
+            evaluate_alerts([(activity.patient_id, activity.status, activity.date_time)])
+
+    def perform_update(self, serializer):
+        previous = copy.copy(serializer.instance)
+        with transaction.atomic():
             serializer.save()
+            activity = serializer.instance
+            update_rollup(added=[activity], removed=[previous])
+            events = [(activity.patient_id, activity.status, activity.date_time)]
+            if previous.patient_id != activity.patient_id:
+                events.append((previous.patient_id, None, previous.date_time))
+            evaluate_alerts(events, recount=True)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            update_rollup(removed=[instance])
+            instance.delete()
+            evaluate_alerts([(instance.patient_id, None, instance.date_time)], recount=True)
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
@@ -198,6 +340,87 @@ class ActivityViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """
+        Ingest a batch of activities (a JSON list, or {"activities": [...]}).
+        Items carrying an idempotency_key that was already stored are reported
+        as duplicates instead of being inserted again.
+        """
+        user = request.user
+        if user.role == "doctor":
+            raise PermissionDenied("Doctors cannot create activities.")
+
+        items = request.data.get("activities") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"detail": "a non-empty list of activities is required"}, status=400)
+        if len(items) > ACTIVITY_BULK_MAX_ITEMS:
+            return Response({"detail": f"at most {ACTIVITY_BULK_MAX_ITEMS} activities per request"}, status=400)
+
+        results = [None] * len(items)
+        valid = []
+        for i, item in enumerate(items):
+            ser = ActivityBulkItemSerializer(data=item)
+            if ser.is_valid():
+                valid.append((i, ser.validated_data))
+            else:
+                results[i] = {"index": i, "status": "invalid", "errors": ser.errors}
+
+        schedules = MedicationSchedule.objects.filter(pk__in={d["schedule"] for _, d in valid})
+        if user.role == "patient":
+            schedules = schedules.filter(own_patient_filter(user, "patient"))
+        schedules = schedules.in_bulk()
+
+        keys = {d["idempotency_key"] for _, d in valid if d.get("idempotency_key")}
+        stored = {}
+        if keys:
+            stored = {
+                (sid, key): pk for pk, sid, key in Activity.objects.filter(
+                    schedule_id__in=schedules, idempotency_key__in=keys
+                ).values_list("id", "schedule_id", "idempotency_key")
+            }
+
+        pending, repeats, seen = [], [], set()
+        for i, data in valid:
+            schedule = schedules.get(data["schedule"])
+            if schedule is None:
+                results[i] = {"index": i, "status": "forbidden",
+                              "errors": {"schedule": "You can only log activities for your own schedules."}}
+                continue
+            key = (schedule.pk, data.get("idempotency_key"))
+            if key[1] and key in stored:
+                results[i] = {"index": i, "status": "duplicate", "id": stored[key]}
+            elif key[1] and key in seen:
+                repeats.append((i, key))  # same key twice in one batch
+            else:
+                seen.add(key)
+                activity = Activity(**{**data, "schedule": schedule})
+                # bulk_create bypasses save()
+                activity.apply_blood_pressure()
+                activity.apply_patient()
+                pending.append((i, activity))
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    created = Activity.objects.bulk_create([a for _, a in pending])
+            except IntegrityError:
+                return Response({"detail": "conflicting idempotency keys from a concurrent upload, retry"}, status=409)
+            update_rollup(added=created)
+            evaluate_alerts([(a.patient_id, a.status, a.date_time) for a in created])
+
+        for i, activity in pending:
+            results[i] = {"index": i, "status": "created", "id": activity.pk}
+            stored[(activity.schedule_id, activity.idempotency_key)] = activity.pk
+        for i, key in repeats:
+            results[i] = {"index": i, "status": "duplicate", "id": stored[key]}
+
+        return Response({
+            "message": "Activities processed successfully ✅",
+            "created": len(pending),
+            "results": results,
+        }, status=status.HTTP_201_CREATED if pending else status.HTTP_200_OK)
+
     def update(self, request, *args, **kwargs):
         if request.user.role == "doctor":
             return Response({"detail": "doctors cannot modify activities"}, status=403)
@@ -211,77 +434,257 @@ class ActivityViewSet(viewsets.ModelViewSet):
         return Response({"message": "Activity deleted successfully ✅"}, status=200)
 
 
+# ---------- ASYNC VIEWS ----------
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines. Under ASGI (Procfile.asgi) a waiting
+    request holds no thread; under WSGI Django runs the handler in its own loop.
+    Authentication, permissions and throttling are sync and run in the request's
+    database thread, as every sync ORM call must.
+    """
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):  # options() and 405s stay sync
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def stream_response(request, chunks, **kwargs):
+    """
+    StreamingHttpResponse over a sync chunk generator, at constant memory under
+    either server: Django's ASGI handler would load a sync iterator whole, and its
+    WSGI handler an async one, so ASGI requests get the aiter_stream adapter.
+    """
+    if isinstance(request._request, ASGIRequest):
+        chunks = aiter_stream(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+async def aget_patient(request, patient_id):
+    """
+    (patient, None) if the patient exists and the user may see it, else (None, 404/403 response).
+    A doctor's assignment set loads alongside the patient lookup.
+    """
+    lookup = PatientProfile.objects.only("id", "user_id").filter(pk=patient_id).afirst()
+    if request.user.role == "doctor":
+        patient, _ = await asyncio.gather(lookup, aassigned_patient_ids(request.user))
+    else:
+        patient = await lookup
+    if patient is None:
+        return None, Response({"detail": "patient not found"}, status=404)
+    if not await acan_access_patient(request.user, patient):
+        return None, Response({"detail": "forbidden"}, status=403)
+    return patient, None
+
+
 # ---------- ANALYTICS ----------
-class AdherenceSummaryView(APIView):
+class AdherenceSummaryView(AsyncAPIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, patient_id):
+    async def get(self, request, patient_id):
+        rng = request.query_params.get("range", "7d")
         try:
-            patient = PatientProfile.objects.select_related("user").get(pk=patient_id)
-        except PatientProfile.DoesNotExist:
-            return Response({"detail": "patient not found"}, status=404)
+            days = parse_range_days(rng)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
 
-        u = request.user
-        allowed = (
-            u.role == "admin"
-            or (u.role == "patient" and patient.user_id == u.id)
-            or (u.role == "doctor" and u.doctor_profile.patients.filter(pk=patient.pk).exists())
+        # the cache is probed while access is checked; computing waits for the check
+        (patient, error), hit = await asyncio.gather(
+            aget_patient(request, patient_id), acached_summary_hit(patient_id, days),
         )
-        if not allowed:
-            return Response({"detail": "forbidden"}, status=403)
+        if error:
+            return error
+        data, etag = hit or await acached_adherence_summary(patient.pk, days=days)
+        if_none_match = request.headers.get("If-None-Match", "")
+        if if_none_match.strip() == "*" or etag in parse_etags(if_none_match):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
 
-        rng = request.query_params.get("range", "7d")
-        days = 7 if rng == "7d" else 30
-        data = adherence_summary_for_patient(patient, days=days)
         return Response({
             "message": "Adherence summary fetched successfully ✅",
             "patient_id": patient_id,
             "range": rng,
             "total_doses": data["total"],
             "taken_doses": data["taken"],
-            "adherence_rate": f"{data['rate']:.2f}%"
+            "adherence_rate": f"{data['rate']:.2f}%",
+            "expected_doses": data["expected"],
+            "true_adherence_rate": f"{data['true_rate']:.2f}%",
+        }, headers={"ETag": etag})
+
+
+class AdherenceAnalyticsView(AsyncAPIView):
+    """Bucketed adherence series and per-medication breakdown for charts."""
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, patient_id):
+        patient, error = await aget_patient(request, patient_id)
+        if error:
+            return error
+
+        try:
+            start, end = parse_window(request.query_params)
+            data = await sync_to_async(adherence_analytics)(
+                patient, start, end, bucket=request.query_params.get("bucket", "day"),
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        return Response({
+            "message": "Adherence analytics fetched successfully ✅",
+            "patient_id": patient_id,
+            **data,
         })
 
 
-class AdherenceHistoryView(APIView):
+class BloodPressureView(AsyncAPIView):
+    """BP statistics and trends, bucketed alongside adherence."""
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, patient_id):
-        start = request.query_params.get("start")
-        end = request.query_params.get("end")
+    async def get(self, request, patient_id):
+        patient, error = await aget_patient(request, patient_id)
+        if error:
+            return error
 
         try:
-            patient = PatientProfile.objects.select_related("user").get(pk=patient_id)
-        except PatientProfile.DoesNotExist:
-            return Response({"detail": "patient not found"}, status=404)
+            start, end = parse_window(request.query_params)
+            data = await sync_to_async(blood_pressure_trends)(
+                patient, start, end, bucket=request.query_params.get("bucket", "week"),
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        return Response({
+            "message": "Blood pressure trends fetched successfully ✅",
+            "patient_id": patient_id,
+            **data,
+        })
 
-        u = request.user
-        allowed = (
-            u.role == "admin"
-            or (u.role == "patient" and patient.user_id == u.id)
-            or (u.role == "doctor" and u.doctor_profile.patients.filter(pk=patient.pk).exists())
-        )
-        if not allowed:
-            return Response({"detail": "forbidden"}, status=403)
-
-        qs = Activity.objects.filter(schedule__patient=patient).order_by("-date_time")
-        if start:
-            qs = qs.filter(date_time__date__gte=start)
-        if end:
-            qs = qs.filter(date_time__date__lte=end)
+
+class AdherenceHistoryView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, patient_id):
+        try:
+            start, end = parse_dates(request.query_params, "start", "end")
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+
+        patient, error = await aget_patient(request, patient_id)
+        if error:
+            return error
+
+        qs = Activity.objects.filter(local_date_range("date_time", start, end), patient=patient)
+
+        # ?stream=ndjson exports the full history at constant memory
+        if request.query_params.get("stream") == "ndjson":
+            qs = qs.order_by(*ActivityCursorPagination.ordering)
+            return stream_response(request, iter_ndjson(qs, ActivitySerializer), content_type="application/x-ndjson")
+
+        paginator = ActivityCursorPagination()
+        results = await sync_to_async(self.paginated_results)(paginator, qs, request)
         return Response({
             "message": "Adherence history fetched successfully ✅",
             "patient_id": patient_id,
-            "results": ActivitySerializer(qs, many=True).data
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "results": results
+        })
+
+    def paginated_results(self, paginator, qs, request):
+        if settings.FAST_READ_SERIALIZERS:
+            reader = FastReadSerializer.for_serializer(ActivitySerializer)
+            return reader.many(paginator.paginate_queryset(qs.values(*reader.columns), request, view=self))
+        return ActivitySerializer(paginator.paginate_queryset(qs, request, view=self), many=True).data
+
+
+class DoctorAdherencePanelView(AsyncAPIView):
+    """Adherence for every patient assigned to the requesting doctor."""
+    permission_classes = [IsAuthenticated]
+    ordering_fields = {"rate", "total", "username"}
+
+    async def get(self, request):
+        if request.user.role != "doctor":
+            return Response({"detail": "only doctors have a patient panel"}, status=403)
+
+        rng = request.query_params.get("range", "7d")
+        try:
+            days = parse_range_days(rng)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        qs = adherence_panel(await aassigned_patient_ids(request.user), days=days)
+
+        # no logged doses in the window counts as 0%, so ?max_rate= keeps those patients
+        qs = qs.alias(rate_or_zero=Coalesce("rate", Value(0.0)))
+        try:
+            if "min_rate" in request.query_params:
+                qs = qs.filter(rate_or_zero__gte=float(request.query_params["min_rate"]))
+            if "max_rate" in request.query_params:
+                qs = qs.filter(rate_or_zero__lt=float(request.query_params["max_rate"]))
+        except ValueError:
+            return Response({"detail": "min_rate/max_rate must be numbers"}, status=400)
+
+        ordering = request.query_params.get("ordering", "rate")
+        field = ordering.lstrip("-")
+        if field not in self.ordering_fields:
+            return Response({"detail": f"ordering must be one of {sorted(self.ordering_fields)}"}, status=400)
+        expr = F("user__username" if field == "username" else field)
+        expr = expr.desc(nulls_last=True) if ordering.startswith("-") else expr.asc(nulls_last=True)
+        qs = qs.order_by(expr, "id")
+
+        paginator = PanelPagination()
+        # COUNT plus one page; LimitOffsetPagination has no async path
+        page = await sync_to_async(paginator.paginate_queryset)(qs, request, view=self)
+        return Response({
+            "message": "Patient adherence panel fetched successfully ✅",
+            "range": rng,
+            "count": paginator.count,
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "results": [
+                {
+                    "patient_id": row["id"],
+                    "username": row["user__username"],
+                    "total_doses": row["total"],
+                    "taken_doses": row["taken"],
+                    "adherence_rate": None if row["rate"] is None else f"{row['rate']:.2f}%",
+                }
+                for row in page
+            ],
         })
 
 
 # ---------- NOTIFICATIONS ----------
-class NotificationViewSet(viewsets.ModelViewSet):
-    queryset = Notification.objects.select_related("patient", "patient__user")
+class NotificationViewSet(FastReadListMixin, SparseFieldsetQuerysetMixin, EagerLoadingQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
+    pagination_class = NotificationCursorPagination
     permission_classes = [IsAuthenticated]
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        patient = self.request.query_params.get("patient")
+        if self.action != "list" or not patient:
+            return queryset
+        # one patient's feed, newest first: the (patient, sent_at) index
+        if not patient.isdigit():
+            raise ParseError("patient must be an integer id")
+        return queryset.filter(patient_id=int(patient))
+
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
         return Response(
@@ -312,5 +715,80 @@ class NotificationSendView(APIView):
         except PatientProfile.DoesNotExist:
             return Response({"detail": "patient not found"}, status=404)
 
-        Notification.objects.create(patient=patient, message=msg, sent_at=timezone.now())
-        return Response({"message": "Notification queued successfully ✅"}, status=201)
+        with transaction.atomic():
+            notification = Notification.objects.create(patient=patient, message=msg, sent_at=timezone.now())
+            enqueue("notification.deliver", {"notification_id": notification.pk})
+        return Response(
+            {"message": "Notification queued successfully ✅", "notification_id": notification.pk},
+            status=201
+        )
+
+
+# ---------- EXPORTS ----------
+class ActivityExportView(APIView):
+    """
+    Admin-only streaming export of every Activity with schedule and patient context.
+    ?output=csv|ndjson, ?start=/?end=YYYY-MM-DD, ?patient=<id> (repeatable), ?gzip=1
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        fmt = request.query_params.get("output", "csv")
+        if fmt not in EXPORT_FORMATS:
+            return Response({"detail": f"output must be one of {sorted(EXPORT_FORMATS)}"}, status=400)
+
+        try:
+            start, end = parse_dates(request.query_params, "start", "end")
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        try:
+            patient_ids = [int(p) for p in request.query_params.getlist("patient")]
+        except ValueError:
+            return Response({"detail": "patient must be an integer id"}, status=400)
+
+        gzip = request.query_params.get("gzip") in ("1", "true")
+        filename = f"activities.{fmt}" + (".gz" if gzip else "")
+        response = stream_response(
+            request, export_stream(fmt, start, end, patient_ids, gzip=gzip),
+            content_type="application/gzip" if gzip else EXPORT_FORMATS[fmt],
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+# ---------- IMPORTS ----------
+class ClinicImportView(APIView):
+    """
+    Admin-only bulk onboarding. multipart files `users`, `assignments`, `schedules`
+    (any subset; columns in imports.py), ?dry_run=1 to only validate.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        files = {
+            name: io.TextIOWrapper(request.FILES[name].file, encoding="utf-8-sig", newline="")
+            for name in ("users", "assignments", "schedules") if name in request.FILES
+        }
+        if not files:
+            return Response({"detail": "upload at least one of users, assignments, schedules"}, status=400)
+
+        report = import_clinic(
+            **files,
+            dry_run=request.query_params.get("dry_run") in ("1", "true"),
+            workers=settings.CLINIC_IMPORT_HASH_WORKERS,
+        )
+        if not report["ok"]:
+            return Response({"detail": "import rejected, nothing was saved", **report}, status=400)
+        if report["dry_run"]:
+            return Response({"message": "Import validated successfully ✅", **report})
+        return Response({"message": "Clinic imported successfully ✅", **report}, status=201)
+
+
+# ---------- METRICS ----------
+class MetricsView(APIView):
+    """Per-view request metrics in Prometheus text format (admin only)."""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(collect_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,16 @@
+import re
+
+_BP = re.compile(r"\s*(\d{2,3})\s*/\s*(\d{2,3})\s*(?:mm\s*hg)?\s*", re.IGNORECASE)
+SYSTOLIC_RANGE = (50, 300)
+DIASTOLIC_RANGE = (20, 200)
+
+
+def parse_blood_pressure(text):
+    """'120/80' -> (120, 80); None for blank, malformed or implausible readings."""
+    match = _BP.fullmatch(text or "")
+    if not match:
+        return None
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if not (SYSTOLIC_RANGE[0] <= systolic <= SYSTOLIC_RANGE[1] and DIASTOLIC_RANGE[0] <= diastolic <= DIASTOLIC_RANGE[1]):
+        return None
+    return systolic, diastolic
@@ -48,20 +48,29 @@ ROOT_URLCONF = "MedProject.urls"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # role/user/profile ids come from token claims, no user query per request
+        "Adherence_tracker.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "EXCEPTION_HANDLER": "MedProject.exceptions.custom_exception_handler",
+    "DEFAULT_PAGINATION_CLASS": "Adherence_tracker.pagination.DefaultCursorPagination",
 }
 
 SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=1),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
+    "TOKEN_OBTAIN_SERIALIZER": "Adherence_tracker.authentication.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "Adherence_tracker.authentication.ClaimsTokenRefreshSerializer",
 }
+# In-memory revocation set (Adherence_tracker/revocation.py): how often each process
+# checks the revocation version (the shared cache's counter, or with a per-process
+# cache the newest blacklist row), and the longest it keeps a set without rebuilding
+REVOCATION_POLL_SECONDS = config("REVOCATION_POLL_SECONDS", default=5, cast=float)
+REVOCATION_REBUILD_SECONDS = config("REVOCATION_REBUILD_SECONDS", default=300, cast=float)
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "Hypertension Medication Adherence Tracker API",
@@ -75,11 +84,67 @@ DATABASES = {
     )
 }
 
+# Any Django cache backend works, e.g. CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# with CACHE_LOCATION=/var/tmp/med-cache, or backends.db.DatabaseCache after `manage.py createcachetable`.
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="med-adherence"),
+    }
+}
+# seconds a doctor's assigned-patient id set stays cached (also invalidated on change).
+# Only used with a backend all workers share: with the per-process LocMemCache the
+# set is read once per request, since other workers would miss an unassignment.
+ASSIGNMENT_CACHE_TTL = config("ASSIGNMENT_CACHE_TTL", default=300, cast=int)
+# seconds a patient's adherence summary stays cached (also invalidated when the data changes)
+ADHERENCE_SUMMARY_CACHE_TTL = config("ADHERENCE_SUMMARY_CACHE_TTL", default=60, cast=int)
+
+# Background jobs (`manage.py run_jobs`) and notification delivery
+NOTIFICATION_DELIVERY_BACKEND = config(
+    "NOTIFICATION_DELIVERY_BACKEND", default="Adherence_tracker.delivery.ConsoleDeliveryBackend"
+)
+NOTIFICATION_FILE_PATH = config("NOTIFICATION_FILE_PATH", default=str(BASE_DIR / "notifications.log"))
+JOB_RETRY_BASE_SECONDS = config("JOB_RETRY_BASE_SECONDS", default=30, cast=int)
+JOB_LEASE_SECONDS = config("JOB_LEASE_SECONDS", default=300, cast=int)
+
+# Alerts raised as activities come in (see Adherence_tracker/alerts.py for rule kinds)
+ADHERENCE_ALERT_RULES = [
+    {
+        "name": "low-adherence-7d", "kind": "rate_below", "days": 7, "threshold": 70, "min_doses": 3,
+        "notify": ["patient", "doctors"], "cooldown_hours": 24,
+        "message": "Adherence over the last {days} days dropped to {rate:.0f}%",
+    },
+    {
+        "name": "consecutive-missed", "kind": "consecutive_missed", "count": 2,
+        "notify": ["patient", "doctors"], "cooldown_hours": 12,
+        "message": "{count} doses missed in a row",
+    },
+]
+
+# Missed-dose sweep (`manage.py sweep_missed_doses`)
+MISSED_DOSE_LOOKBACK_DAYS = config("MISSED_DOSE_LOOKBACK_DAYS", default=7, cast=int)
+SWEEP_LEASE_SECONDS = config("SWEEP_LEASE_SECONDS", default=1800, cast=int)
+
+# Request metrics (served at /api/_metrics/). Under gunicorn set METRICS_DIR to a
+# directory shared by the workers and empty it on each deploy.
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+METRICS_DIR = config("METRICS_DIR", default="")
+METRICS_FLUSH_SECONDS = config("METRICS_FLUSH_SECONDS", default=5, cast=float)
+METRICS_SLOW_REQUEST_SECONDS = config("METRICS_SLOW_REQUEST_SECONDS", default=1.0, cast=float)
+METRICS_QUERY_WARN = config("METRICS_QUERY_WARN", default=20, cast=int)
+
+# Render high-volume lists (activities, notifications, history) from .values() rows
+FAST_READ_SERIALIZERS = config("FAST_READ_SERIALIZERS", default=True, cast=bool)
+
+# Clinic CSV import: processes hashing passwords for the admin endpoint (0 = in the request worker)
+CLINIC_IMPORT_HASH_WORKERS = config("CLINIC_IMPORT_HASH_WORKERS", default=0, cast=int)
+
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MIDDLEWARE = [
+    "Adherence_tracker.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "Adherence_tracker.middleware.AsyncWhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.http import HttpResponse
 
 def home(request):
@@ -13,8 +12,4 @@ urlpatterns = [
     # All API routes from your app
     path("api/", include("Adherence_tracker.urls")),
     path('', home),
-
-    # Auth endpoints
-    path("api/auth/login/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("api/auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 ]